@@ -0,0 +1,215 @@
+# batch_ocr.py - Headless batch mode for the Gemini Desktop Assistant
+#
+# Usage: python batch_ocr.py <directory or glob> [...] [-o results.jsonl] [options]
+#
+# OCRs every image it finds and asks Gemini about the extracted text, with the
+# same perform_ocr and call_generative_ai_api the desktop app uses. They come
+# from gemini_core, so neither this script nor its OCR workers import PyQt6.
+# OCR runs in a process pool and API calls run with a bounded number in
+# flight, so both the CPU and the network stay busy. Each result is appended
+# to the JSONL output as soon as it finishes; running the same command again
+# skips images that already have an answer there.
+
+import os
+import sys
+import glob
+import json
+import time
+import asyncio
+import argparse
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import gemini_core as core
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".gif", ".tif", ".tiff", ".webp")
+DEFAULT_OCR_WORKERS = os.cpu_count() or 1
+DEFAULT_CONCURRENCY = 8  # API requests in flight
+PROGRESS_EVERY = 25  # Print a progress line every this many finished images
+
+
+def iter_images(inputs, recursive=False):
+    """Yield image paths from directories and glob patterns lazily, each once"""
+    seen = set()
+    for pattern in inputs:
+        if os.path.isdir(pattern):
+            if recursive:
+                candidates = (os.path.join(root, name)
+                              for root, _, names in os.walk(pattern) for name in sorted(names))
+            else:
+                candidates = (entry.path for entry in sorted(os.scandir(pattern), key=lambda e: e.name)
+                              if entry.is_file())
+        else:
+            candidates = glob.iglob(pattern, recursive=recursive)
+        for path in candidates:
+            path = os.path.abspath(path)
+            if path.lower().endswith(IMAGE_EXTENSIONS) and path not in seen:
+                seen.add(path)
+                yield path
+
+
+def load_finished(output_path):
+    """Paths that already have an answer in output_path; failed images are retried"""
+    finished = set()
+    if not os.path.exists(output_path):
+        return finished
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # Line cut short by an interrupted run
+            if "answer" in record:
+                finished.add(record["path"])
+    return finished
+
+
+def _init_batch_worker():
+    core._init_ocr_worker()
+    # The pool already spreads images across cores; don't tile inside a worker
+    core.OCR_TILED = False
+
+
+def ocr_file(path):
+    """OCR one image file in a worker process; returns the text, or None on failure"""
+    try:
+        with core.Image.open(path) as image:
+            image = image.convert("RGB")
+    except Exception as e:
+        print(f"Could not open {path}: {e}")
+        return None
+    return core.perform_ocr(core.preprocess_image(image))
+
+
+class BatchRunner:
+    """Streams images through an OCR process pool and a bounded set of API calls"""
+
+    def __init__(self, output_path, ocr_func=ocr_file, ocr_workers=DEFAULT_OCR_WORKERS,
+                 concurrency=DEFAULT_CONCURRENCY, progress_every=PROGRESS_EVERY):
+        self.output_path = output_path
+        self.ocr_func = ocr_func
+        self.ocr_workers = max(1, ocr_workers)
+        self.concurrency = max(1, concurrency)
+        self.progress_every = progress_every
+        self.stats = Counter()
+        self.started = None
+
+    def rate(self):
+        elapsed = time.perf_counter() - self.started
+        return self.stats["done"] / elapsed if elapsed > 0 else 0.0
+
+    async def _process(self, path, loop, ocr_pool, api_pool, api_slots, out):
+        record = {"path": path}
+        started = time.perf_counter()
+        text = await loop.run_in_executor(ocr_pool, self.ocr_func, path)
+        record["ocr_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        if text is None:
+            record["error"] = "OCR failed"
+        elif not text.strip():
+            record["error"] = "No text detected"
+        else:
+            record["text"] = text.strip()
+            async with api_slots:
+                started = time.perf_counter()
+                answer = await loop.run_in_executor(api_pool, core.call_generative_ai_api, record["text"])
+                record["api_ms"] = round((time.perf_counter() - started) * 1000, 1)
+            if core.is_error_response(answer):
+                record["error"] = answer
+            else:
+                record["answer"] = answer
+
+        # Written from the event loop thread only, one complete line per image
+        out.write(json.dumps(record, ensure_ascii=False) + "\n")
+        out.flush()
+        self.stats["done"] += 1
+        self.stats["failed" if "error" in record else "answered"] += 1
+        if self.progress_every and self.stats["done"] % self.progress_every == 0:
+            print(f"[batch] {self.stats['done']} images, {self.rate():.2f} images/sec", file=sys.stderr)
+
+    async def run(self, paths):
+        """Process every path not already answered in the output; returns the stats Counter"""
+        finished = load_finished(self.output_path)
+        loop = asyncio.get_running_loop()
+        api_slots = asyncio.Semaphore(self.concurrency)
+        # Caps how far the directory scan runs ahead of OCR, so huge folders stream in
+        window = asyncio.Semaphore(self.ocr_workers * 2 + self.concurrency)
+        tasks = set()
+        self.started = time.perf_counter()
+
+        async def guarded(path):
+            try:
+                await self._process(path, loop, ocr_pool, api_pool, api_slots, out)
+            except Exception as e:
+                print(f"Error processing {path}: {e}")
+                self.stats["done"] += 1
+                self.stats["failed"] += 1
+            finally:
+                window.release()
+
+        with ProcessPoolExecutor(max_workers=self.ocr_workers, initializer=_init_batch_worker) as ocr_pool, \
+                ThreadPoolExecutor(max_workers=self.concurrency) as api_pool, \
+                open(self.output_path, "a", encoding="utf-8") as out:
+            for path in paths:
+                if path in finished:
+                    self.stats["skipped"] += 1
+                    continue
+                await window.acquire()
+                task = asyncio.create_task(guarded(path))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks)
+        self.stats["seconds"] = time.perf_counter() - self.started
+        return self.stats
+
+
+def use_client(base_url=None, concurrency=DEFAULT_CONCURRENCY, rate_per_minute=core.RATE_LIMIT_PER_MINUTE, **options):
+    """Install a GeminiClient sized for the batch as the shared client"""
+    client = core.GeminiClient(base_url=base_url or core.GEMINI_API_BASE_URL, pool_size=concurrency,
+                              max_concurrent=concurrency, rate_per_minute=rate_per_minute, **options)
+    with core._gemini_client_lock:
+        core._gemini_client = client
+    return client
+
+
+def run_batch(paths, output_path, **options):
+    """Synchronous wrapper around BatchRunner.run"""
+    return asyncio.run(BatchRunner(output_path, **options).run(paths))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OCR a batch of images and ask Gemini about each one")
+    parser.add_argument("inputs", nargs="+", help="Image directories or glob patterns")
+    parser.add_argument("-o", "--output", default="results.jsonl", help="JSONL file results are appended to")
+    parser.add_argument("-r", "--recursive", action="store_true", help="Descend into subdirectories (and ** in globs)")
+    parser.add_argument("--ocr-workers", type=int, default=DEFAULT_OCR_WORKERS, help="OCR processes")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="API requests in flight")
+    parser.add_argument("--rpm", type=int, default=core.RATE_LIMIT_PER_MINUTE,
+                        help="Requests per minute allowed by your quota; 0 disables the limit")
+    parser.add_argument("--api-url", default=None, help="generateContent endpoint (defaults to GEMINI_API_BASE_URL)")
+    parser.add_argument("--no-preprocess", action="store_true", help="OCR the images as they are")
+    args = parser.parse_args()
+
+    if not core.API_KEY:
+        print("Error: GEMINI_API_KEY is not set.")
+        sys.exit(1)
+    if args.no_preprocess:
+        # Read by the worker processes through the environment on spawn-based platforms
+        os.environ["OCR_PREPROCESS"] = "0"
+        core.OCR_PREPROCESS = False
+
+    client = use_client(args.api_url, args.concurrency, args.rpm)
+    try:
+        stats = run_batch(iter_images(args.inputs, args.recursive), args.output,
+                          ocr_workers=args.ocr_workers, concurrency=args.concurrency)
+    finally:
+        client.close()
+
+    rate = stats["done"] / stats["seconds"] if stats["seconds"] else 0.0
+    print(f"Processed {stats['done']} images in {stats['seconds']:.1f}s ({rate:.2f} images/sec): "
+          f"{stats['answered']} answered, {stats['failed']} failed, {stats['skipped']} already done")
+    print(f"Results: {os.path.abspath(args.output)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,2218 @@
+# benchmark.py - Performance benchmarks for the Gemini Desktop Assistant
+#
+# Usage: python benchmark.py <benchmark> [options]
+# Runs headless (Qt offscreen platform) so it works without a desktop session.
+
+import os
+import sys
+import time
+import io
+import json
+import ssl
+import struct
+import shutil
+import hashlib
+import tempfile
+import difflib
+import argparse
+import threading
+import subprocess
+import gc
+import random
+import functools
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+# Headless defaults; an explicit environment setting always wins
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+if sys.platform.startswith("linux") and not os.environ.get("DISPLAY"):
+    os.environ.setdefault("PYNPUT_BACKEND", "dummy")
+
+from PIL import Image, ImageDraw, ImageFont
+from PyQt6.QtCore import QTimer, QPointF, QRect, QEvent, Qt
+from PyQt6.QtGui import QImage, QPixmap, QColor, QMouseEvent
+from PyQt6.QtWidgets import QApplication
+
+import gemini_core as core_module
+import gemini_desktop_app as app_module
+import instance_control
+import batch_ocr
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def report(title, rows):
+    print("\n" + "=" * 50)
+    print(title)
+    print("=" * 50)
+    for label, value in rows:
+        print(f"  {label:<40} {value}")
+
+
+def report_checks(checks):
+    """Print PASS/FAIL for each (label, passed) check and exit non-zero if any failed"""
+    report("Checks", [(label, "PASS" if passed else "FAIL") for label, passed in checks])
+    if not all(passed for _, passed in checks):
+        sys.exit(1)
+
+
+def get_app():
+    return QApplication.instance() or QApplication(sys.argv)
+
+
+# --- Synthetic screenshots ---
+SAMPLE_WORDS = ("error", "warning", "the", "process", "could", "not", "open", "file", "network",
+                "timeout", "settings", "update", "install", "failed", "retry", "connection")
+
+
+def sample_lines(count, words_per_line=8, seed=0):
+    """Deterministic pseudo-random lines of dictionary words"""
+    lines = []
+    state = seed
+    for _ in range(count):
+        words = []
+        for _ in range(words_per_line):
+            state = (state * 1103515245 + 12345) & 0x7fffffff
+            words.append(SAMPLE_WORDS[(state >> 16) % len(SAMPLE_WORDS)])
+        lines.append(" ".join(words))
+    return lines
+
+
+def render_text_image(lines, font_size=18, width=None, foreground=(0, 0, 0), background=(255, 255, 255)):
+    """Render lines of text into a PIL RGB image that looks like a UI text pane"""
+    font = ImageFont.load_default(size=font_size)
+    line_height = int(font_size * 1.5)
+    if width is None:
+        width = max(int(font.getlength(line)) for line in lines) + 40
+    image = Image.new("RGB", (width, line_height * len(lines) + 40), background)
+    draw = ImageDraw.Draw(image)
+    for index, line in enumerate(lines):
+        draw.text((20, 20 + index * line_height), line, fill=foreground, font=font)
+    return image
+
+
+def render_diagram(width=900, height=600, labels=("Client", "Gateway", "Cache", "Service", "Database")):
+    """Boxes joined by arrows, with one short label each: little text for its area"""
+    image = Image.new("RGB", (width, height), (250, 250, 250))
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.load_default(size=18)
+    boxes = [(50 + (index % 3) * 300, 60 + (index // 3) * 300) for index in range(len(labels))]
+    for (x, y), (next_x, next_y) in zip(boxes, boxes[1:]):
+        draw.line((x + 90, y + 45, next_x + 90, next_y + 45), fill=(40, 40, 40), width=3)
+    for (x, y), label in zip(boxes, labels):
+        draw.rectangle((x, y, x + 180, y + 90), fill=(200, 220, 255), outline=(20, 60, 140), width=3)
+        draw.text((x + 30, y + 35), label, fill=(0, 0, 0), font=font)
+    return image
+
+
+def render_photo(width=900, height=600, seed=0):
+    """Smooth colour gradients plus noise, like a photo or video frame"""
+    rng = random.Random(seed)
+    noise = Image.effect_noise((width, height), 40).convert("RGB")
+    gradient = Image.linear_gradient("L").resize((width, height))
+    tint = Image.merge("RGB", (gradient, gradient.rotate(90), gradient.transpose(Image.Transpose.FLIP_LEFT_RIGHT)))
+    return Image.blend(tint, noise, 0.3 + rng.random() * 0.1)
+
+
+def pil_to_qimage(image):
+    image = image.convert("RGB")
+    data = image.tobytes()
+    return QImage(data, image.width, image.height, image.width * 3, QImage.Format.Format_RGB888).copy()
+
+
+def tesseract_available():
+    """True if OCR can run for real: through a resident engine, or pytesseract and the tesseract binary"""
+    if core_module.get_ocr_engine().api is not None:
+        return True
+    try:
+        import pytesseract
+        if os.path.exists(core_module.TESSERACT_CMD):
+            pytesseract.pytesseract.tesseract_cmd = core_module.TESSERACT_CMD
+        pytesseract.get_tesseract_version()
+        return True
+    except Exception as e:
+        print(f"Tesseract is not available, skipping OCR benchmark: {e}")
+        return False
+
+
+# --- Local stub Gemini server ---
+def make_self_signed_cert(directory):
+    """Create a localhost certificate with openssl; returns (cert_path, key_path)"""
+    cert_path = os.path.join(directory, "stub_cert.pem")
+    key_path = os.path.join(directory, "stub_key.pem")
+    subprocess.run([
+        "openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+        "-keyout", key_path, "-out", cert_path, "-subj", "/CN=localhost",
+        "-addext", "subjectAltName=DNS:localhost,IP:127.0.0.1",
+        "-addext", "basicConstraints=critical,CA:TRUE",
+    ], check=True, capture_output=True)
+    return cert_path, key_path
+
+
+class StubGeminiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, like the real API
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        self.send_response(404)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_POST(self):
+        stub = self.server.stub
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        stub.record(payload)
+        tokens = stub.input_tokens(payload)
+        cached = stub.cached_prefix_tokens(payload)
+        billed = tokens - cached + cached * stub.cached_token_cost
+        time.sleep(stub.latency + stub.latency_per_kb * length / 1024 + stub.latency_per_token * billed)
+        usage = {"promptTokenCount": tokens, "cachedContentTokenCount": cached}
+        if stub.max_input_tokens is not None and tokens > stub.max_input_tokens:
+            with stub.lock:
+                stub.statuses[400] += 1
+            self.send_json(400, {"error": {"code": 400, "status": "INVALID_ARGUMENT", "message":
+                                           f"The input token count ({tokens}) exceeds the maximum number "
+                                           f"of tokens allowed ({stub.max_input_tokens})."}})
+            return
+        fault = stub.fault()
+        if fault:
+            status, headers = fault
+            self.send_json(status, {"error": {"code": status, "message": "injected by stub"}}, headers)
+            return
+        if ":streamGenerateContent" in self.path:
+            self.send_stream(stub, usage)
+            return
+        # Non-streaming requests still pay the full generation time
+        time.sleep(stub.chunk_delay * len(stub.chunks()))
+        self.send_json(200, {"candidates": [{"content": {"parts": [{"text": stub.answer}]}}], "usageMetadata": usage})
+
+    def send_json(self, status, data, headers=None):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_stream(self, stub, usage):
+        """Emit the answer as chunked server-sent events, one chunk every chunk_delay; usage comes with the last"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            chunks = stub.chunks()
+            for index, text in enumerate(chunks):
+                if index:
+                    time.sleep(stub.chunk_delay)
+                event = {"candidates": [{"content": {"parts": [{"text": text}]}}]}
+                if index == len(chunks) - 1:
+                    event["usageMetadata"] = usage
+                event = json.dumps(event)
+                data = f"data: {event}\r\n\r\n".encode("utf-8")
+                self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # Client cancelled the stream
+            self.close_connection = True
+
+
+class StubGeminiServer:
+    """Threaded local server that answers generateContent requests.
+
+    latency_per_kb adds time in proportion to the request body, like an
+    upload over a slow link, and latency_per_token in proportion to the
+    prompt's tokens; prompts over max_input_tokens are rejected with a 400
+    like the real API's. With prefix_cache, a request that starts with the
+    same system instruction and contents as an earlier one is served that
+    prefix from cache, like Gemini's implicit caching: those tokens cost
+    cached_token_cost of the usual time and are reported in usageMetadata.
+    Can inject failures: a random error_rate of error_status responses, 429s
+    with Retry-After beyond quota requests per quota_window seconds, and 503s
+    for the whole outage=(start, end) window, in seconds after start().
+    script lists the statuses of the first requests in order, e.g. (503, 429).
+    """
+
+    def __init__(self, latency=0.0, answer="stub answer", tls=False, chunk_count=1, chunk_delay=0.0,
+                 error_rate=0.0, error_status=503, quota=None, quota_window=1.0, outage=None, seed=0,
+                 latency_per_kb=0.0, latency_per_token=0.0, max_input_tokens=None, prefix_cache=False,
+                 cached_token_cost=0.25, script=()):
+        self.latency = latency
+        self.latency_per_kb = latency_per_kb
+        self.latency_per_token = latency_per_token
+        self.max_input_tokens = max_input_tokens
+        self.prefix_cache = OrderedDict() if prefix_cache else None  # Digest of a request prefix -> its tokens
+        self.cached_token_cost = cached_token_cost
+        self.answer = answer
+        self.chunk_count = chunk_count
+        self.chunk_delay = chunk_delay
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.quota = quota
+        self.quota_window = quota_window
+        self.outage = outage
+        self.script = deque(script)
+        self.random = random.Random(seed)
+        self.accepted = deque()  # Times of requests counted against the quota
+        self.statuses = Counter()
+        self.started = time.monotonic()
+        self.requests = []
+        self.lock = threading.Lock()
+        self.cert_dir = None
+        self.cert_path = None
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), StubGeminiHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.stub = self
+        if tls:
+            self.cert_dir = tempfile.mkdtemp(prefix="gemini_stub_")
+            self.cert_path, key_path = make_self_signed_cert(self.cert_dir)
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(self.cert_path, key_path)
+            self.httpd.socket = context.wrap_socket(self.httpd.socket, server_side=True)
+        scheme = "https" if tls else "http"
+        host = "localhost" if tls else "127.0.0.1"
+        self.url = f"{scheme}://{host}:{self.httpd.server_address[1]}/v1beta/models/stub:generateContent"
+
+    def chunks(self):
+        """Split the answer into chunk_count roughly equal pieces"""
+        count = max(1, min(self.chunk_count, len(self.answer)))
+        size = -(-len(self.answer) // count)
+        return [self.answer[i:i + size] for i in range(0, len(self.answer), size)] or [""]
+
+    @staticmethod
+    def content_tokens(content):
+        return sum(core_module.estimate_tokens(part.get("text", "")) for part in content.get("parts", []))
+
+    @staticmethod
+    def input_tokens(payload):
+        """Estimated tokens in the text parts of a request, system instruction included"""
+        return sum(StubGeminiServer.content_tokens(content)
+                   for content in [payload.get("systemInstruction", {})] + payload.get("contents", []))
+
+    def cached_prefix_tokens(self, payload):
+        """Tokens of the longest prefix of payload seen in an earlier request, remembering this one's prefixes"""
+        if self.prefix_cache is None:
+            return 0
+        digest = hashlib.sha256()
+        cached = tokens = 0
+        with self.lock:
+            for content in [payload.get("systemInstruction", {})] + payload.get("contents", []):
+                digest.update(json.dumps(content, sort_keys=True).encode("utf-8"))
+                tokens += self.content_tokens(content)
+                key = digest.copy().hexdigest()
+                if key in self.prefix_cache:
+                    self.prefix_cache.move_to_end(key)
+                    cached = tokens
+                else:
+                    self.prefix_cache[key] = tokens
+            while len(self.prefix_cache) > 4096:
+                self.prefix_cache.popitem(last=False)
+        return cached
+
+    def record(self, payload):
+        with self.lock:
+            self.requests.append(payload)
+
+    def fault(self):
+        """(status, headers) of the failure to inject for this request, or None to answer normally"""
+        with self.lock:
+            now = time.monotonic()
+            result = None
+            if self.script:
+                status = self.script.popleft()
+                result = (status, {"Retry-After": "0"} if status == 429 else {}) if status != 200 else None
+            elif self.outage and self.outage[0] <= now - self.started < self.outage[1]:
+                result = (503, {})
+            elif self.quota is not None:
+                while self.accepted and now - self.accepted[0] >= self.quota_window:
+                    self.accepted.popleft()
+                if len(self.accepted) >= self.quota:
+                    retry_after = self.quota_window - (now - self.accepted[0])
+                    result = (429, {"Retry-After": f"{max(1, round(retry_after))}"})
+                else:
+                    self.accepted.append(now)
+            if result is None and self.error_rate and self.random.random() < self.error_rate:
+                result = (self.error_status, {})
+            self.statuses[result[0] if result else 200] += 1
+            return result
+
+    def start(self):
+        self.started = time.monotonic()
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self.cert_dir:
+            shutil.rmtree(self.cert_dir, ignore_errors=True)
+
+
+# --- GUI latency while the pipeline is busy ---
+def bench_gui_latency(args):
+    """Measure GUI event-loop lateness while slow stub OCR/API calls run in the pipeline"""
+    qt_app = get_app()
+
+    counter = iter(range(1, 1 << 30))
+
+    def stub_ocr(image_path, with_confidence=False):
+        time.sleep(args.ocr_delay)
+        # Distinct text per capture, otherwise identical prompts share one API call
+        text = f"stub text {next(counter)}"
+        return (text, 95.0) if with_confidence else text
+
+    def stub_api(prompt, cancel_token=None, image=None, session=None):
+        time.sleep(args.api_delay)
+        return "stub answer"
+
+    app_module.perform_ocr = stub_ocr
+    app_module.call_generative_ai_api = stub_api
+
+    # FIFO so every capture runs to completion instead of superseding the previous one;
+    # forced OCR because the blank test image would otherwise be sent as a picture
+    pipeline = app_module.CapturePipeline(streaming=False, policy="fifo", router=core_module.CaptureRouter(mode="ocr"))
+    image = QImage(400, 200, QImage.Format.Format_RGB32)
+    image.fill(QColor(255, 255, 255))
+
+    lateness = []
+    results = []
+    interval_ms = 5
+    state = {"last": time.perf_counter()}
+
+    def on_tick():
+        now = time.perf_counter()
+        lateness.append(max(0.0, (now - state["last"]) * 1000 - interval_ms))
+        state["last"] = now
+
+    ticker = QTimer()
+    ticker.setInterval(interval_ms)
+    ticker.timeout.connect(on_tick)
+    pipeline.resultReady.connect(lambda capture_id, question, answer, cached: results.append(answer))
+
+    def submit_all():
+        for _ in range(args.captures):
+            while pipeline.submit(image) is None:
+                qt_app.processEvents()
+                time.sleep(0.001)
+
+    started = time.perf_counter()
+    ticker.start()
+    QTimer.singleShot(0, submit_all)
+    while len(results) < args.captures:
+        qt_app.processEvents()
+        time.sleep(0.0005)
+    elapsed = time.perf_counter() - started
+    ticker.stop()
+    pipeline.stop()
+
+    report("GUI latency with slow stub API", [
+        ("captures", args.captures),
+        ("stub API delay (s)", args.api_delay),
+        ("total wall time (s)", f"{elapsed:.2f}"),
+        ("serial wall time (s)", f"{args.captures * (args.ocr_delay + args.api_delay):.2f}"),
+        ("event lateness p50 (ms)", f"{percentile(lateness, 50):.2f}"),
+        ("event lateness p99 (ms)", f"{percentile(lateness, 99):.2f}"),
+        ("event lateness max (ms)", f"{max(lateness or [0]):.2f}"),
+    ])
+    report_checks([("every capture answered", not any(core_module.is_error_response(answer) for answer in results))])
+
+
+# --- Cold vs pooled HTTP client ---
+def bench_http_client(args):
+    """Compare a fresh connection per request against the pooled GeminiClient over TLS"""
+    server = StubGeminiServer(latency=args.latency, tls=True).start()
+    payload = {"contents": [{"parts": [{"text": "benchmark prompt"}]}]}
+    try:
+        cold = []
+        for _ in range(args.requests):
+            started = time.perf_counter()
+            response = requests.post(server.url, params={"key": "bench"}, json=payload,
+                                     timeout=10, verify=server.cert_path)
+            response.raise_for_status()
+            cold.append((time.perf_counter() - started) * 1000)
+
+        client = core_module.GeminiClient(api_key="bench", base_url=server.url, verify=server.cert_path, rate_per_minute=0)
+        warm_up_started = time.perf_counter()
+        client.warm_up()
+        warm_up_ms = (time.perf_counter() - warm_up_started) * 1000
+        warm = []
+        for _ in range(args.requests):
+            started = time.perf_counter()
+            client.post_json(payload)
+            warm.append((time.perf_counter() - started) * 1000)
+        client.close()
+    finally:
+        server.stop()
+
+    report("Per-request latency, local TLS stub", [
+        ("requests per mode", args.requests),
+        ("stub server latency (ms)", args.latency * 1000),
+        ("cold p50 / p95 (ms)", f"{percentile(cold, 50):.2f} / {percentile(cold, 95):.2f}"),
+        ("warm-up (ms)", f"{warm_up_ms:.2f}"),
+        ("pooled p50 / p95 (ms)", f"{percentile(warm, 50):.2f} / {percentile(warm, 95):.2f}"),
+    ])
+
+
+# --- Streaming vs buffered answers ---
+def bench_streaming(args):
+    """Report time-to-first-chunk and total latency for streamed vs buffered answers"""
+    answer = " ".join(f"word{i}" for i in range(args.chunks * 8))
+    server = StubGeminiServer(latency=args.latency, answer=answer,
+                              chunk_count=args.chunks, chunk_delay=args.chunk_delay).start()
+    core_module.API_KEY = core_module.API_KEY or "bench"
+    core_module._gemini_client = core_module.GeminiClient(api_key="bench", base_url=server.url, rate_per_minute=0)
+    core_module._gemini_client.warm_up()
+    try:
+        buffered = []
+        for _ in range(args.requests):
+            started = time.perf_counter()
+            app_module.call_generative_ai_api("benchmark prompt")
+            buffered.append((time.perf_counter() - started) * 1000)
+
+        first_chunk, streamed = [], []
+        for _ in range(args.requests):
+            started = time.perf_counter()
+            marks = []
+            core_module.stream_generative_ai_api(
+                "benchmark prompt", lambda text: marks.append(time.perf_counter()))
+            streamed.append((time.perf_counter() - started) * 1000)
+            first_chunk.append((marks[0] - started) * 1000)
+
+        # Cancel right after the first chunk and time how quickly the call returns
+        cancel_latency = []
+        for _ in range(args.requests):
+            token = core_module.CancelToken()
+            marks = {}
+
+            def on_chunk(text):
+                if "cancel" not in marks:
+                    marks["cancel"] = time.perf_counter()
+                    threading.Timer(0, token.cancel).start()
+
+            core_module.stream_generative_ai_api("benchmark prompt", on_chunk, token)
+            cancel_latency.append((time.perf_counter() - marks["cancel"]) * 1000)
+
+        # Streams cancelled mid-body alongside complete calls, more than the pool has connections:
+        # a connection pooled with unread body left would corrupt a later answer
+        reference = app_module.call_generative_ai_api("benchmark prompt")
+
+        def cancelled_stream(_):
+            token = core_module.CancelToken()
+            core_module.stream_generative_ai_api(
+                "benchmark prompt", lambda text: threading.Timer(0, token.cancel).start(), token)
+
+        def complete_call(index):
+            if index % 2:
+                return app_module.call_generative_ai_api("benchmark prompt")
+            return core_module.stream_generative_ai_api("benchmark prompt", lambda text: None)
+
+        with ThreadPoolExecutor(max_workers=core_module.HTTP_POOL_SIZE * 2) as pool:
+            jobs = [pool.submit(cancelled_stream if index % 3 else complete_call, index)
+                    for index in range(args.requests * 3)]
+            mixed = [job.result() for job in jobs]
+        after = [complete_call(index) for index in range(core_module.HTTP_POOL_SIZE * 2)]
+        complete = [answer for answer in mixed if answer is not None] + after
+        stale = core_module._gemini_client.metrics_snapshot()["stale_connections"]
+    finally:
+        core_module._gemini_client.close()
+        core_module._gemini_client = None
+        server.stop()
+
+    report("Streaming vs buffered, local SSE stub", [
+        ("requests per mode", args.requests),
+        ("chunks x delay (ms)", f"{args.chunks} x {args.chunk_delay * 1000:.0f}"),
+        ("buffered total p50 (ms)", f"{percentile(buffered, 50):.1f}"),
+        ("streamed first chunk p50 (ms)", f"{percentile(first_chunk, 50):.1f}"),
+        ("streamed total p50 (ms)", f"{percentile(streamed, 50):.1f}"),
+        ("cancel -> return p50 (ms)", f"{percentile(cancel_latency, 50):.1f}"),
+    ])
+    report_checks([
+        ("cancel returns before the next chunk", max(cancel_latency) < args.chunk_delay * 1000),
+        (f"{len(complete)} answers around cancelled streams intact", all(answer == reference for answer in complete)),
+        ("no stale pooled connection", stale == 0),
+    ])
+
+
+# --- Response cache ---
+def bench_cache(args):
+    """Time cache misses, memory hits and disk hits for a batch of distinct prompts"""
+    work_dir = tempfile.mkdtemp(prefix="gemini_cache_")
+    try:
+        cache = app_module.ResponseCache(db_path=os.path.join(work_dir, "cache.db"),
+                                         memory_entries=args.prompts // 2)
+        prompts = [f"Error 0x{i:04x}:  The  operation\ncould not be COMPLETED" for i in range(args.prompts)]
+        answer = "stub answer " * 50
+
+        def timed(fn):
+            started = time.perf_counter()
+            fn()
+            return (time.perf_counter() - started) * 1000
+
+        miss = [timed(lambda: cache.get(cache.make_key(p))) for p in prompts]
+        store = [timed(lambda: cache.put(cache.make_key(p), answer)) for p in prompts]
+        # Most recent half is in memory, the oldest half only on disk
+        recent = prompts[args.prompts // 2:]
+        memory_hit = [timed(lambda: cache.get(cache.make_key(p.lower()))) for p in recent]
+        older = prompts[:args.prompts // 2]
+        disk_hit = [timed(lambda: cache.get(cache.make_key(" ".join(p.split())))) for p in older]
+        stats = cache.stats()
+        cache.close()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    report("Response cache latency", [
+        ("prompts", args.prompts),
+        ("miss p50 (ms)", f"{percentile(miss, 50):.3f}"),
+        ("store p50 (ms)", f"{percentile(store, 50):.3f}"),
+        ("memory hit p50 (ms)", f"{percentile(memory_hit, 50):.3f}"),
+        ("disk hit p50 (ms)", f"{percentile(disk_hit, 50):.3f}"),
+        ("counters", f"memory={stats['memory_hits']} disk={stats['disk_hits']} misses={stats['misses']}"),
+    ])
+
+
+# --- OCR: temp file + fresh process vs in-memory engine ---
+def bench_ocr(args):
+    """Per-capture OCR latency of the old PNG-on-disk path vs the in-memory engine"""
+    engine = core_module.get_ocr_engine()
+    if not tesseract_available():
+        return
+    try:
+        import pytesseract
+        if os.path.exists(core_module.TESSERACT_CMD):
+            pytesseract.pytesseract.tesseract_cmd = core_module.TESSERACT_CMD
+        pytesseract.get_tesseract_version()
+        binary = True
+    except Exception:
+        binary = False  # Only the resident engine can be measured
+    qimage = pil_to_qimage(render_text_image(sample_lines(args.lines)))
+
+    def old_path():
+        image_path = "temp_screenshot.png"
+        qimage.save(image_path)
+        text = pytesseract.image_to_string(image_path)
+        os.remove(image_path)
+        return text
+
+    def new_path():
+        return engine.image_to_string(app_module.qimage_to_pil(qimage))
+
+    results = {}
+    paths = [("file + pytesseract", old_path)] if binary else []
+    for label, fn in paths + [("in-memory engine", new_path)]:
+        fn()  # Warm caches so both paths are measured steady-state
+        samples = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            fn()
+            samples.append((time.perf_counter() - started) * 1000)
+        results[label] = samples
+
+    report("Per-capture OCR latency", [
+        ("engine", engine.name),
+        ("image size", f"{qimage.width()}x{qimage.height()}"),
+    ] + [(f"{label} p50 / p95 (ms)", f"{percentile(v, 50):.1f} / {percentile(v, 95):.1f}")
+         for label, v in results.items()])
+
+
+# --- Tiled OCR scaling ---
+def bench_tiled_ocr(args):
+    """Single-pass vs tiled OCR on a large synthetic text image, across worker counts"""
+    if not tesseract_available():
+        return
+    image = render_text_image(sample_lines(args.lines, words_per_line=40), width=args.width)
+    expected = set(" ".join(sample_lines(args.lines, words_per_line=40)).split())
+    engine = core_module.get_ocr_engine()
+
+    def word_recall(text):
+        found = set(text.split())
+        return len(expected & found) / len(expected)
+
+    started = time.perf_counter()
+    single_text = engine.image_to_string(image)
+    single = time.perf_counter() - started
+    rows = [
+        ("image size", f"{image.width}x{image.height}"),
+        ("single pass (s)", f"{single:.2f}  recall {word_recall(single_text):.1%}"),
+    ]
+
+    counts = {1, 2, 4, os.cpu_count() or 1}
+    if args.max_workers:
+        counts = {count for count in counts if count <= args.max_workers} | {args.max_workers}
+    for workers in sorted(counts):
+        core_module.shutdown_ocr_pool()
+        core_module.OCR_TILE_WORKERS = workers
+        # Start every worker process (and its engine) before timing
+        warm_tile = image.crop((0, 0, 200, 60))
+        list(core_module.get_ocr_pool().map(core_module._ocr_tile, [warm_tile] * workers))
+        started = time.perf_counter()
+        text = core_module.perform_tiled_ocr(image, workers)
+        elapsed = time.perf_counter() - started
+        bands = len(core_module.find_tile_bands(image, workers))
+        rows.append((f"tiled, {workers} workers, {bands} bands (s)",
+                     f"{elapsed:.2f}  x{single / elapsed:.2f}  recall {word_recall(text):.1%}"))
+    core_module.shutdown_ocr_pool()
+    report(f"Tiled OCR speedup ({os.cpu_count()} cores)", rows)
+
+
+# --- OCR preprocessing ---
+SYNTHETIC_THEMES = {
+    "light, 11px": dict(font_size=11, foreground=(0, 0, 0), background=(255, 255, 255)),
+    "dark, 14px": dict(font_size=14, foreground=(220, 220, 220), background=(30, 30, 30)),
+    "colored, 12px": dict(font_size=12, foreground=(20, 40, 160), background=(250, 230, 120)),
+    "large, 28px": dict(font_size=28, foreground=(40, 40, 40), background=(240, 240, 240)),
+}
+
+
+def bench_preprocess(args):
+    """Per-step preprocessing time, plus OCR time and character accuracy with and without it"""
+    if core_module.np is None:
+        print("numpy is not installed; preprocessing is unavailable")
+        return
+    preprocessor = core_module.ImagePreprocessor()
+    run_ocr = tesseract_available()
+    rows = []
+    for name, theme in SYNTHETIC_THEMES.items():
+        lines = sample_lines(args.lines, seed=len(name))
+        image = render_text_image(lines, width=1000, **theme)
+        truth = " ".join(lines)
+        processed, timings = preprocessor.process(image)
+        steps = " ".join(f"{step}={seconds * 1000:.0f}" for step, seconds in timings.items())
+        rows.append((f"{name} steps (ms)", f"{steps} -> {processed.width}x{processed.height}"))
+        if not run_ocr:
+            continue
+        for label, candidate in (("raw", image), ("preprocessed", processed)):
+            started = time.perf_counter()
+            text = core_module.get_ocr_engine().image_to_string(candidate)
+            elapsed = (time.perf_counter() - started) * 1000
+            accuracy = difflib.SequenceMatcher(None, truth, " ".join(text.split())).ratio()
+            rows.append((f"{name} {label} OCR", f"{elapsed:.0f} ms, char accuracy {accuracy:.1%}"))
+    report("OCR preprocessing on synthetic screenshots", rows)
+
+    # A window capture: a 1px border runs through every row and must not count as one tall text line
+    checks = []
+    pane = render_text_image(sample_lines(args.lines, seed=7), font_size=14, width=1200)
+    bordered = pane.copy()
+    ImageDraw.Draw(bordered).rectangle((0, 0, pane.width - 1, pane.height - 1), outline=(90, 90, 90))
+    gray = lambda image: core_module.np.asarray(image.convert("L"), dtype=core_module.np.float32)
+    plain_height = preprocessor.estimate_text_height(gray(pane))
+    bordered_height = preprocessor.estimate_text_height(gray(bordered))
+    checks.append((f"border ignored (text height {plain_height} vs {bordered_height})", plain_height == bordered_height))
+    checks.append(("bordered capture enlarged", preprocessor.process(bordered)[0].height > bordered.height))
+    # A panel filling half the capture is no text line to scale to
+    panel = pane.copy()
+    ImageDraw.Draw(panel).rectangle((0, 0, pane.width // 2, pane.height // 2), fill=(0, 0, 0))
+    ImageDraw.Draw(panel).rectangle((pane.width // 2, pane.height // 2, pane.width, pane.height), fill=(0, 0, 0))
+    checks.append(("implausible text height skips the rescale", preprocessor.process(panel)[0].size == panel.size))
+    # A full-screen selection of small text is enlarged only up to the pixel budget
+    screen = render_text_image(sample_lines(args.lines * 3, seed=8), font_size=12, width=1920).crop((0, 0, 1920, 1080))
+    started = time.perf_counter()
+    processed, _ = preprocessor.process(screen)
+    elapsed = (time.perf_counter() - started) * 1000
+    checks.append((f"1920x1080 -> {processed.width}x{processed.height} in {elapsed:.0f} ms within the pixel budget",
+                   screen.width < processed.width and processed.width * processed.height <= preprocessor.max_pixels))
+    report_checks(checks)
+
+
+# --- Selection window frame time ---
+class FullRepaintSelectionWindow(app_module.SelectionWindow):
+    """The previous behaviour: repaint the whole frozen frame on every mouse move"""
+
+    def mouseMoveEvent(self, event):
+        if self.selecting:
+            self.end = event.pos()
+            self.update()
+
+
+def mouse_event(kind, x, y, buttons=Qt.MouseButton.LeftButton):
+    position = QPointF(x, y)
+    button = Qt.MouseButton.NoButton if kind == QEvent.Type.MouseMove else Qt.MouseButton.LeftButton
+    return QMouseEvent(kind, position, position, button, buttons, Qt.KeyboardModifier.NoModifier)
+
+
+def bench_selection(args):
+    """Per-move frame time while dragging a rubber band, full vs dirty-region repaint"""
+    qt_app = get_app()
+    # The offscreen screen is small, so freeze a synthetic full-size desktop instead
+    desktop = QPixmap.fromImage(pil_to_qimage(
+        render_text_image(sample_lines(args.height // 27), width=args.width)).scaled(args.width, args.height))
+    rows = []
+    for label, window_class in (("full repaint", FullRepaintSelectionWindow),
+                                ("dirty region", app_module.SelectionWindow)):
+        window = window_class()
+        window.screenshot = desktop
+        window.resize(args.width, args.height)
+        qt_app.processEvents()
+        window.mousePressEvent(mouse_event(QEvent.Type.MouseButtonPress, 100, 100))
+        qt_app.processEvents()
+        frames = []
+        for step in range(args.moves):
+            started = time.perf_counter()
+            window.mouseMoveEvent(mouse_event(QEvent.Type.MouseMove, 100 + step * 3, 100 + step * 2))
+            qt_app.processEvents()  # Delivers the update request and paints it
+            frames.append((time.perf_counter() - started) * 1000)
+        window.close()
+        rows.append((f"{label} p50 / p95 (ms)", f"{percentile(frames, 50):.3f} / {percentile(frames, 95):.3f}"))
+    report(f"Selection window frame time ({args.width}x{args.height}, offscreen)", rows)
+
+
+# --- History soak ---
+def rss_mb():
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / 1e6
+    except ImportError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3
+
+
+def bench_history(args):
+    """Append many responses to the history view; per-append latency should stay flat"""
+    from PyQt6.QtWidgets import QTextEdit
+    qt_app = get_app()
+    answer = "This is a fairly typical answer from the model. " * 20
+
+    # The previous approach: scan the whole QTextEdit, then append to it
+    legacy = QTextEdit()
+    legacy.setReadOnly(True)
+    legacy.show()
+    legacy_times = []
+    for number in range(args.legacy_entries):
+        started = time.perf_counter()
+        if "AI responses will appear here..." in legacy.toPlainText():
+            legacy.clear()
+        legacy.append(f"Request #{number}\nQuestion: q\nAnswer: {answer}")
+        qt_app.processEvents()
+        legacy_times.append((time.perf_counter() - started) * 1000)
+    legacy.close()
+
+    assistant = app_module.MyAssistant()
+    assistant.show()
+    qt_app.processEvents()
+    rss_before = rss_mb()
+    times = []
+    for number in range(args.entries):
+        started = time.perf_counter()
+        assistant.add_response(f"Question {number}", answer)
+        qt_app.processEvents()
+        times.append((time.perf_counter() - started) * 1000)
+    rss_after = rss_mb()
+    assistant.close()
+
+    window = min(1000, args.entries // 2)
+    legacy_window = min(200, args.legacy_entries // 2)
+    report(f"History soak ({args.entries} appends, cap {app_module.HISTORY_MAX_ENTRIES})", [
+        (f"QTextEdit first {legacy_window} p50 (ms)", f"{percentile(legacy_times[:legacy_window], 50):.3f}"),
+        (f"QTextEdit last {legacy_window} p50 (ms)", f"{percentile(legacy_times[-legacy_window:], 50):.3f}"),
+        (f"list view first {window} p50 / p99 (ms)",
+         f"{percentile(times[:window], 50):.3f} / {percentile(times[:window], 99):.3f}"),
+        (f"list view last {window} p50 / p99 (ms)",
+         f"{percentile(times[-window:], 50):.3f} / {percentile(times[-window:], 99):.3f}"),
+        ("RSS before / after (MB)", f"{rss_before:.1f} / {rss_after:.1f}"),
+    ])
+
+
+# --- Persistent history store ---
+def bench_history_store(args):
+    """Insert throughput and search latency of the FTS5 history store"""
+    work_dir = tempfile.mkdtemp(prefix="gemini_history_")
+    try:
+        store = app_module.HistoryStore(db_path=os.path.join(work_dir, "history.db"))
+        questions = sample_lines(args.entries, words_per_line=12, seed=1)
+        answers = sample_lines(args.entries, words_per_line=40, seed=2)
+
+        started = time.perf_counter()
+        enqueue_times = []
+        for question, answer in zip(questions, answers):
+            call_started = time.perf_counter()
+            store.add(question, answer)
+            enqueue_times.append((time.perf_counter() - call_started) * 1000)
+        enqueued = time.perf_counter() - started
+        store.flush()
+        committed = time.perf_counter() - started
+
+        queries = ["error", "network timeout", "connection fail", "settings upd", "could not open file"]
+        first_page, deep_page = [], []
+        for _ in range(args.repeat):
+            for query in queries:
+                call_started = time.perf_counter()
+                store.search(query)
+                first_page.append((time.perf_counter() - call_started) * 1000)
+                call_started = time.perf_counter()
+                store.search(query, offset=1000)
+                deep_page.append((time.perf_counter() - call_started) * 1000)
+        rows = store.count()
+        store.close()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    report(f"History store ({rows} entries)", [
+        ("add() p99 (ms, caller side)", f"{percentile(enqueue_times, 99):.4f}"),
+        ("enqueue all (s)", f"{enqueued:.2f}"),
+        ("committed throughput (rows/s)", f"{args.entries / committed:,.0f}"),
+        ("search first page p50 / p95 (ms)", f"{percentile(first_page, 50):.2f} / {percentile(first_page, 95):.2f}"),
+        ("search offset 1000 p50 / p95 (ms)", f"{percentile(deep_page, 50):.2f} / {percentile(deep_page, 95):.2f}"),
+    ])
+
+
+# --- Single-instance control channel ---
+def spawn_instance(command, work_dir, script="gemini_desktop_app.py", stdout=subprocess.DEVNULL, **env_overrides):
+    """Start the app in a child process with the same headless settings as this script"""
+    env = dict(os.environ, GEMINI_INSTANCE_NAME=instance_control.INSTANCE_NAME,
+               GEMINI_HISTORY="0", GEMINI_CACHE="0", **env_overrides)
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), script)
+    return subprocess.Popen([sys.executable, script] + command, cwd=work_dir, env=env,
+                            stdout=stdout, stderr=subprocess.DEVNULL)
+
+
+def wait_for_instance(process, selecting=False, timeout=30.0):
+    """Poll the control channel until the child answers (and shows its selection window)"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        reply = instance_control.send_command("status", timeout=0.5)
+        if reply and (reply.get("selecting") or not selecting):
+            return reply
+        if process.poll() is not None:
+            raise RuntimeError(f"Instance exited with code {process.returncode}")
+        time.sleep(0.005)
+    raise RuntimeError("Instance did not come up in time")
+
+
+def stop_instance(process):
+    instance_control.send_command("quit")
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def bench_instance(args):
+    """Trigger -> selection window latency: forwarding to a warm instance vs cold start"""
+    instance_control.INSTANCE_NAME = f"gemini-bench-{os.getpid()}"
+    work_dir = tempfile.mkdtemp(prefix="gemini_instance_")
+    cold, warm_socket, warm_process, warm_light, status = [], [], [], [], []
+    try:
+        # Cold: what the old native host did - kill, relaunch, wait for the window
+        for _ in range(args.cold):
+            started = time.perf_counter()
+            process = spawn_instance(["capture"], work_dir)
+            wait_for_instance(process, selecting=True)
+            cold.append((time.perf_counter() - started) * 1000)
+            stop_instance(process)
+
+        process = spawn_instance([], work_dir)
+        try:
+            wait_for_instance(process)
+            connection = instance_control.InstanceConnection()
+            for _ in range(args.warm):
+                started = time.perf_counter()
+                reply = connection.request("capture")
+                warm_socket.append((time.perf_counter() - started) * 1000)
+                assert reply.get("selecting"), reply
+                started = time.perf_counter()
+                connection.request("status")
+                status.append((time.perf_counter() - started) * 1000)
+            connection.close()
+
+            # A second invocation from the command line pays for interpreter start-up
+            for _ in range(args.cold):
+                started = time.perf_counter()
+                forwarder = spawn_instance(["capture"], work_dir)
+                forwarder.wait(timeout=30)
+                warm_process.append((time.perf_counter() - started) * 1000)
+                started = time.perf_counter()
+                forwarder = spawn_instance(["capture"], work_dir, script="instance_control.py")
+                forwarder.wait(timeout=30)
+                warm_light.append((time.perf_counter() - started) * 1000)
+        finally:
+            stop_instance(process)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    report("Trigger -> selection window", [
+        ("cold restart p50 / p95 (ms)", f"{percentile(cold, 50):.1f} / {percentile(cold, 95):.1f}"),
+        ("warm forward, socket p50 / p95 (ms)", f"{percentile(warm_socket, 50):.2f} / {percentile(warm_socket, 95):.2f}"),
+        ("warm forward, app CLI p50 (ms)", f"{percentile(warm_process, 50):.1f}"),
+        ("warm forward, instance_control.py p50 (ms)", f"{percentile(warm_light, 50):.1f}"),
+        ("status round trip p50 (ms)", f"{percentile(status, 50):.3f}"),
+    ])
+
+
+class NativeHostHarness:
+    """Runs host_script.py on pipes and speaks Chrome's native messaging framing to it"""
+
+    def __init__(self, work_dir):
+        env = dict(os.environ, GEMINI_INSTANCE_NAME=instance_control.INSTANCE_NAME,
+                   GEMINI_HISTORY="0", GEMINI_CACHE="0")
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "native_messaging_host", "host_script.py")
+        self.process = subprocess.Popen([sys.executable, script], cwd=work_dir, env=env,
+                                        stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+
+    def request(self, message):
+        data = json.dumps(message).encode("utf-8")
+        self.process.stdin.write(struct.pack("@I", len(data)) + data)
+        self.process.stdin.flush()
+        length = struct.unpack("@I", self.process.stdout.read(4))[0]
+        return json.loads(self.process.stdout.read(length))
+
+    def close(self):
+        self.process.stdin.close()
+        return self.process.wait(timeout=10)
+
+
+def bench_native_host(args):
+    """Per-message round trip through the persistent native messaging host"""
+    instance_control.INSTANCE_NAME = f"gemini-bench-{os.getpid()}"
+    work_dir = tempfile.mkdtemp(prefix="gemini_host_")
+    host = NativeHostHarness(work_dir)
+    timings = {"trigger_assistant": [], "toggle_ui": [], "status": []}
+    try:
+        # First message finds no app, so the host launches it
+        started = time.perf_counter()
+        reply = host.request({"action": "trigger_assistant", "id": 0})
+        launch_ms = (time.perf_counter() - started) * 1000
+        assert reply["status"] == "success", reply
+        started = time.perf_counter()
+        wait_for_instance(host.process, selecting=True)
+        window_ms = launch_ms + (time.perf_counter() - started) * 1000
+
+        for index in range(args.messages):
+            action = ("trigger_assistant", "toggle_ui", "status")[index % 3]
+            started = time.perf_counter()
+            reply = host.request({"action": action, "id": index + 1})
+            timings[action].append((time.perf_counter() - started) * 1000)
+            assert reply["status"] == "success" and reply["id"] == index + 1, reply
+        app_pid = reply["app"]["pid"]
+    finally:
+        instance_control.send_command("quit")
+        exit_code = host.close()
+        deadline = time.monotonic() + 10
+        while instance_control.send_command("status", timeout=0.5) and time.monotonic() < deadline:
+            time.sleep(0.05)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    every = [value for values in timings.values() for value in values]
+    rows = [
+        ("first trigger, app launch reply (ms)", f"{launch_ms:.1f}"),
+        ("first trigger -> selection window (ms)", f"{window_ms:.1f}"),
+    ]
+    for action, values in timings.items():
+        rows.append((f"{action} p50 / p99 (ms)", f"{percentile(values, 50):.2f} / {percentile(values, 99):.2f}"))
+    rows += [
+        ("all messages p50 / p99 (ms)", f"{percentile(every, 50):.2f} / {percentile(every, 99):.2f}"),
+        ("messages / app PID / host exit code", f"{len(every) + 1} / {app_pid} / {exit_code}"),
+    ]
+    report("Native messaging host round trip", rows)
+
+
+# --- Cold start ---
+def module_import_ms():
+    """Import time of gemini_desktop_app in a fresh interpreter, from -X importtime"""
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import gemini_desktop_app"],
+                            env=env, capture_output=True, text=True)
+    for line in result.stderr.splitlines():
+        if line.rstrip().endswith("| gemini_desktop_app"):
+            return int(line.split("|")[1]) / 1000.0
+    return 0.0
+
+
+def parse_startup_report(output):
+    """Milestone label -> elapsed ms, from the app's last printed startup report"""
+    milestones = {}
+    for line in output.splitlines():
+        if line.startswith("startup:") and "milestone" not in line:
+            elapsed, _, _, label = [part.strip() for part in line[len("startup:"):].split("|", 3)]
+            milestones[label] = float(elapsed)
+    return milestones
+
+
+def bench_startup(args):
+    """Time to hotkeys ready and to the first completed answer, with and without warm-up"""
+    instance_control.INSTANCE_NAME = f"gemini-bench-{os.getpid()}"
+    work_dir = tempfile.mkdtemp(prefix="gemini_startup_")
+    stub = StubGeminiServer(latency=args.latency).start()
+    results = {}
+    last_output = ""
+    try:
+        for mode, warm in (("warm-up on", "1"), ("warm-up off", "0")):
+            rows = results[mode] = {"listening": [], "answer": [], "milestones": []}
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                process = spawn_instance([], work_dir, stdout=subprocess.PIPE, GEMINI_API_BASE_URL=stub.url,
+                                         GEMINI_STARTUP_REPORT="1", GEMINI_WARMUP=warm)
+                wait_for_instance(process)
+                rows["listening"].append((time.perf_counter() - started) * 1000)
+                # The user's first trigger comes a moment after launch
+                time.sleep(args.delay)
+                started = time.perf_counter()
+                instance_control.send_command("ask what does this error mean")
+                while wait_for_instance(process).get("pending"):
+                    time.sleep(0.002)
+                rows["answer"].append((time.perf_counter() - started) * 1000)
+                stop_instance(process)
+                last_output = process.stdout.read().decode("utf-8", "replace")
+                rows["milestones"].append(parse_startup_report(last_output))
+            if warm == "1":
+                report_lines = last_output[last_output.rfind("startup: elapsed"):].splitlines()
+                print("\n".join(line for line in report_lines if line.startswith("startup:")))
+    finally:
+        stub.stop()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    def milestone(label):
+        values = []
+        for mode in results:
+            marks = [m[label] for m in results[mode]["milestones"] if label in m]
+            # No keyboard backend on a headless box means hotkeys never become ready
+            values.append(f"{percentile(marks, 50):.1f}" if marks else "n/a")
+        return " / ".join(values)
+
+    def measured(key):
+        return " / ".join(f"{percentile(results[mode][key], 50):.1f}" for mode in results)
+
+    report(f"Cold start, warm-up on / off (median of {args.repeat})", [
+        ("gemini_desktop_app import (ms)", f"{module_import_ms():.1f}"),
+        ("launch -> accepting commands (ms)", measured("listening")),
+        ("module start -> window created (ms)", milestone("window created")),
+        ("module start -> hotkeys ready (ms)", milestone("hotkeys ready")),
+        (f"trigger at +{args.delay:.1f}s -> answer (ms)", measured("answer")),
+    ])
+
+
+# --- Burst of capture triggers ---
+def run_burst(qt_app, args, policy, interval):
+    """Fire args.triggers capture triggers interval seconds apart; returns scheduler counters"""
+    debouncer = app_module.TriggerDebouncer()
+    pipeline = app_module.CapturePipeline(policy=policy, streaming=True, router=core_module.CaptureRouter(mode="ocr"))
+    finished, dropped = {}, []
+    pipeline.resultReady.connect(lambda capture_id, question, answer, cached: finished.update({capture_id: answer}))
+    pipeline.captureDropped.connect(dropped.append)
+
+    submitted = []
+    for index in range(args.triggers):
+        if debouncer.accept():
+            # The pixel value tells the stub OCR which question this screenshot shows
+            image = QImage(64, 32, QImage.Format.Format_RGB32)
+            image.fill(QColor(index, index, index))
+            capture_id = pipeline.submit(image)
+            if capture_id is not None:
+                submitted.append(capture_id)
+        deadline = time.perf_counter() + interval
+        while time.perf_counter() < deadline:
+            qt_app.processEvents()
+            time.sleep(0.001)
+    last_trigger = time.perf_counter()
+    while len(finished) + len(dropped) < len(submitted):
+        qt_app.processEvents()
+        time.sleep(0.001)
+    drain = time.perf_counter() - last_trigger
+    pipeline.stop()
+
+    stats = pipeline.scheduler_stats()
+    stale = sum(1 for capture_id, answer in finished.items()
+                if capture_id != submitted[-1] and not core_module.is_error_response(answer))
+    latest_answer = finished.get(submitted[-1], "")
+    return stats, stale, drain, not core_module.is_error_response(latest_answer)
+
+
+def bench_burst(args):
+    """Wasted API calls when a burst of capture triggers hits the pipeline, per scheduling policy"""
+    qt_app = get_app()
+    answer = " ".join(f"word{i}" for i in range(40))
+    server = StubGeminiServer(latency=args.latency, answer=answer, chunk_count=5, chunk_delay=0.05).start()
+    core_module.API_KEY = core_module.API_KEY or "bench"
+    core_module._gemini_client = core_module.GeminiClient(api_key="bench", base_url=server.url, rate_per_minute=0)
+    core_module.OCR_PREPROCESS = False
+
+    def stub_ocr(image, with_confidence=False):
+        time.sleep(args.ocr_delay)
+        text = f"question {image.getpixel((0, 0))[0] % args.distinct}"
+        return (text, 95.0) if with_confidence else text
+
+    app_module.perform_ocr = stub_ocr
+    rows, checks = [], []
+    try:
+        for label, interval in (("auto-repeat", args.repeat_interval), ("impatient", args.interval)):
+            for policy in ("latest", "fifo"):
+                before = len(server.requests)
+                stats, stale, drain, answered = run_burst(qt_app, args, policy, interval)
+                calls = len(server.requests) - before
+                rows.append((f"{label} {interval * 1000:.0f}ms, {policy}",
+                             f"accepted {stats['submitted']:>2}  HTTP {calls:>2}  "
+                             f"wasted {stats['wasted_api_calls']:>2}  coalesced {stats['coalesced']:>2}  "
+                             f"superseded {stats['superseded']:>2}  stale {stale:>2}  "
+                             f"drain {drain:.1f}s  latest answered {'yes' if answered else 'no'}"))
+                checks.append((f"{label}, {policy}: latest capture answered", answered))
+                if policy == "latest":
+                    latest_calls = calls
+                    checks.append((f"{label}, latest: at most 2 wasted calls", stats["wasted_api_calls"] <= 2))
+                else:
+                    checks.append((f"{label}, fifo: every capture answered, none wasted",
+                                   stale == stats["submitted"] - 1 and stats["wasted_api_calls"] == 0))
+                    checks.append((f"{label}, latest: no more HTTP calls than fifo", latest_calls <= calls))
+    finally:
+        core_module._gemini_client.close()
+        core_module._gemini_client = None
+        server.stop()
+
+    report(f"Burst of {args.triggers} triggers ({args.distinct} distinct questions, API {args.latency:.1f}s)", rows)
+    report_checks(checks)
+
+
+# --- Rate limiting, retries and circuit breaker ---
+def run_load(client, requests_total, threads, pause=0.0):
+    """Send requests_total prompts from several threads through call_generative_ai_api"""
+    core_module._gemini_client = client
+    latencies, outcomes = [], Counter()
+    lock = threading.Lock()
+    counter = iter(range(requests_total))
+
+    def worker():
+        for index in counter:
+            started = time.perf_counter()
+            answer = app_module.call_generative_ai_api(f"question {index}")
+            elapsed = (time.perf_counter() - started) * 1000
+            with lock:
+                latencies.append(elapsed)
+                if not core_module.is_error_response(answer):
+                    outcomes["ok"] += 1
+                elif "unavailable" in answer:
+                    outcomes["fast-fail"] += 1
+                else:
+                    outcomes["error"] += 1
+            time.sleep(pause)
+
+    started = time.perf_counter()
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    wall = time.perf_counter() - started
+    core_module._gemini_client = None
+    return latencies, outcomes, wall
+
+
+def bench_resilience(args):
+    """Success rate and latency against a stub that injects 429s, 503s and an outage"""
+    core_module.API_KEY = core_module.API_KEY or "bench"
+    scenarios = (
+        ("quota", dict(quota=args.quota, quota_window=1.0), 0.0),
+        ("flaky", dict(error_rate=args.error_rate), 0.0),
+        # Paced so the load outlasts the outage and the breaker has to recover
+        ("outage", dict(outage=(0.5, 0.5 + args.outage)), 0.5),
+    )
+    clients = (
+        ("naive", dict(rate_per_minute=0, max_attempts=1), 10 ** 6),
+        ("retry", dict(rate_per_minute=0), 10 ** 6),
+        # Burst + refill per second must stay within the stub's quota for any one-second window
+        ("retry+limit+breaker", dict(rate_per_minute=(args.quota - 1) * 60, burst=1),
+         core_module.BREAKER_FAILURE_THRESHOLD),
+    )
+    rows, results = [], {}
+    for scenario, faults, pause in scenarios:
+        for name, options, threshold in clients:
+            server = StubGeminiServer(latency=args.latency, **faults).start()
+            breaker = core_module.CircuitBreaker(failure_threshold=threshold, reset_seconds=1.0)
+            client = core_module.GeminiClient(api_key="bench", base_url=server.url, breaker=breaker, **options)
+            try:
+                latencies, outcomes, wall = run_load(client, args.requests, args.threads, pause)
+                metrics = client.metrics_snapshot()
+            finally:
+                client.close()
+                server.stop()
+            rows.append((f"{scenario} / {name}",
+                         f"ok {outcomes['ok']:>2}/{args.requests}  fast-fail {outcomes['fast-fail']:>2}  "
+                         f"sent {len(server.requests):>3} (429 {server.statuses[429]:>2}, 503 {server.statuses[503]:>2})  "
+                         f"retries {metrics['retries']:>3}  wait p95 {metrics['queue_wait_p95_ms']:>6.0f}ms  "
+                         f"p50/p95 {percentile(latencies, 50):>5.0f}/{percentile(latencies, 95):>5.0f}ms  "
+                         f"wall {wall:.1f}s"))
+            results[scenario, name] = (outcomes, server, metrics)
+
+    # Two 503s open the breaker; its half-open trial gets a 429, which must not leave the trial hanging
+    server = StubGeminiServer(latency=args.latency, script=(503, 503, 429)).start()
+    breaker = core_module.CircuitBreaker(failure_threshold=2, reset_seconds=0.2)
+    client = core_module.GeminiClient(api_key="bench", base_url=server.url, breaker=breaker,
+                                     rate_per_minute=0, max_attempts=1)
+    try:
+        core_module._gemini_client = client
+        answers = []
+        for index in range(6):
+            answers.append(app_module.call_generative_ai_api(f"question {index}"))
+            if index == 1:
+                time.sleep(0.25)
+        core_module._gemini_client = None
+    finally:
+        client.close()
+        server.stop()
+    recovered = [not core_module.is_error_response(answer) for answer in answers[3:]]
+    rows.append(("half-open trial gets a 429", f"after it {sum(recovered)}/{len(recovered)} ok, "
+                                               f"breaker {breaker.state}"))
+
+    report(f"Resilience: {args.requests} requests, {args.threads} threads "
+           f"(quota {args.quota}/s, {args.error_rate:.0%} 503s, {args.outage:.0f}s outage)", rows)
+    guarded = "retry+limit+breaker"
+    report_checks([
+        ("quota: limiter keeps every request under the quota", results["quota", guarded][1].statuses[429] == 0),
+        ("quota: every request answered", results["quota", guarded][0]["ok"] == args.requests),
+        ("flaky: retries answer every request", results["flaky", guarded][0]["ok"] == args.requests),
+        ("outage: breaker sends fewer requests than plain retries",
+         len(results["outage", guarded][1].requests) < len(results["outage", "retry"][1].requests)),
+        ("outage: breaker closed again afterwards", results["outage", guarded][2]["breaker_state"] == "closed"),
+        ("half-open: a 429 trial does not block later requests", all(recovered) and breaker.state == "closed"),
+    ])
+
+
+# --- OCR text vs image routing ---
+def bench_routing(args):
+    """Payload bytes, estimated tokens and end-to-end latency of the OCR text and image paths"""
+    qt_app = get_app()
+    labels = ("Client", "Gateway", "Cache", "Service", "Database")
+    text_lines = sample_lines(args.lines)
+    dense_lines = sample_lines(args.lines * 3, words_per_line=16, seed=1)
+    samples = (
+        ("text pane", render_text_image(text_lines), "\n".join(text_lines), 92.0),
+        ("dense text", render_text_image(dense_lines, font_size=14), "\n".join(dense_lines), 88.0),
+        ("diagram", render_diagram(labels=labels), " ".join(labels), 80.0),
+        ("photo", render_photo(960, 540), "~ . ,' ;", 22.0),
+    )
+
+    ocr_label = "tesseract"
+    if not tesseract_available():
+        # Known text and typical confidences per sample, at a CPU cost per megapixel
+        ocr_label = f"stub {args.ocr_ms_per_mp:.0f}ms/MP"
+        core_module.OCR_PREPROCESS = False  # Keeps each stub image identical to its sample
+        truth = {image.size: (text, confidence) for _, image, text, confidence in samples}
+
+        def stub_ocr(image, with_confidence=False):
+            deadline = time.process_time() + args.ocr_ms_per_mp / 1000 * image.width * image.height / 1e6
+            while time.process_time() < deadline:
+                pass
+            text, confidence = truth[image.size]
+            return (text, confidence) if with_confidence else text
+
+        app_module.perform_ocr = stub_ocr
+
+    server = StubGeminiServer(latency=args.latency, latency_per_kb=args.ms_per_kb / 1000).start()
+    core_module.API_KEY = core_module.API_KEY or "bench"
+    core_module._gemini_client = core_module.GeminiClient(api_key="bench", base_url=server.url, rate_per_minute=0)
+    encodings, rows = [], []
+    try:
+        for name, image, _, _ in samples:
+            encoded = core_module.encode_image_for_api(image)
+            sizes = []
+            for fmt in ("PNG", "JPEG"):
+                buffer = io.BytesIO()
+                image.save(buffer, fmt)
+                sizes.append(f"{fmt} {buffer.tell() / 1024:>5.0f}KB")
+            encodings.append((f"{name} {image.width}x{image.height}",
+                              f"{'  '.join(sizes)}  -> {encoded.mime_type} {encoded.width}x{encoded.height} "
+                              f"{len(encoded.data) / 1024:>4.0f}KB"))
+
+            qimage = pil_to_qimage(image)
+            for mode in ("ocr", "image", "auto"):
+                router = core_module.CaptureRouter(mode=mode)
+                pipeline = app_module.CapturePipeline(streaming=False, policy="fifo", router=router)
+                finished = []
+                pipeline.resultReady.connect(lambda capture_id, question, answer, cached: finished.append(answer))
+                latencies, body_sizes, tokens, routes = [], [], [], Counter()
+                for _ in range(args.repeat):
+                    before = len(server.requests)
+                    started = time.perf_counter()
+                    pipeline.submit(qimage)
+                    while len(finished) < len(latencies) + 1:
+                        qt_app.processEvents()
+                        time.sleep(0.0005)
+                    latencies.append((time.perf_counter() - started) * 1000)
+                    if len(server.requests) == before:
+                        routes["none"] += 1
+                        continue
+                    payload = server.requests[-1]
+                    body_sizes.append(len(json.dumps(payload).encode("utf-8")))
+                    parts = payload["contents"][0]["parts"]
+                    if "inlineData" in parts[0]:
+                        routes["image"] += 1
+                        tiles = -(-encoded.width // core_module.IMAGE_TILE_SIZE) * -(-encoded.height // core_module.IMAGE_TILE_SIZE)
+                        tokens.append(tiles * core_module.IMAGE_TILE_TOKENS + len(parts[-1]["text"]) // 4)
+                    else:
+                        routes["text"] += 1
+                        tokens.append(len(parts[-1]["text"]) // 4)
+                pipeline.stop()
+                route = "/".join(f"{path} {count}" for path, count in sorted(routes.items()))
+                rows.append((f"{name}, {mode}",
+                             f"{route:<16} body {percentile(body_sizes, 50) / 1024:>6.1f}KB  "
+                             f"~{percentile(tokens, 50):>5.0f} tokens  "
+                             f"p50 {percentile(latencies, 50):>6.0f}ms  p95 {percentile(latencies, 95):>6.0f}ms"))
+    finally:
+        core_module._gemini_client.close()
+        server.stop()
+
+    report("Image encoding at the token budget", encodings)
+    report(f"Routing: OCR {ocr_label}, API {args.latency * 1000:.0f}ms + {args.ms_per_kb:.1f}ms/KB uploaded", rows)
+
+
+# --- Long OCR text ---
+def long_document(tokens, seed=0):
+    """Paragraphs of 2-10 lines of words, about tokens long in total"""
+    rng = random.Random(seed)
+    paragraphs, total = [], 0
+    while total < tokens:
+        paragraph = "\n".join(sample_lines(rng.randint(2, 10), seed=rng.randrange(1 << 30)))
+        paragraphs.append(paragraph)
+        total += core_module.estimate_tokens(paragraph)
+    return paragraphs
+
+
+def bench_long_text(args):
+    """Single prompt vs chunked map-reduce on a long capture, against a stub with per-token latency and an input limit"""
+    qt_app = get_app()
+    paragraphs = long_document(args.tokens)
+    text = "\n\n".join(paragraphs)
+    server = StubGeminiServer(latency=args.latency, latency_per_token=args.ms_per_token / 1000,
+                              max_input_tokens=args.input_limit, answer="stub partial answer").start()
+    core_module.API_KEY = core_module.API_KEY or "bench"
+    core_module._gemini_client = core_module.GeminiClient(api_key="bench", base_url=server.url, rate_per_minute=0,
+                                                        max_concurrent=max(4, args.concurrency))
+    max_prompt_tokens = min(app_module.MAX_PROMPT_TOKENS, args.input_limit)
+    rows, checks = [], []
+
+    def run(label, fn):
+        before = len(server.requests)
+        statuses_before = Counter(server.statuses)
+        started = time.perf_counter()
+        answer = fn()
+        elapsed = time.perf_counter() - started
+        sent = server.requests[before:]
+        rejected = server.statuses[400] - statuses_before[400]
+        largest = max((server.input_tokens(payload) for payload in sent), default=0)
+        outcome = "error" if core_module.is_error_response(answer) else "ok"
+        rows.append((label, f"{outcome:<5}  requests {len(sent):>3}  rejected {rejected:>2}  "
+                            f"largest prompt ~{largest:>6} tokens  wall {elapsed:>6.2f}s"))
+        return answer, sent, elapsed
+
+    try:
+        run("single prompt", lambda: app_module.call_generative_ai_api(text))
+        _, serial, _ = run("chunked, 1 at a time", lambda: core_module.answer_long_text(
+            text, max_prompt_tokens=max_prompt_tokens, concurrency=1))
+
+        # Under a rate limit only the limiter's burst goes out together, whatever the concurrency
+        unlimited = core_module._gemini_client
+        limited = core_module.GeminiClient(api_key="bench", base_url=server.url, rate_per_minute=args.rpm,
+                                          burst=core_module.RATE_LIMIT_BURST, max_concurrent=max(4, args.concurrency))
+        fan_out = limited.fan_out(args.concurrency)
+        core_module._gemini_client = limited
+        try:
+            _, limited_sent, limited_wall = run(f"chunked, {fan_out} of {args.concurrency} at a time ({args.rpm} RPM)",
+                                  lambda: core_module.answer_long_text(text, max_prompt_tokens=max_prompt_tokens,
+                                                                      concurrency=args.concurrency))
+        finally:
+            core_module._gemini_client = unlimited
+            limited.close()
+
+        # Through the pipeline, as a capture would go, recording the status label updates
+        progress, finished = [], []
+        pipeline = app_module.CapturePipeline(streaming=args.streaming, policy="fifo")
+        pipeline.statusChanged.connect(lambda capture_id, message: progress.append(message))
+        pipeline.resultReady.connect(lambda capture_id, question, answer, cached: finished.append(answer))
+
+        def through_pipeline():
+            pipeline.submit_text(text)
+            while not finished:
+                qt_app.processEvents()
+                time.sleep(0.001)
+            return finished[0]
+
+        original_limit = app_module.MAX_PROMPT_TOKENS
+        app_module.MAX_PROMPT_TOKENS = max_prompt_tokens
+        try:
+            answer, sent, _ = run(f"chunked, {core_module.CHUNK_CONCURRENCY} at a time (pipeline)", through_pipeline)
+        finally:
+            app_module.MAX_PROMPT_TOKENS = original_limit
+            pipeline.stop()
+    finally:
+        core_module._gemini_client.close()
+        server.stop()
+
+    # Correctness of the pipeline run
+    prompts = ["".join(part.get("text", "") for part in payload["contents"][0]["parts"]) for payload in sent]
+    chunk_prompts = [prompt for prompt in prompts if prompt.startswith("This is part ")]
+    reduce_prompts = [prompt for prompt in prompts if prompt.startswith("A long text captured")]
+    answered = [message for message in progress if "answered" in message]
+    checks.append(("every prompt within the input limit", all(server.input_tokens(p) <= args.input_limit for p in sent)))
+    checks.append(("every paragraph sent intact exactly once",
+                   all(sum(paragraph in prompt for prompt in chunk_prompts) == 1 for paragraph in paragraphs)))
+    checks.append(("merge prompt has every part's answer", bool(reduce_prompts) and all(
+        f"Part {index}:" in "".join(reduce_prompts) for index in range(1, len(chunk_prompts) + 1))))
+    checks.append(("status label counted every part",
+                   len(answered) == len(chunk_prompts) and f"{len(chunk_prompts)}/{len(chunk_prompts)}" in answered[-1]))
+    checks.append(("status label showed the merge", any(message.startswith("Merging") for message in progress)))
+    checks.append(("final answer delivered", not core_module.is_error_response(answer)))
+    # The map requests beyond the burst wait for the limiter, one per 60 / rpm seconds
+    maps = len(serial) - 1
+    checks.append(("fan-out cut to the limiter's burst", fan_out == min(args.concurrency, core_module.RATE_LIMIT_BURST)))
+    checks.append(("rate limit paced the extra map requests",
+                   len(limited_sent) == len(serial) and limited_wall >= (maps - fan_out) * 60 / args.rpm * 0.9))
+    if core_module.RATE_LIMIT_PER_MINUTE > 0:
+        rows.append((f"chunked at the default {core_module.RATE_LIMIT_PER_MINUTE} RPM",
+                     f"at least {max(0, maps - core_module.RATE_LIMIT_BURST) * 60 / core_module.RATE_LIMIT_PER_MINUTE:.0f}s "
+                     f"for {maps} parts, whatever the concurrency"))
+
+    report(f"Long text: ~{core_module.estimate_tokens(text)} tokens in {len(paragraphs)} paragraphs, "
+           f"stub limit {args.input_limit} tokens, {args.ms_per_token:.2f}ms/token", rows)
+    report_checks(checks)
+
+
+# --- Latency tracing ---
+def bench_tracing(args):
+    """Per-span and per-capture tracing overhead, and the stage breakdown of a stub pipeline run"""
+    qt_app = get_app()
+    work_dir = tempfile.mkdtemp(prefix="gemini_trace_")
+    jsonl_path = os.path.join(work_dir, "trace.jsonl")
+    prom_path = os.path.join(work_dir, "gemini_assistant.prom")
+
+    overhead = []
+    for label, tracer in (("disabled", core_module.Tracer(enabled=False)),
+                          ("in memory", core_module.Tracer(enabled=True)),
+                          ("JSONL + Prometheus", core_module.Tracer(enabled=True, jsonl_path=jsonl_path,
+                                                                   prometheus_path=prom_path, export_interval=0.5))):
+        started = time.perf_counter()
+        for capture_id in range(args.traces):
+            tracer.begin(capture_id)
+            for stage in ("convert", "preprocess", "route", "ocr", "api", "render"):
+                with tracer.span(capture_id, stage):
+                    pass
+            tracer.mark(capture_id, "first_chunk")
+            tracer.finish(capture_id, "answered")
+        per_capture = (time.perf_counter() - started) / args.traces
+        tracer.close()
+        overhead.append((label, f"{per_capture * 1e6:>7.1f} us per capture (6 spans, 1 mark)"))
+
+    def stub_ocr(image, with_confidence=False):
+        time.sleep(args.ocr_delay)
+        text = f"question {image.getpixel((0, 0))}"
+        return (text, 95.0) if with_confidence else text
+
+    app_module.perform_ocr = stub_ocr
+    server = StubGeminiServer(latency=args.latency, answer="traced answer", chunk_count=4, chunk_delay=0.02).start()
+    core_module.API_KEY = core_module.API_KEY or "bench"
+    core_module._gemini_client = core_module.GeminiClient(api_key="bench", base_url=server.url, rate_per_minute=0)
+    os.remove(jsonl_path)
+    tracer = core_module.Tracer(enabled=True, jsonl_path=jsonl_path, prometheus_path=prom_path)
+    pipeline = app_module.CapturePipeline(streaming=True, policy="fifo", tracer=tracer,
+                                          router=core_module.CaptureRouter(mode="ocr"))
+    finished = []
+    pipeline.resultReady.connect(lambda capture_id, question, answer, cached: finished.append(capture_id))
+    screenshot = render_text_image(sample_lines(args.lines))
+    try:
+        for index in range(args.captures):
+            # A different first pixel per capture keeps the stub OCR text, and so the prompt, unique
+            screenshot.putpixel((0, 0), (index % 256, index // 256 % 256, 255))
+            pipeline.submit(pil_to_qimage(screenshot))
+            while len(finished) <= index:
+                qt_app.processEvents()
+                time.sleep(0.0005)
+    finally:
+        pipeline.stop()
+        tracer.close()
+        core_module._gemini_client.close()
+        server.stop()
+
+    snapshot = tracer.snapshot()
+    order = ("convert", "preprocess", "route", "ocr", "api", "first_chunk", "queue", "total")
+    stages = [(stage, f"p50 {snapshot[stage]['p50_ms']:>8.2f}  p95 {snapshot[stage]['p95_ms']:>8.2f}  "
+                      f"p99 {snapshot[stage]['p99_ms']:>8.2f} ms  (n={snapshot[stage]['count']})")
+              for stage in order if stage in snapshot]
+    with open(jsonl_path, encoding="utf-8") as f:
+        records = [json.loads(line) for line in f]
+    with open(prom_path, encoding="utf-8") as f:
+        samples = [line for line in f if line.strip() and not line.startswith("#")]
+    shutil.rmtree(work_dir, ignore_errors=True)
+
+    report(f"Tracing overhead ({args.traces} synthetic captures)", overhead)
+    report(f"Stage latency: {args.captures} captures, OCR {args.ocr_delay * 1000:.0f}ms, API {args.latency * 1000:.0f}ms", stages)
+    report("Exports", [
+        ("JSONL records", len(records)),
+        ("example record", core_module.Tracer.breakdown(records[-1]) if records else "-"),
+        ("Prometheus samples", len(samples)),
+    ])
+
+
+# --- Full-flow regression suite ---
+BASELINES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baselines.json")
+# Allowed slack beyond the relative tolerance, so tiny baselines don't fail on noise
+SUITE_SLACK = {"ocr_p50_ms": 5.0, "api_p50_ms": 10.0, "e2e_p50_ms": 20.0, "e2e_p95_ms": 40.0,
+               "gui_stall_p99_ms": 10.0, "gui_stall_max_ms": 25.0, "memory_growth_mb": 5.0}
+
+
+def run_full_flow(qt_app, assistant, desktop, rect):
+    """Drag a selection over rect on a frozen synthetic desktop and wait for the answer; returns seconds from release"""
+    assistant.start_screen_capture()
+    window = assistant.selection_window
+    window.screenshot = desktop
+    window.pixel_ratio = 1.0
+    qt_app.processEvents()
+    window.mousePressEvent(mouse_event(QEvent.Type.MouseButtonPress, rect.left(), rect.top()))
+    for step in range(1, 11):
+        window.mouseMoveEvent(mouse_event(QEvent.Type.MouseMove, rect.left() + rect.width() * step // 10,
+                                          rect.top() + rect.height() * step // 10))
+        qt_app.processEvents()
+    started = time.perf_counter()
+    window.mouseReleaseEvent(mouse_event(QEvent.Type.MouseButtonRelease, rect.right() + 1, rect.bottom() + 1,
+                                         Qt.MouseButton.NoButton))
+    while assistant.pending_captures:
+        qt_app.processEvents()
+        time.sleep(0.0005)
+    return time.perf_counter() - started
+
+
+def check_baseline(metrics, baseline, tolerance):
+    """Report rows comparing metrics to baseline; returns (rows, regressed)"""
+    rows, regressed = [], False
+    for name, value in metrics.items():
+        if name not in baseline:
+            rows.append((name, f"{value:>9.2f}   (no baseline)"))
+            continue
+        limit = baseline[name] * (1 + tolerance) + SUITE_SLACK.get(name, 0.0)
+        failed = value > limit
+        regressed = regressed or failed
+        rows.append((name, f"{value:>9.2f}   baseline {baseline[name]:>9.2f}   limit {limit:>9.2f}   "
+                           f"{'REGRESSION' if failed else 'ok'}"))
+    return rows, regressed
+
+
+def bench_suite(args):
+    """Whole-assistant regression suite: selection -> OCR -> stub Gemini -> history view, against stored baselines"""
+    qt_app = get_app()
+    work_dir = tempfile.mkdtemp(prefix="gemini_suite_")
+
+    # Keep the user's history and cache out of it
+    class SuiteHistoryStore(app_module.HistoryStore):
+        def __init__(self, **options):
+            super().__init__(db_path=os.path.join(work_dir, "history.db"), **options)
+
+    class SuiteResponseCache(app_module.ResponseCache):
+        def __init__(self, **options):
+            super().__init__(db_path=os.path.join(work_dir, "cache.db"), **options)
+
+    app_module.HistoryStore = SuiteHistoryStore
+    app_module.ResponseCache = SuiteResponseCache
+    core_module._tracer = core_module.Tracer(enabled=True)
+
+    current = {"text": ""}
+    if tesseract_available():
+        ocr_mode = "tesseract"
+    else:
+        ocr_mode = "stub"
+
+        def stub_ocr(image, with_confidence=False):
+            # Tesseract runs out of process, so the stub sleeps (releasing the GIL) in proportion to the selection
+            time.sleep(args.ocr_ms_per_mp / 1000 * image.width * image.height / 1e6)
+            return (current["text"], 90.0) if with_confidence else current["text"]
+
+        app_module.perform_ocr = stub_ocr
+
+    answer = " ".join(f"word{i}" for i in range(60))
+    server = StubGeminiServer(latency=args.latency, answer=answer, chunk_count=6, chunk_delay=args.chunk_delay).start()
+    core_module.API_KEY = core_module.API_KEY or "bench"
+    core_module._gemini_client = core_module.GeminiClient(api_key="bench", base_url=server.url, rate_per_minute=0)
+
+    assistant = app_module.MyAssistant()
+    assistant.show()
+    qt_app.processEvents()
+
+    def desktop_for(iteration):
+        lines = sample_lines(args.lines, seed=iteration + 1)
+        current["text"] = "\n".join(lines)
+        text_image = render_text_image(lines)
+        canvas = Image.new("RGB", (1280, 800), (235, 235, 235))
+        canvas.paste(text_image, (120, 90))
+        rect = QRect(120, 90, text_image.width, text_image.height)
+        return QPixmap.fromImage(pil_to_qimage(canvas)), rect
+
+    lateness, interval_ms = [], 5
+    state = {"last": time.perf_counter()}
+
+    def on_tick():
+        now = time.perf_counter()
+        lateness.append(max(0.0, (now - state["last"]) * 1000 - interval_ms))
+        state["last"] = now
+
+    ticker = QTimer()
+    ticker.setInterval(interval_ms)
+    ticker.timeout.connect(on_tick)
+    try:
+        for iteration in range(args.warmup):
+            run_full_flow(qt_app, assistant, *desktop_for(iteration))
+        # Measure from a clean tracer and a settled heap
+        assistant.tracer = assistant.pipeline.tracer = core_module.Tracer(enabled=True)
+        gc.collect()
+        rss_before = rss_mb()
+        e2e = []
+        state["last"] = time.perf_counter()
+        ticker.start()
+        for iteration in range(args.warmup, args.warmup + args.captures):
+            e2e.append(run_full_flow(qt_app, assistant, *desktop_for(iteration)) * 1000)
+        ticker.stop()
+        gc.collect()
+        rss_after = rss_mb()
+        last_entry = assistant.history_model.entries[-1]
+    finally:
+        assistant.close()
+        server.stop()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    stages = assistant.tracer.snapshot()
+    metrics = {
+        "ocr_p50_ms": stages.get("ocr", {}).get("p50_ms", 0.0),
+        "api_p50_ms": stages.get("api", {}).get("p50_ms", 0.0),
+        "e2e_p50_ms": percentile(e2e, 50),
+        "e2e_p95_ms": percentile(e2e, 95),
+        "gui_stall_p99_ms": percentile(lateness, 99),
+        "gui_stall_max_ms": max(lateness or [0.0]),
+        "memory_growth_mb": rss_after - rss_before,
+    }
+    correct = last_entry.answer == answer
+    if not correct:
+        print(f"Unexpected answer in history: {last_entry.question[:80]!r} -> {last_entry.answer[:200]!r}")
+
+    baselines = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baselines = json.load(f)
+    title = (f"Full-flow suite: {args.captures} captures, OCR {ocr_mode}, API {args.latency * 1000:.0f}ms "
+             f"+ 6 chunks x {args.chunk_delay * 1000:.0f}ms")
+    if args.update_baseline:
+        baselines[ocr_mode] = {name: round(value, 2) for name, value in metrics.items()}
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+            f.write("\n")
+        report(title, [(name, f"{value:>9.2f}") for name, value in metrics.items()] +
+               [("baseline written", args.baseline)])
+        return
+
+    rows, regressed = check_baseline(metrics, baselines.get(ocr_mode, {}), args.tolerance)
+    rows.append(("answer rendered in history", "ok" if correct else "WRONG"))
+    report(title, rows)
+    if ocr_mode not in baselines:
+        print(f"No '{ocr_mode}' baseline in {args.baseline}; run with --update-baseline to record one.")
+    if regressed or not correct:
+        print("FAILED: performance regressed beyond the baseline tolerance" if regressed else "FAILED: wrong answer")
+        sys.exit(1)
+
+
+# --- Headless batch mode ---
+def stub_ocr_file(path, cpu_seconds=0.05):
+    """Stand-in for batch_ocr.ocr_file when Tesseract is missing: burns CPU like OCR would"""
+    deadline = time.process_time() + cpu_seconds
+    while time.process_time() < deadline:
+        pass
+    return f"What does {os.path.basename(path)} show?"
+
+
+HEADLESS_BATCH_SCRIPT = """
+import sys, runpy, importlib.abc
+
+class NoGui(importlib.abc.MetaPathFinder):
+    def find_spec(self, name, path, target=None):
+        if name.split(".")[0] in ("PyQt6", "pynput"):
+            raise ImportError(f"{name} is not installed on this server")
+
+sys.meta_path.insert(0, NoGui())
+sys.argv[0] = "batch_ocr.py"
+runpy.run_path("batch_ocr.py", run_name="__main__")
+"""
+
+
+def bench_batch(args):
+    """Images/sec of the headless batch CLI, sequential vs process pool + concurrent API calls"""
+    core_module.API_KEY = core_module.API_KEY or "bench"
+    work_dir = tempfile.mkdtemp(prefix="gemini_batch_")
+    for index in range(args.images):
+        render_text_image(sample_lines(args.lines, seed=index)).save(os.path.join(work_dir, f"shot_{index:04d}.png"))
+    if tesseract_available():
+        ocr_func, ocr_label = batch_ocr.ocr_file, "tesseract"
+    else:
+        ocr_func, ocr_label = functools.partial(stub_ocr_file, cpu_seconds=args.ocr_cpu), f"stub {args.ocr_cpu * 1000:.0f}ms CPU"
+
+    configs = (
+        ("sequential (1 process, 1 request)", 1, 1),
+        (f"batch ({args.workers} processes, {args.concurrency} requests)", args.workers, args.concurrency),
+    )
+    rows = []
+    server = StubGeminiServer(latency=args.latency).start()
+    try:
+        for label, workers, concurrency in configs:
+            output = os.path.join(work_dir, f"results_{workers}_{concurrency}.jsonl")
+            client = batch_ocr.use_client(server.url, concurrency, rate_per_minute=0)
+            try:
+                stats = batch_ocr.run_batch(batch_ocr.iter_images([work_dir]), output, ocr_func=ocr_func,
+                                            ocr_workers=workers, concurrency=concurrency, progress_every=0)
+                rows.append((label, f"{stats['done'] / stats['seconds']:>6.2f} images/sec  "
+                                    f"({stats['answered']} answered, {stats['failed']} failed, {stats['seconds']:.2f}s)"))
+                # A second run over the same output resumes: everything is already answered
+                resumed = batch_ocr.run_batch(batch_ocr.iter_images([work_dir]), output, ocr_func=ocr_func,
+                                              ocr_workers=workers, concurrency=concurrency, progress_every=0)
+                rows.append(("  resumed run", f"{resumed['skipped']} skipped, {resumed['done']} reprocessed"))
+            finally:
+                client.close()
+
+        # The CLI itself, in a process where PyQt6 and pynput cannot be imported, as on a headless server
+        output = os.path.join(work_dir, "results_headless.jsonl")
+        headless = subprocess.run(
+            [sys.executable, "-c", HEADLESS_BATCH_SCRIPT, work_dir, "-o", output, "--rpm", "0", "--ocr-workers", "2"],
+            cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, timeout=300,
+            env=dict(os.environ, GEMINI_API_KEY="bench", GEMINI_API_BASE_URL=server.url))
+        with open(output, encoding="utf-8") if os.path.exists(output) else io.StringIO() as f:
+            headless_records = sum(1 for line in f if line.strip())
+    finally:
+        server.stop()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    report(f"Batch: {args.images} images, OCR {ocr_label}, API latency {args.latency * 1000:.0f}ms", rows)
+    if headless.returncode:
+        print(headless.stdout[-2000:], headless.stderr[-2000:])
+    report_checks([("batch CLI runs without PyQt6", headless.returncode == 0 and headless_records == args.images)])
+
+
+# --- Multi-turn sessions ---
+def bench_session(args):
+    """Payload size and latency per turn over a long follow-up session, full history vs bounded session"""
+    answer = " ".join(sample_lines(6, words_per_line=16, seed=99))  # ~150 tokens per answer (and summary)
+    server = StubGeminiServer(latency=args.latency, latency_per_token=args.ms_per_token / 1000,
+                              answer=answer, prefix_cache=True).start()
+    core_module.API_KEY = core_module.API_KEY or "bench"
+    core_module._gemini_client = core_module.GeminiClient(api_key="bench", base_url=server.url, rate_per_minute=0)
+    call = core_module.stream_generative_ai_api if args.streaming else app_module.call_generative_ai_api
+    configs = (
+        ("resend full history", core_module.ConversationSession(token_budget=10 ** 9)),
+        (f"bounded session ({args.budget} tokens)", core_module.ConversationSession(token_budget=args.budget)),
+    )
+    rows, checks = [], []
+    try:
+        for label, session in configs:
+            capture = "\n".join(sample_lines(args.capture_lines, seed=0))
+            session.restart(capture, answer)
+            turns = []
+            for turn in range(1, args.turns + 1):
+                prompt = f"Turn {turn}: " + " ".join(sample_lines(3, words_per_line=12, seed=turn))
+                started = time.perf_counter()
+                if args.streaming:
+                    reply = call(prompt, lambda text: None, session=session)
+                else:
+                    reply = call(prompt, session=session)
+                elapsed = (time.perf_counter() - started) * 1000
+                payload = next(payload for payload in reversed(server.requests)
+                               if payload["contents"][-1]["parts"][-1].get("text", "") == prompt)
+                turns.append((elapsed, len(json.dumps(payload).encode("utf-8")), server.input_tokens(payload),
+                              core_module.is_error_response(reply)))
+            while session.summarizing:
+                time.sleep(0.01)
+
+            for first, last in ((1, 10), (args.turns // 2 - 4, args.turns // 2 + 5), (args.turns - 9, args.turns)):
+                window = turns[max(0, first - 1):last]
+                rows.append((f"{label}, turns {first}-{last}",
+                             f"payload {percentile([size for _, size, _, _ in window], 50) / 1024:>6.1f}KB  "
+                             f"~{percentile([tokens for _, _, tokens, _ in window], 50):>6.0f} tokens  "
+                             f"latency p50 {percentile([ms for ms, _, _, _ in window], 50):>6.0f}ms"))
+            stats = session.snapshot()
+            cached_share = stats.get("cached_tokens", 0) / max(1, stats.get("prompt_tokens", 0))
+            rows.append(("", f"{stats.get('summaries', 0)} background summaries of {stats.get('summarized_turns', 0)} turns, "
+                             f"{stats.get('turns_left_out', 0)} turns left out, {cached_share:.0%} of prompt tokens from "
+                             f"the stub's prefix cache, {sum(failed for *_, failed in turns)} errors"))
+
+            if session.token_budget == args.budget:
+                early, late = turns[:10], turns[-10:]
+                mean = lambda values: sum(values) / len(values)
+                checks.append(("bounded: every payload within twice the budget",
+                               all(tokens <= 2 * args.budget + 200 for _, _, tokens, _ in turns)))
+                checks.append(("bounded: payload flat (last 10 turns within 1.5x of turns 11-20)",
+                               mean([size for _, size, _, _ in late]) <= 1.5 * mean([size for _, size, _, _ in turns[10:20]])))
+                checks.append(("bounded: latency flat (last 10 turns within 1.5x of the first 10)",
+                               mean([ms for ms, *_ in late]) <= 1.5 * mean([ms for ms, *_ in early])))
+                checks.append(("bounded: older turns were summarized", stats.get("summaries", 0) > 0))
+                checks.append(("bounded: every turn answered", not any(failed for *_, failed in turns)))
+    finally:
+        core_module._gemini_client.close()
+        server.stop()
+
+    report(f"Follow-up session: {args.turns} turns, API {args.latency * 1000:.0f}ms + {args.ms_per_token:.2f}ms/token "
+           f"(cached prefix tokens at a quarter)", rows)
+    report_checks(checks)
+
+
+# --- Model backends and hedging ---
+def skewed_latency(median, tail_share, tail_factor, seed):
+    """Latency sampler: lognormal around median, with tail_share of requests about tail_factor times slower"""
+    rng = random.Random(seed)
+
+    def sample():
+        seconds = median * rng.lognormvariate(0, 0.25)
+        if rng.random() < tail_share:
+            seconds *= tail_factor * (0.5 + rng.random())
+        return seconds
+    return sample
+
+
+def bench_hedging(args):
+    """Tail latency and extra requests with hedging at p90, against stub backends with skewed latency"""
+    call = core_module.stream_generative_ai_api if args.streaming else app_module.call_generative_ai_api
+    configs = (
+        ("no hedging", False),
+        ("hedged on the same model", "same"),
+        ("hedged on a second model", "second"),
+    )
+    rows, checks, tails = [], [], {}
+    for label, hedging in configs:
+        # Same seeds for every configuration, so each sees the same latency draws
+        primary = core_module.StubBackend("primary", skewed_latency(args.median, args.tail_share, args.tail_factor, 1))
+        backends = [primary]
+        backend = primary
+        if hedging == "same":
+            backend = core_module.HedgedBackend(primary)
+        elif hedging == "second":
+            secondary = core_module.StubBackend("secondary", skewed_latency(args.median * 1.2, args.tail_share, args.tail_factor, 2))
+            backends.append(secondary)
+            backend = core_module.HedgedBackend(primary, secondary)
+        core_module._backend = backend
+
+        def ask(index):
+            started = time.perf_counter()
+            if args.streaming:
+                answer = call(f"Question {index}", lambda text: None)
+            else:
+                answer = call(f"Question {index}")
+            return (time.perf_counter() - started) * 1000, core_module.is_error_response(answer)
+
+        try:
+            with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+                list(pool.map(ask, range(args.warmup)))
+                before = Counter()
+                for stub in backends:
+                    before.update(stub.snapshot())
+                hedge_before = backend.snapshot() if backend is not primary else {}
+                results = list(pool.map(ask, range(args.requests)))
+        finally:
+            core_module._backend = None
+        latencies = [ms for ms, _ in results]
+        errors = sum(1 for _, failed in results if failed)
+        after = Counter()
+        for stub in backends:
+            after.update(stub.snapshot())
+        sent, cancelled = after["requests"] - before["requests"], after["cancelled"] - before["cancelled"]
+        hedge = backend.snapshot() if backend is not primary else {}
+        hedged = hedge.get("hedged", 0) - hedge_before.get("hedged", 0)
+        wins = hedge.get("hedge_wins", 0) - hedge_before.get("hedge_wins", 0)
+        rows.append((label, f"p50 {percentile(latencies, 50):>5.0f}ms  p90 {percentile(latencies, 90):>5.0f}ms  "
+                            f"p99 {percentile(latencies, 99):>5.0f}ms  max {max(latencies):>5.0f}ms  errors {errors}"))
+        delay = hedge.get("stream_hedge_after_ms" if args.streaming else "generate_hedge_after_ms")
+        rows.append(("", f"{sent / args.requests:.2f} requests per answer (+{(sent - args.requests) / args.requests:.0%}), "
+                         f"{hedged} hedged, {wins} won by the hedge, {cancelled} cancelled"
+                         + (f", hedge after {delay:.0f}ms" if delay else "")))
+        tails[hedging] = percentile(latencies, 99)
+        if hedging:
+            # A window that lost its slow tail would hedge ever earlier and far more than 1 - percentile
+            expected = 1 - core_module.HEDGE_PERCENTILE / 100
+            checks.append((f"{label}: hedged at most {2 * expected:.0%} of requests", hedged <= 2 * expected * args.requests))
+            checks.append((f"{label}: p99 below no hedging", tails[hedging] < tails[False]))
+            checks.append((f"{label}: every request answered", errors == 0))
+
+    report(f"Hedging: {args.requests} {'streamed ' if args.streaming else ''}requests, {args.concurrency} at a time, "
+           f"median {args.median * 1000:.0f}ms, {args.tail_share:.0%} about {args.tail_factor:.0f}x slower", rows)
+    report_checks(checks)
+
+
+# --- Watch region ---
+def cpu_time():
+    """CPU seconds used by this process and its finished children (pytesseract runs tesseract as a child)"""
+    times = os.times()
+    return time.process_time() + times.children_user + times.children_system
+
+
+def ink_line_rows(gray, threshold=app_module.WATCH_PIXEL_THRESHOLD):
+    """(start, end) row runs containing ink, one per rendered line of text"""
+    background = int(numpy.median(gray[::4, ::4]))
+    ink = (numpy.abs(gray.astype(numpy.int16) - background) > threshold).any(axis=1)
+    edges = numpy.diff(numpy.concatenate(([0], ink.astype(numpy.int8), [0])))
+    return list(zip(numpy.flatnonzero(edges == 1), numpy.flatnonzero(edges == -1)))
+
+
+def watch_sequences(line_count, frames, width, seed=0):
+    """Synthetic frame sequences of a watched text pane, as lists of lines (None marks a jittered frame)"""
+    log = sample_lines(line_count + frames, seed=seed)
+    pane = log[:line_count]
+    return {
+        "idle": [pane] * (frames + 1),
+        "pixel jitter": [pane] + [None] * frames,
+        "one line edited": [pane[:-1] + [f"processed {index * 37} records with {index} warnings"]
+                            for index in range(frames + 1)],
+        "log scrolling": [log[index:index + line_count] for index in range(frames + 1)],
+    }
+
+
+def bench_watch(args):
+    """CPU per idle and per changed frame of watch mode vs OCRing every frame in full"""
+    global numpy
+    import numpy
+    get_app()
+    width = 900
+    sequences = watch_sequences(args.lines, args.frames, width)
+    rng = numpy.random.default_rng(0)
+
+    def render(lines, reference):
+        if lines is None:
+            # Same pane with every pixel nudged by less than the diff threshold, like dithering
+            pixels = numpy.asarray(reference, dtype=numpy.int16) + rng.integers(-8, 9, (reference.height, width, 3))
+            return Image.fromarray(numpy.clip(pixels, 0, 255).astype(numpy.uint8))
+        return render_text_image(lines, width=width)
+
+    if tesseract_available():
+        ocr_label = "tesseract"
+
+        def ocr(images):
+            return [app_module._read_band(image) for image in images]
+    else:
+        # Reads each rendered line back by its pixels, at a CPU cost per call and per megapixel
+        ocr_label = f"stub {args.ocr_call_ms:.0f}ms/call + {args.ocr_ms_per_mp:.0f}ms/MP"
+        truth = {}
+        for lines in sequences.values():
+            for line in {line for frame in lines if frame for line in frame}:
+                gray = numpy.asarray(render_text_image([line], width=width).convert("L"))
+                (start, end), = ink_line_rows(gray)
+                truth[gray[start:end].tobytes()] = line
+
+        def ocr(images):
+            texts = []
+            for image in images:
+                deadline = time.process_time() + (args.ocr_call_ms + args.ocr_ms_per_mp * image.width * image.height / 1e6) / 1000
+                while time.process_time() < deadline:
+                    pass
+                gray = numpy.asarray(image.convert("L"))
+                texts.append("\n".join(truth.get(gray[start:end].tobytes(), "?") for start, end in ink_line_rows(gray)))
+            return texts
+
+    rows = []
+    for name, frames in sequences.items():
+        images = []
+        for lines in frames:
+            images.append(render(lines, images[0] if images else None))
+
+        reader = app_module.IncrementalOcr(ocr=ocr)
+        watcher = app_module.RegionWatcher(QRect(0, 0, width, images[0].height), reader=reader, min_query_seconds=0)
+        queries = []
+        watcher.textChanged.connect(lambda text, changes: queries.append(changes))
+        # The first frame is read in full either way; only the frames after it are measured
+        watcher._report(reader.update(images[0]))
+        first = Counter(reader.stats)
+        incremental, full = [], []
+        for image in images[1:]:
+            started = cpu_time()
+            watcher._report(reader.update(image))
+            incremental.append((cpu_time() - started) * 1000)
+        for image in images[1:]:
+            started = cpu_time()
+            ocr([image])
+            full.append((cpu_time() - started) * 1000)
+
+        stats = reader.stats - first
+        text_changes = sum(1 for before, after in zip(frames, frames[1:]) if after is not None and after != before)
+        mean_incremental = sum(incremental) / len(incremental)
+        mean_full = sum(full) / len(full)
+        rows.append((name, f"watch {mean_incremental:>7.2f}ms CPU/frame (p95 {percentile(incremental, 95):>7.2f})  "
+                           f"full re-OCR {mean_full:>7.2f}ms  ({mean_full / max(mean_incremental, 1e-3):.0f}x)"))
+        rows.append(("", f"{stats['idle_frames']} idle frames, {stats['bands_read']} bands re-read, "
+                         f"{stats['bands_cached']} from cache, {stats['bands_kept']} kept; "
+                         f"{len(queries) - 1} queries for {text_changes} text changes"))
+
+    report(f"Watch mode: {args.frames} frames of a {args.lines}-line pane, OCR {ocr_label}", rows)
+
+
+BENCHMARKS = {
+    "gui-latency": bench_gui_latency,
+    "http-client": bench_http_client,
+    "streaming": bench_streaming,
+    "cache": bench_cache,
+    "ocr": bench_ocr,
+    "tiled-ocr": bench_tiled_ocr,
+    "preprocess": bench_preprocess,
+    "selection": bench_selection,
+    "history": bench_history,
+    "history-store": bench_history_store,
+    "instance": bench_instance,
+    "native-host": bench_native_host,
+    "startup": bench_startup,
+    "burst": bench_burst,
+    "resilience": bench_resilience,
+    "batch": bench_batch,
+    "routing": bench_routing,
+    "long-text": bench_long_text,
+    "tracing": bench_tracing,
+    "suite": bench_suite,
+    "watch": bench_watch,
+    "hedging": bench_hedging,
+    "session": bench_session,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gemini Desktop Assistant benchmarks")
+    sub = parser.add_subparsers(dest="benchmark", required=True)
+
+    p = sub.add_parser("gui-latency", help="GUI event latency while captures are processed")
+    p.add_argument("--captures", type=int, default=8)
+    p.add_argument("--ocr-delay", type=float, default=0.2)
+    p.add_argument("--api-delay", type=float, default=1.0)
+
+    p = sub.add_parser("http-client", help="Cold vs pooled per-request latency over TLS")
+    p.add_argument("--requests", type=int, default=50)
+    p.add_argument("--latency", type=float, default=0.0)
+
+    p = sub.add_parser("streaming", help="Time-to-first-chunk vs total latency")
+    p.add_argument("--requests", type=int, default=10)
+    p.add_argument("--latency", type=float, default=0.2)
+    p.add_argument("--chunks", type=int, default=10)
+    p.add_argument("--chunk-delay", type=float, default=0.05)
+
+    p = sub.add_parser("cache", help="Response cache hit/miss latency")
+    p.add_argument("--prompts", type=int, default=200)
+
+    p = sub.add_parser("ocr", help="Per-capture OCR latency, file path vs in-memory engine")
+    p.add_argument("--lines", type=int, default=10)
+    p.add_argument("--repeat", type=int, default=10)
+
+    p = sub.add_parser("tiled-ocr", help="Tiled OCR speedup vs core count on a large image")
+    p.add_argument("--lines", type=int, default=100)
+    p.add_argument("--width", type=int, default=3840)
+    p.add_argument("--max-workers", type=int, default=0)
+
+    p = sub.add_parser("preprocess", help="Preprocessing step timing, OCR time and accuracy")
+    p.add_argument("--lines", type=int, default=20)
+
+    p = sub.add_parser("selection", help="Rubber-band frame time, full vs dirty-region repaint")
+    p.add_argument("--moves", type=int, default=200)
+    p.add_argument("--width", type=int, default=1920)
+    p.add_argument("--height", type=int, default=1080)
+
+    p = sub.add_parser("history", help="Per-append latency and RSS over a long session")
+    p.add_argument("--entries", type=int, default=10000)
+    p.add_argument("--legacy-entries", type=int, default=2000)
+
+    p = sub.add_parser("history-store", help="History insert throughput and search latency")
+    p.add_argument("--entries", type=int, default=100000)
+    p.add_argument("--repeat", type=int, default=5)
+
+    p = sub.add_parser("instance", help="Trigger latency, warm command forwarding vs cold restart")
+    p.add_argument("--cold", type=int, default=5)
+    p.add_argument("--warm", type=int, default=50)
+
+    p = sub.add_parser("native-host", help="Framed message round trip through the native host")
+    p.add_argument("--messages", type=int, default=300)
+
+    p = sub.add_parser("startup", help="Startup report: hotkeys ready and first answer, warm-up on/off")
+    p.add_argument("--repeat", type=int, default=5)
+    p.add_argument("--delay", type=float, default=1.0)
+    p.add_argument("--latency", type=float, default=0.0)
+
+    p = sub.add_parser("burst", help="Wasted API calls for a burst of capture triggers, latest-wins vs FIFO")
+    p.add_argument("--triggers", type=int, default=20)
+    p.add_argument("--distinct", type=int, default=5)
+    p.add_argument("--repeat-interval", type=float, default=0.04)
+    p.add_argument("--interval", type=float, default=0.4)
+    p.add_argument("--ocr-delay", type=float, default=0.1)
+    p.add_argument("--latency", type=float, default=1.0)
+
+    p = sub.add_parser("resilience", help="Retries, rate limiting and circuit breaker against injected 429/503s")
+    p.add_argument("--requests", type=int, default=30)
+    p.add_argument("--threads", type=int, default=6)
+    p.add_argument("--quota", type=int, default=5)
+    p.add_argument("--error-rate", type=float, default=0.3)
+    p.add_argument("--outage", type=float, default=1.5)
+    p.add_argument("--latency", type=float, default=0.02)
+
+    p = sub.add_parser("batch", help="Headless batch CLI throughput against the stub API, with resume")
+    p.add_argument("--images", type=int, default=64)
+    p.add_argument("--lines", type=int, default=12)
+    p.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    p.add_argument("--concurrency", type=int, default=8)
+    p.add_argument("--ocr-cpu", type=float, default=0.05)
+    p.add_argument("--latency", type=float, default=0.2)
+
+    p = sub.add_parser("routing", help="Payload bytes and end-to-end latency, OCR text vs image path")
+    p.add_argument("--lines", type=int, default=12)
+    p.add_argument("--repeat", type=int, default=5)
+    p.add_argument("--latency", type=float, default=0.3)
+    p.add_argument("--ms-per-kb", type=float, default=0.5)
+    p.add_argument("--ocr-ms-per-mp", type=float, default=400.0)
+
+    p = sub.add_parser("long-text", help="Chunked map-reduce vs one prompt for very long OCR text, with checks")
+    p.add_argument("--tokens", type=int, default=30000)
+    p.add_argument("--input-limit", type=int, default=8000)
+    p.add_argument("--ms-per-token", type=float, default=0.05)
+    p.add_argument("--latency", type=float, default=0.2)
+    p.add_argument("--concurrency", type=int, default=4)
+    p.add_argument("--rpm", type=int, default=600, help="Rate limit of the rate-limited run")
+    p.add_argument("--streaming", action="store_true")
+
+    p = sub.add_parser("tracing", help="Tracing overhead and per-stage p50/p95/p99 of a stub pipeline run")
+    p.add_argument("--traces", type=int, default=20000)
+    p.add_argument("--captures", type=int, default=40)
+    p.add_argument("--lines", type=int, default=10)
+    p.add_argument("--ocr-delay", type=float, default=0.05)
+    p.add_argument("--latency", type=float, default=0.1)
+
+    p = sub.add_parser("suite", help="Full-flow regression suite (selection to history view); fails on regressions")
+    p.add_argument("--captures", type=int, default=20)
+    p.add_argument("--warmup", type=int, default=3)
+    p.add_argument("--lines", type=int, default=12)
+    p.add_argument("--latency", type=float, default=0.15)
+    p.add_argument("--chunk-delay", type=float, default=0.02)
+    p.add_argument("--ocr-ms-per-mp", type=float, default=400.0)
+    p.add_argument("--tolerance", type=float, default=0.5, help="Allowed slowdown as a fraction of the baseline")
+    p.add_argument("--baseline", default=BASELINES_PATH)
+    p.add_argument("--update-baseline", action="store_true", help="Record this run as the new baseline")
+
+    p = sub.add_parser("watch", help="CPU per idle and per changed frame in watch mode vs full re-OCR of every frame")
+    p.add_argument("--frames", type=int, default=30)
+    p.add_argument("--lines", type=int, default=30)
+    p.add_argument("--ocr-call-ms", type=float, default=5.0)
+    p.add_argument("--ocr-ms-per-mp", type=float, default=400.0)
+
+    p = sub.add_parser("hedging", help="Tail latency and extra requests with hedged requests, against stub backends")
+    p.add_argument("--requests", type=int, default=400)
+    p.add_argument("--warmup", type=int, default=50)
+    p.add_argument("--concurrency", type=int, default=8)
+    p.add_argument("--median", type=float, default=0.2, help="Median backend latency in seconds")
+    p.add_argument("--tail-share", type=float, default=0.05, help="Share of requests in the slow tail")
+    p.add_argument("--tail-factor", type=float, default=8.0, help="How much slower tail requests are")
+    p.add_argument("--streaming", action="store_true")
+
+    p = sub.add_parser("session", help="Payload size and latency over a long follow-up session, with checks")
+    p.add_argument("--turns", type=int, default=50)
+    p.add_argument("--budget", type=int, default=core_module.SESSION_TOKEN_BUDGET)
+    p.add_argument("--capture-lines", type=int, default=20)
+    p.add_argument("--latency", type=float, default=0.1)
+    p.add_argument("--ms-per-token", type=float, default=0.05)
+    p.add_argument("--streaming", action="store_true")
+
+    args = parser.parse_args()
+    BENCHMARKS[args.benchmark](args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,30 +1,68 @@
-// This script listens for a command or message to launch the native host
+// This script keeps one long-lived connection to the native host and forwards
+// commands to it. The host stays running while the port is open, so each
+// trigger is a message on an existing pipe instead of a new host process.
+let nativePort = null;
+let nextRequestId = 1;
+const pendingRequests = new Map();
+
+function getNativePort() {
+  if (nativePort) {
+    return nativePort;
+  }
+  nativePort = chrome.runtime.connectNative('com.gemini.assistant');
+  nativePort.onMessage.addListener((response) => {
+    console.log("Received response from native host:", response);
+    const callback = pendingRequests.get(response.id);
+    if (callback) {
+      pendingRequests.delete(response.id);
+      callback(response);
+    }
+  });
+  nativePort.onDisconnect.addListener(() => {
+    const error = chrome.runtime.lastError ? chrome.runtime.lastError.message : "Native host disconnected";
+    console.error("Native host disconnected:", error);
+    nativePort = null;
+    for (const callback of pendingRequests.values()) {
+      callback({ status: "error", message: error });
+    }
+    pendingRequests.clear();
+  });
+  return nativePort;
+}
+
+function sendToHost(message, callback) {
+  const id = nextRequestId++;
+  if (callback) {
+    pendingRequests.set(id, callback);
+  }
+  try {
+    getNativePort().postMessage({ ...message, id });
+  } catch (error) {
+    console.error("Failed to send message to native host:", error);
+    pendingRequests.delete(id);
+    nativePort = null;
+    if (callback) {
+      callback({ status: "error", message: String(error) });
+    }
+  }
+}
+
+function triggerAssistant(callback) {
+  sendToHost({ action: "trigger_assistant" }, callback);
+}
+
 chrome.commands.onCommand.addListener((command) => {
   if (command === "launch_assistant") {
-    console.log("Hot key command received. Launching assistant...");
-    
-    // Send a one-time message to the native host
-    try {
-      chrome.runtime.sendNativeMessage(
-        'com.gemini.assistant',
-        { action: "trigger_assistant" },
-        (response) => {
-          if (chrome.runtime.lastError) {
-            console.error("Error sending message to native host:", chrome.runtime.lastError.message);
-          }
-          console.log("Received response from native host:", response);
-        }
-      );
-    } catch (error) {
-      console.error("Failed to send message to native host:", error);
-    }
+    console.log("Hot key command received. Triggering assistant...");
+    triggerAssistant();
   }
 });
 
-// A listener for messages from the old popup.js (if you still have it)
+// Messages from popup.js
 chrome.runtime.onMessage.addListener((message, sender, sendResponse) => {
     if (message.action === "activate") {
-        console.log("Popup message received. Launching assistant.");
-        chrome.commands.onCommand.dispatch("launch_assistant");
+        console.log("Popup message received. Triggering assistant.");
+        triggerAssistant(sendResponse);
+        return true;  // sendResponse is called asynchronously
     }
-});
\ No newline at end of file
+});
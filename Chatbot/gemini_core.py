@@ -0,0 +1,2210 @@
+# gemini_core.py - OCR, preprocessing and the Gemini client, without Qt
+#
+# Everything the assistant does that needs no GUI: OCR and its preprocessing,
+# capture routing, the Gemini client and backends, long text, follow-up
+# sessions, the response cache and latency tracing. gemini_desktop_app.py
+# builds the GUI on top of it; batch_ocr.py and its OCR worker processes
+# import only this module, so they run where PyQt6 is not installed.
+
+import os
+import time
+_startup_started = time.perf_counter()  # Baseline for the startup report
+import threading
+import queue
+import io
+import re
+import json
+import base64
+import sqlite3
+import hashlib
+import difflib
+import random
+import ctypes
+import atexit
+import email.utils
+import http.client
+import importlib
+import importlib.util
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from collections import OrderedDict, Counter, deque
+from dotenv import load_dotenv
+
+# --- Startup Timing and Lazy Imports ---
+STARTUP_REPORT = os.getenv("GEMINI_STARTUP_REPORT", "0") == "1"
+_startup_marks = []  # (seconds since start, label, thread name)
+_startup_lock = threading.Lock()
+
+def mark_startup(label, duration=None):
+    """Record a startup milestone (or a timed step when duration is given)"""
+    elapsed = time.perf_counter() - _startup_started
+    with _startup_lock:
+        _startup_marks.append((elapsed, label, duration, threading.current_thread().name))
+
+def startup_report():
+    """Format the recorded milestones like `python -X importtime` output"""
+    lines = ["startup: elapsed [ms] | step [ms] | thread | milestone"]
+    with _startup_lock:
+        marks = sorted(_startup_marks)
+    for elapsed, label, duration, thread in marks:
+        step = f"{duration * 1000:9.1f}" if duration is not None else " " * 9
+        lines.append(f"startup: {elapsed * 1000:12.1f} | {step} | {thread:<10} | {label}")
+    return "\n".join(lines)
+
+class LazyModule:
+    """Stand-in for a module that is imported on first attribute access.
+
+    Keeps heavy dependencies off the start-up path; whichever thread touches
+    the module first (usually the warm-up thread) pays for the import.
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if self._module is None:
+                started = time.perf_counter()
+                self._module = importlib.import_module(self._name)
+                mark_startup(f"import {self._name}", time.perf_counter() - started)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._module or self._load(), attr)
+
+    def __setattr__(self, attr, value):
+        if attr.startswith("_"):
+            object.__setattr__(self, attr, value)
+        else:
+            setattr(self._module or self._load(), attr, value)
+
+def lazy_import(name, optional=False):
+    """LazyModule for name; optional modules that are not installed give None"""
+    if optional:
+        try:
+            if importlib.util.find_spec(name) is None:
+                return None
+        except (ImportError, ValueError):
+            return None
+    return LazyModule(name)
+
+Image = lazy_import("PIL.Image")
+requests = lazy_import("requests")
+pytesseract = lazy_import("pytesseract")
+httpx = lazy_import("httpx", optional=True)  # Optional: enables HTTP/2 when installed with the http2 extra
+np = lazy_import("numpy", optional=True)  # Optional: vectorized image preprocessing before OCR
+tesserocr = lazy_import("tesserocr", optional=True)  # Optional: in-process Tesseract, language data loaded once
+
+# Load environment variables
+load_dotenv()
+
+# --- Configuration ---
+# API Configuration
+GEMINI_MODEL = "gemini-1.5-flash"
+GEMINI_MODEL_URL = "https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent"
+GEMINI_API_BASE_URL = os.getenv("GEMINI_API_BASE_URL", GEMINI_MODEL_URL.format(model=GEMINI_MODEL))
+# Comma-separated model names, generateContent URLs or "stub"; the first answers every request, the second takes hedged requests
+GEMINI_BACKENDS = [spec.strip() for spec in os.getenv("GEMINI_BACKENDS", "").split(",") if spec.strip()] or [GEMINI_API_BASE_URL]
+GENERATION_CONFIG = {"responseMimeType": "text/plain"}
+API_KEY = os.getenv("GEMINI_API_KEY")
+
+# OCR configuration
+TESSERACT_CMD = os.getenv("TESSERACT_CMD", r'C:\Program Files\Tesseract-OCR\tesseract.exe')
+OCR_LANGUAGE = os.getenv("OCR_LANGUAGE", "eng")
+TESSERACT_LIBRARY = os.getenv("TESSERACT_LIBRARY", "")  # libtesseract to load without tesserocr; found next to TESSERACT_CMD when empty
+OCR_TILED = os.getenv("OCR_TILED", "1") == "1"  # Split large selections across CPU cores
+OCR_TILE_THRESHOLD_PIXELS = 2_000_000  # Selections larger than ~1080p are tiled
+OCR_TILE_MIN_HEIGHT = 200  # Never cut tiles thinner than this
+OCR_TILE_OVERLAP = 40  # Pixels shared by neighbouring tiles when no blank row is found
+OCR_TILE_WORKERS = os.cpu_count() or 1
+
+# OCR preprocessing configuration (requires numpy)
+OCR_PREPROCESS = os.getenv("OCR_PREPROCESS", "1") == "1"
+PREPROCESS_STEPS = ("grayscale", "invert", "rescale", "binarize")
+OCR_TARGET_TEXT_HEIGHT = 32  # Pixels per line of ink; Tesseract is most accurate around 30px
+OCR_SCALE_LIMITS = (0.5, 2.5)
+OCR_MAX_SCALED_PIXELS = 6_000_000  # Rescaling never enlarges a selection beyond this; ~3x a 1080p screen
+OCR_MAX_TEXT_HEIGHT_FRACTION = 0.25  # Ink runs taller than this share of the image are not text lines; rescaling is skipped
+BINARIZE_WINDOW = 31  # Neighbourhood size for the local threshold, in pixels (odd)
+BINARIZE_OFFSET = 10  # How much darker than its neighbourhood a pixel must be to count as ink
+
+# Capture routing configuration: send Gemini the OCR text or the image itself
+ROUTING_MODE = os.getenv("GEMINI_ROUTING", "auto")  # "auto", "ocr" (always text) or "image" (always the image)
+IMAGE_PROMPT = "Answer the question or explain the content shown in this screenshot."
+ROUTE_PICTURE_COLOURS = 500  # Distinct colours (at 5 bits per channel) above which a selection is a photo; OCR is skipped
+ROUTE_SPARSE_INK = 0.015  # Ink edges per pixel below which a selection is a diagram or picture; OCR is skipped
+ROUTE_DENSE_INK = 0.03  # Above this it is clearly text; in between, the faster path (by observed latency) wins
+ROUTE_MIN_CONFIDENCE = 60  # Mean Tesseract word confidence (0-100) below which the image is sent instead
+ROUTE_MIN_CHARS_PER_KPX = 0.1  # OCR characters per 1000 pixels below which text is too sparse to stand alone
+ROUTE_LATENCY_SMOOTHING = 0.3  # Weight of the newest sample in the per-path latency averages
+
+# Long text configuration: OCR text beyond MAX_PROMPT_TOKENS is answered in chunks, then merged
+MAX_PROMPT_TOKENS = int(os.getenv("GEMINI_MAX_PROMPT_TOKENS", "6000"))
+CHUNK_TOKENS = 2000  # Target size of each chunk; whole paragraphs are kept together where they fit
+CHARS_PER_TOKEN = 4  # Rough size of a token in English text
+CHUNK_CONCURRENCY = 4  # Most chunk requests in flight per capture; cut to what the backend can send at once (fan_out)
+PIPELINE_API_WORKERS = 2  # Concurrent Gemini requests in flight
+CHUNK_PROMPT = ("This is part {index} of {count} of a longer text captured from the screen. "
+                "Answer any questions and explain the content in this part only.\n\n{text}")
+REDUCE_PROMPT = ("A long text captured from the screen was answered in {count} parts. "
+                 "Merge these partial answers into one coherent answer, without repeating yourself:\n\n{answers}")
+
+# Follow-up conversation configuration
+SESSION_TOKEN_BUDGET = int(os.getenv("GEMINI_SESSION_TOKENS", "4000"))  # Earlier turns sent with a follow-up; older ones are summarized
+SESSION_TURN_TOKENS = 1500  # A captured question is cut to this many tokens when it becomes context
+SESSION_SUMMARY_WORDS = 200
+SUMMARY_PROMPT = ("Update the summary of a conversation between a user and an assistant with the new turns below. "
+                  "Keep every fact, name, number and open question a follow-up might refer to, in at most {words} words. "
+                  "Reply with the summary only.\n\nSummary so far:\n{summary}\n\nNew turns:\n{turns}")
+SESSION_SYSTEM_PROMPT = "Summary of the earlier conversation with this user:\n{summary}"
+
+# Image encoding configuration for captures sent as images
+IMAGE_FORMAT = os.getenv("GEMINI_IMAGE_FORMAT", "webp")  # "webp" or "jpeg"; JPEG is used if Pillow lacks WebP
+IMAGE_TILE_SIZE = 768  # Gemini bills images in tiles of this many pixels square...
+IMAGE_TILE_TOKENS = 258  # ...at this many tokens each
+IMAGE_TOKEN_BUDGET = 4 * IMAGE_TILE_TOKENS  # Larger selections are downscaled to fit
+IMAGE_MAX_BYTES = 150_000  # Quality is lowered, then the image shrunk, until it encodes below this
+IMAGE_QUALITY_STEPS = (85, 70, 55, 40)
+IMAGE_LOSSLESS_COLOURS = 256  # Flat screenshots with at most this many colours try lossless WebP first; it is far smaller for text
+
+# HTTP client configuration
+HTTP_POOL_SIZE = 4  # Keep-alive connections kept open to the API host
+HTTP_TIMEOUT = 30  # Seconds
+USE_HTTP2 = os.getenv("GEMINI_HTTP2", "0") == "1"  # Requires: pip install httpx[http2]
+USE_STREAMING = os.getenv("GEMINI_STREAMING", "1") == "1"  # Render answers as they are generated
+
+# Rate limiting and retry configuration
+RATE_LIMIT_PER_MINUTE = int(os.getenv("GEMINI_RPM", "12"))  # Sustained requests per minute; 0 disables
+RATE_LIMIT_BURST = int(os.getenv("GEMINI_RPM_BURST", "3"))  # Requests that may go out back to back, and so the long-text fan-out; 12/min + 3 stays within the free tier's 15 RPM
+MAX_CONCURRENT_REQUESTS = HTTP_POOL_SIZE
+RETRY_MAX_ATTEMPTS = 4  # Including the first try
+RETRY_BASE_DELAY = 0.5  # Seconds; doubles per attempt, with full jitter
+RETRY_MAX_DELAY = 20.0
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+BREAKER_FAILURE_THRESHOLD = 5  # Consecutive server failures before failing fast
+BREAKER_RESET_SECONDS = 30.0  # How long to fail fast before letting a trial request through
+
+# Request hedging: a request slower than usual is sent again and the first answer wins; costs extra quota
+HEDGING_ENABLED = os.getenv("GEMINI_HEDGING", "0") == "1"
+HEDGE_PERCENTILE = 90  # Requests still unanswered at this percentile of recent latencies are hedged
+HEDGE_MIN_SAMPLES = 20  # Latencies observed before hedging starts
+HEDGE_WINDOW = 200  # Recent latencies the percentile is taken over
+
+# Response cache configuration
+CACHE_ENABLED = os.getenv("GEMINI_CACHE", "1") == "1"
+CACHE_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "response_cache.db")
+CACHE_MEMORY_ENTRIES = 128  # Hot answers kept in memory
+CACHE_DISK_ENTRIES = 5000  # Answers kept on disk before least-recently-used eviction
+CACHE_TTL_SECONDS = 7 * 24 * 3600
+
+# Latency tracing configuration: cheap enough to leave on
+TRACE_ENABLED = os.getenv("GEMINI_TRACE", "1") == "1"
+TRACE_WINDOW = 512  # Most recent samples per stage behind the rolling percentiles
+TRACE_JSONL_PATH = os.getenv("GEMINI_TRACE_FILE", "")  # One JSON line per finished capture; empty disables
+TRACE_PROMETHEUS_PATH = os.getenv("GEMINI_TRACE_PROM", "")  # Prometheus textfile collector file; empty disables
+TRACE_EXPORT_INTERVAL = 10.0  # Seconds between rewrites of the Prometheus file
+TRACE_STATUS_BREAKDOWN = os.getenv("GEMINI_TRACE_STATUS", "0") == "1"  # Show each answer's stage times in the status bar
+
+if not API_KEY:
+    print("Warning: GEMINI_API_KEY not found in environment variables or .env file.")
+
+# --- Helper Functions ---
+def find_libtesseract(tesseract_cmd=TESSERACT_CMD):
+    """Path of Tesseract's shared library: TESSERACT_LIBRARY, the one installed next to tesseract_cmd, or the system's"""
+    if TESSERACT_LIBRARY:
+        return TESSERACT_LIBRARY
+    folder = os.path.dirname(tesseract_cmd or "")
+    if os.path.isdir(folder):
+        # The Windows installer ships libtesseract-5.dll beside tesseract.exe
+        names = [name for name in os.listdir(folder) if name.lower().startswith("libtesseract")
+                 and name.lower().endswith((".dll", ".so", ".dylib"))]
+        if names:
+            return os.path.join(folder, max(names))
+    import ctypes.util
+    return ctypes.util.find_library("tesseract")
+
+class TesseractLibrary:
+    """Tesseract's C API through ctypes, for when tesserocr is not installed.
+
+    Offers the subset of tesserocr's PyTessBaseAPI that OcrEngine uses, backed
+    by the libtesseract that comes with Tesseract itself, so the engine stays
+    resident in-process with its language data loaded once.
+    """
+
+    def __init__(self, lang=OCR_LANGUAGE, path=None, tesseract_cmd=TESSERACT_CMD):
+        path = path or find_libtesseract(tesseract_cmd)
+        if not path:
+            raise OSError("libtesseract not found")
+        folder = os.path.dirname(path)
+        if folder and hasattr(os, "add_dll_directory"):
+            os.add_dll_directory(folder)  # Leptonica and the other DLLs it needs live alongside it
+        lib = ctypes.CDLL(path)
+        handle = ctypes.c_void_p
+        lib.TessVersion.restype = ctypes.c_char_p
+        lib.TessBaseAPICreate.restype = handle
+        lib.TessBaseAPIInit3.argtypes = (handle, ctypes.c_char_p, ctypes.c_char_p)
+        lib.TessBaseAPISetImage.argtypes = (handle, ctypes.c_char_p, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_int)
+        lib.TessBaseAPIGetUTF8Text.argtypes = (handle,)
+        lib.TessBaseAPIGetUTF8Text.restype = ctypes.c_void_p  # Owned by Tesseract until TessDeleteText
+        lib.TessDeleteText.argtypes = (ctypes.c_void_p,)
+        lib.TessBaseAPIMeanTextConf.argtypes = (handle,)
+        lib.TessBaseAPIEnd.argtypes = (handle,)
+        lib.TessBaseAPIDelete.argtypes = (handle,)
+        self.lib = lib
+        self.version = lib.TessVersion().decode()
+        self.handle = lib.TessBaseAPICreate()
+
+        # Without a data path the library looks beside the running executable, which is Python's
+        datapath = None
+        tessdata = os.path.join(os.path.dirname(tesseract_cmd or ""), "tessdata")
+        if not os.getenv("TESSDATA_PREFIX") and os.path.isdir(tessdata):
+            datapath = tessdata.encode()
+        if lib.TessBaseAPIInit3(self.handle, datapath, lang.encode()) != 0:
+            lib.TessBaseAPIDelete(self.handle)
+            raise OSError(f"libtesseract could not load the '{lang}' language data")
+        # Ending the engine before the library unloads keeps its shutdown free of leak warnings
+        atexit.register(self.End)
+
+    def SetImage(self, image):
+        if image.mode not in ("L", "RGB"):
+            image = image.convert("L")
+        channels = 1 if image.mode == "L" else 3
+        self.lib.TessBaseAPISetImage(self.handle, image.tobytes(), image.width, image.height,
+                                     channels, image.width * channels)
+
+    def SetImageFile(self, path):
+        with Image.open(path) as image:
+            self.SetImage(image.convert("RGB"))
+
+    def GetUTF8Text(self):
+        pointer = self.lib.TessBaseAPIGetUTF8Text(self.handle)
+        if not pointer:
+            return ""
+        try:
+            return ctypes.string_at(pointer).decode("utf-8", "replace")
+        finally:
+            self.lib.TessDeleteText(pointer)
+
+    def MeanTextConf(self):
+        return self.lib.TessBaseAPIMeanTextConf(self.handle)
+
+    def End(self):
+        if self.handle:
+            self.lib.TessBaseAPIEnd(self.handle)
+            self.lib.TessBaseAPIDelete(self.handle)
+            self.handle = None
+
+class OcrEngine:
+    """Long-lived Tesseract engine.
+
+    The engine stays resident in-process, so the language data is loaded
+    once instead of once per capture: through tesserocr when it is
+    installed, otherwise through the libtesseract that ships with
+    Tesseract. Only when neither loads does it fall back to pytesseract,
+    which starts a tesseract process for every image.
+    """
+
+    def __init__(self, lang=OCR_LANGUAGE, tesseract_cmd=TESSERACT_CMD):
+        self.lang = lang
+        self.lock = threading.Lock()  # A TessBaseAPI handles one image at a time
+        self.api = None
+        self.name = "pytesseract"
+        if tesserocr is not None:
+            try:
+                self.api = tesserocr.PyTessBaseAPI(lang=lang)
+                self.name = "tesserocr"
+                print(f"OCR engine: tesserocr {tesserocr.tesseract_version().splitlines()[0]}")
+                return
+            except Exception as e:
+                print(f"tesserocr unavailable: {e}")
+        try:
+            self.api = TesseractLibrary(lang, tesseract_cmd=tesseract_cmd)
+            self.name = "libtesseract"
+            print(f"OCR engine: libtesseract {self.api.version}")
+            return
+        except Exception as e:
+            print(f"libtesseract unavailable: {e}")
+        if tesseract_cmd and os.path.exists(tesseract_cmd):
+            pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+        print("OCR engine: pytesseract - every capture starts a tesseract process. "
+              "Install tesserocr or set TESSERACT_LIBRARY to libtesseract for a resident engine.")
+
+    def image_to_string(self, image):
+        """OCR a PIL image (or an image file path)"""
+        if self.api is None:
+            return pytesseract.image_to_string(image, lang=self.lang)
+        with self.lock:
+            if isinstance(image, str):
+                self.api.SetImageFile(image)
+            else:
+                self.api.SetImage(image)
+            return self.api.GetUTF8Text()
+
+    def recognize(self, image):
+        """OCR a PIL image; returns (text, mean word confidence 0-100, or None if there are no words)"""
+        if self.api is None:
+            data = pytesseract.image_to_data(image, lang=self.lang, output_type=pytesseract.Output.DICT)
+            lines, confidences = OrderedDict(), []
+            for index, word in enumerate(data["text"]):
+                if not word.strip():
+                    continue
+                line = (data["block_num"][index], data["par_num"][index], data["line_num"][index])
+                lines.setdefault(line, []).append(word)
+                confidence = float(data["conf"][index])
+                if confidence >= 0:
+                    confidences.append(confidence)
+            text = "\n".join(" ".join(words) for words in lines.values())
+            return text, (sum(confidences) / len(confidences) if confidences else None)
+        with self.lock:
+            self.api.SetImage(image)
+            text = self.api.GetUTF8Text()
+            return text, (float(self.api.MeanTextConf()) if text.strip() else None)
+
+    def warm_up(self):
+        """OCR a blank image so the engine and its language data are loaded before the first capture"""
+        self.image_to_string(Image.new("L", (64, 32), 255))
+
+    def close(self):
+        if self.api is not None:
+            with self.lock:
+                self.api.End()
+                self.api = None
+
+_ocr_engine = None
+_ocr_engine_lock = threading.Lock()
+
+def get_ocr_engine():
+    """Return the shared OcrEngine, creating it on first use"""
+    global _ocr_engine
+    with _ocr_engine_lock:
+        if _ocr_engine is None:
+            _ocr_engine = OcrEngine()
+        return _ocr_engine
+
+# --- OCR Preprocessing ---
+class ImagePreprocessor:
+    """Vectorized cleanup of a screen crop before OCR.
+
+    Steps: grayscale conversion, then optionally inversion of dark themes,
+    rescaling so text lines are near Tesseract's preferred height, and
+    adaptive (local mean) binarization. process() returns the image and the
+    time spent in each step.
+    """
+
+    def __init__(self, steps=PREPROCESS_STEPS, target_text_height=OCR_TARGET_TEXT_HEIGHT,
+                 scale_limits=OCR_SCALE_LIMITS, max_text_fraction=OCR_MAX_TEXT_HEIGHT_FRACTION,
+                 max_pixels=OCR_MAX_SCALED_PIXELS, window=BINARIZE_WINDOW, offset=BINARIZE_OFFSET):
+        self.steps = tuple(steps)
+        self.target_text_height = target_text_height
+        self.scale_limits = scale_limits
+        self.max_pixels = max_pixels
+        self.max_text_fraction = max_text_fraction
+        self.window = window | 1
+        self.offset = offset
+
+    def process(self, image):
+        timings = {}
+        if not self.steps:
+            return image, timings
+
+        # Every step works on luminance, so grayscale always runs first
+        started = time.perf_counter()
+        rgb = np.asarray(image.convert("RGB"), dtype=np.float32)
+        gray = rgb @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+        timings["grayscale"] = time.perf_counter() - started
+
+        if "invert" in self.steps:
+            started = time.perf_counter()
+            if np.median(gray[::4, ::4]) < 128:
+                gray = 255.0 - gray  # Dark theme: make it dark text on a light background
+            timings["invert"] = time.perf_counter() - started
+
+        if "rescale" in self.steps:
+            started = time.perf_counter()
+            gray = self._rescale(gray)
+            timings["rescale"] = time.perf_counter() - started
+
+        if "binarize" in self.steps:
+            started = time.perf_counter()
+            gray = self._binarize(gray)
+            timings["binarize"] = time.perf_counter() - started
+
+        if gray.dtype != np.uint8:
+            gray = np.clip(gray, 0, 255).astype(np.uint8)
+        return Image.fromarray(gray), timings
+
+    def estimate_text_height(self, gray):
+        """Median height of the runs of rows that contain ink, or None if there is no (plausible) text"""
+        threshold = (float(gray.min()) + float(np.median(gray[::4, ::4]))) / 2
+        ink = gray < threshold
+        # Borders and scrollbars run through every row; they must not join all lines into one
+        ink = ink[:, ink.mean(axis=0) < 0.5]
+        edges = np.diff(np.concatenate(([0], ink.any(axis=1).astype(np.int8), [0])))
+        starts, ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+        if len(starts) == 0:
+            return None
+        text_height = float(np.median(ends - starts))
+        # A single line may fill a small crop, but in a larger one a run this tall is a picture or a panel
+        if text_height > max(self.max_text_fraction * gray.shape[0], self.target_text_height * 2):
+            return None
+        return text_height
+
+    def _rescale(self, gray):
+        text_height = self.estimate_text_height(gray)
+        if not text_height:
+            return gray
+        low, high = self.scale_limits
+        scale = min(high, max(low, self.target_text_height / text_height))
+        height, width = gray.shape
+        if scale > 1 and self.max_pixels:
+            # Enlarging a big selection costs more in memory and time than the smaller text loses
+            scale = max(1.0, min(scale, (self.max_pixels / (width * height)) ** 0.5))
+        if abs(scale - 1.0) < 0.1:
+            return gray
+        size = (max(1, int(width * scale)), max(1, int(height * scale)))
+        resized = Image.fromarray(gray.astype(np.uint8)).resize(size, Image.Resampling.LANCZOS)
+        return np.asarray(resized, dtype=np.float32)
+
+    def _binarize(self, gray):
+        """Local-mean threshold computed with an integral image"""
+        w = self.window
+        pixels = np.clip(gray, 0, 255).astype(np.int32)
+        integral = np.zeros((pixels.shape[0] + w, pixels.shape[1] + w), dtype=np.int32)
+        padded = np.pad(pixels, w // 2, mode="edge")
+        # int32 sums wrap past ~8M pixels, but window sums are differences and come out exact
+        np.cumsum(padded, axis=0, out=padded)
+        np.cumsum(padded, axis=1, out=integral[1:, 1:])
+        sums = integral[w:, w:] - integral[:-w, w:] - integral[w:, :-w] + integral[:-w, :-w]
+        # Compare against window sums directly to stay in integer arithmetic
+        is_background = pixels * (w * w) > sums - self.offset * (w * w)
+        return is_background.view(np.uint8) * np.uint8(255)
+
+_preprocessor = ImagePreprocessor() if np is not None else None
+
+def preprocess_image(image):
+    """Run the configured preprocessing steps; returns the image unchanged if disabled"""
+    if not OCR_PREPROCESS or _preprocessor is None:
+        return image
+    processed, timings = _preprocessor.process(image)
+    steps = ", ".join(f"{name} {seconds * 1000:.1f}ms" for name, seconds in timings.items())
+    print(f"Preprocessed {image.width}x{image.height} -> {processed.width}x{processed.height}: {steps}")
+    return processed
+
+def perform_ocr(image, with_confidence=False):
+    """Extracts text from a PIL image (or image file path) with the shared OCR engine.
+
+    With with_confidence, returns (text, mean word confidence) instead; the
+    confidence is None when it is unknown, as for tiled OCR.
+    """
+    confidence = None
+    try:
+        if OCR_TILED and not isinstance(image, str) and image.width * image.height >= OCR_TILE_THRESHOLD_PIXELS:
+            text = perform_tiled_ocr(image)
+        elif with_confidence and not isinstance(image, str):
+            text, confidence = get_ocr_engine().recognize(image)
+        else:
+            text = get_ocr_engine().image_to_string(image)
+        print(f"OCR extracted text: '{text.strip()}'")
+    except Exception as e:
+        print(f"Error during OCR: {e}")
+        text = None
+    return (text, confidence) if with_confidence else text
+
+# --- Tiled OCR ---
+_ocr_pool = None
+_ocr_pool_lock = threading.Lock()
+
+def _init_ocr_worker():
+    # Each process runs one single-threaded Tesseract; the pool provides the parallelism
+    os.environ["OMP_THREAD_LIMIT"] = "1"
+
+def _ocr_tile(tile):
+    return get_ocr_engine().image_to_string(tile)
+
+def get_ocr_pool():
+    """Return the shared OCR process pool, creating it on first use"""
+    global _ocr_pool
+    with _ocr_pool_lock:
+        if _ocr_pool is None:
+            _ocr_pool = ProcessPoolExecutor(max_workers=OCR_TILE_WORKERS, initializer=_init_ocr_worker)
+        return _ocr_pool
+
+def shutdown_ocr_pool():
+    global _ocr_pool
+    with _ocr_pool_lock:
+        if _ocr_pool is not None:
+            _ocr_pool.shutdown(wait=False, cancel_futures=True)
+            _ocr_pool = None
+
+def find_tile_bands(image, tile_count, min_height=OCR_TILE_MIN_HEIGHT, overlap=OCR_TILE_OVERLAP):
+    """Split an image into horizontal bands cut along blank rows between text lines.
+
+    Returns (top, bottom, overlapped) tuples in reading order. When no blank
+    row is close to a cut point the bands overlap instead, and overlapped is
+    True for the band whose top repeats the previous band's bottom.
+    """
+    height = image.height
+    tile_height = max(min_height, -(-height // max(1, tile_count)))
+    if height <= tile_height:
+        return [(0, height, False)]
+
+    # Per-row mean brightness; rows matching the background colour hold no text
+    row_means = list(image.convert("L").resize((1, height), Image.Resampling.BOX).getdata())
+    background = max(set(row_means), key=row_means.count)
+    blank = [abs(value - background) <= 2 for value in row_means]
+
+    bands = []
+    top = 0
+    overlapped = False
+    window = tile_height // 4
+    while top < height:
+        target = top + tile_height
+        if target >= height - min_height // 2:
+            bands.append((top, height, overlapped))
+            break
+        candidates = [y for y in range(max(top + min_height // 2, target - window), min(height, target + window))
+                      if blank[y]]
+        if candidates:
+            cut = min(candidates, key=lambda y: abs(y - target))
+            bands.append((top, cut, overlapped))
+            top, overlapped = cut, False
+        else:
+            bands.append((top, min(height, target + overlap), overlapped))
+            top, overlapped = max(top + 1, target - overlap), True
+    return bands
+
+def _similar_lines(a, b):
+    return difflib.SequenceMatcher(None, a.strip().lower(), b.strip().lower()).ratio() >= 0.8
+
+def merge_tile_texts(texts, overlapped, seam_lines=3):
+    """Join per-tile OCR text in order, dropping lines repeated across overlapping seams"""
+    merged = []
+    for text, has_overlap in zip(texts, overlapped):
+        lines = [line for line in text.splitlines() if line.strip()]
+        if has_overlap and merged:
+            tail_start = max(0, len(merged) - seam_lines)
+            drop = 0
+            for index, line in enumerate(lines[:seam_lines]):
+                for position in range(tail_start, len(merged)):
+                    if _similar_lines(line, merged[position]):
+                        # Keep the fuller copy; a seam can clip a line in either tile
+                        if len(line.strip()) > len(merged[position].strip()):
+                            merged[position] = line
+                        drop = index + 1
+                        break
+            lines = lines[drop:]
+        merged.extend(lines)
+    return "\n".join(merged)
+
+def perform_tiled_ocr(image, workers=None):
+    """OCR a large image as line-aligned bands in parallel and stitch the text back together"""
+    workers = workers or OCR_TILE_WORKERS
+    bands = find_tile_bands(image, workers)
+    tiles = [image.crop((0, top, image.width, bottom)) for top, bottom, _ in bands]
+    if len(tiles) == 1:
+        return get_ocr_engine().image_to_string(image)
+    print(f"Tiled OCR: {image.width}x{image.height} in {len(tiles)} bands")
+    texts = list(get_ocr_pool().map(_ocr_tile, tiles))
+    return merge_tile_texts(texts, [has_overlap for _, _, has_overlap in bands])
+
+# --- Capture Routing ---
+class EncodedImage:
+    """A capture compressed for sending inline to Gemini"""
+    __slots__ = ("data", "mime_type", "width", "height", "digest")
+
+    def __init__(self, data, mime_type, width, height):
+        self.data = data
+        self.mime_type = mime_type
+        self.width = width
+        self.height = height
+        self.digest = hashlib.sha256(data).hexdigest()
+
+    def inline_part(self):
+        return {"inlineData": {"mimeType": self.mime_type, "data": base64.b64encode(self.data).decode("ascii")}}
+
+    def token_count(self):
+        """Tokens Gemini bills for this image"""
+        tiles = -(-self.width // IMAGE_TILE_SIZE) * -(-self.height // IMAGE_TILE_SIZE)
+        return tiles * IMAGE_TILE_TOKENS
+
+    def describe(self):
+        kind = self.mime_type.split("/")[-1].upper()
+        return f"[Screenshot sent as image: {self.width}x{self.height} {kind}, {len(self.data) / 1024:.0f} KB]"
+
+def token_budget_scale(width, height, token_budget=IMAGE_TOKEN_BUDGET, tile_size=IMAGE_TILE_SIZE):
+    """Largest scale (at most 1) at which an image fits in token_budget worth of tiles"""
+    max_tiles = max(1, token_budget // IMAGE_TILE_TOKENS)
+    if -(-width // tile_size) * -(-height // tile_size) <= max_tiles:
+        return 1.0
+    best = 0.0
+    for columns in range(1, max_tiles + 1):
+        rows = max_tiles // columns
+        best = max(best, min(columns * tile_size / width, rows * tile_size / height))
+    return min(1.0, best)
+
+def colour_count(image):
+    """Distinct colours in a sample of the image, at 5 bits per channel; in the tens for text, hundreds+ for photos"""
+    if np is None:
+        return len(image.convert("RGB").resize((64, 64)).getcolors(64 * 64))
+    pixels = np.asarray(image.convert("RGB"), dtype=np.uint8)[::4, ::4] >> 3
+    return len(np.unique(pixels.reshape(-1, 3).astype(np.int32) @ np.array([1024, 32, 1], dtype=np.int32)))
+
+def encode_image_for_api(image, token_budget=IMAGE_TOKEN_BUDGET, max_bytes=IMAGE_MAX_BYTES, image_format=IMAGE_FORMAT):
+    """Downscale a PIL image to the token budget and compress it to WebP/JPEG below max_bytes"""
+    image = image.convert("RGB")
+    scale = token_budget_scale(image.width, image.height, token_budget)
+    if scale < 1.0:
+        size = (max(1, int(image.width * scale)), max(1, int(image.height * scale)))
+        image = image.resize(size, Image.Resampling.LANCZOS)
+
+    formats = ["WEBP", "JPEG"] if image_format.lower() == "webp" else ["JPEG"]
+    if formats[0] == "WEBP" and colour_count(image) <= IMAGE_LOSSLESS_COLOURS:
+        buffer = io.BytesIO()
+        try:
+            image.save(buffer, "WEBP", lossless=True, method=2)
+            if buffer.tell() <= max_bytes:
+                return EncodedImage(buffer.getvalue(), "image/webp", image.width, image.height)
+        except (KeyError, OSError) as e:
+            print(f"Lossless WebP encoding failed: {e}")
+    while True:
+        for quality in IMAGE_QUALITY_STEPS:
+            buffer = io.BytesIO()
+            try:
+                image.save(buffer, formats[0], quality=quality)
+            except (KeyError, OSError) as e:
+                if len(formats) == 1:
+                    raise
+                print(f"{formats[0]} encoding unavailable, using {formats[1]}: {e}")
+                formats.pop(0)
+                buffer = io.BytesIO()
+                image.save(buffer, formats[0], quality=quality)
+            if buffer.tell() <= max_bytes:
+                break
+        if buffer.tell() <= max_bytes or min(image.size) <= 64:
+            return EncodedImage(buffer.getvalue(), f"image/{formats[0].lower()}", image.width, image.height)
+        # Still too large at the lowest quality: shrink and start over
+        image = image.resize((max(1, int(image.width * 0.75)), max(1, int(image.height * 0.75))),
+                             Image.Resampling.LANCZOS)
+
+def ink_edge_density(image):
+    """Ink/background transitions per pixel along rows; high for text, low for diagrams and blank areas"""
+    gray = np.asarray(image.convert("L"), dtype=np.uint8)[::2]  # Every other row is plenty for a density
+    if gray.size == 0:
+        return 0.0
+    ink = gray < (int(gray.min()) + int(gray.max())) // 2
+    if ink.mean() > 0.5:
+        ink = ~ink  # Light text on a dark background
+    return np.count_nonzero(ink[:, 1:] != ink[:, :-1]) / ink.size
+
+class CaptureRouter:
+    """Decides per capture whether Gemini gets the OCR text or the image itself.
+
+    Before OCR, the colour count and ink edge density of the selection pick
+    out photos and diagrams, which skip Tesseract entirely. After OCR, low word
+    confidence or too few characters for the area send the image instead.
+    Selections that are neither clearly text nor clearly not go down
+    whichever path has been faster lately.
+    """
+
+    def __init__(self, mode=ROUTING_MODE, picture_colours=ROUTE_PICTURE_COLOURS,
+                 sparse_ink=ROUTE_SPARSE_INK, dense_ink=ROUTE_DENSE_INK,
+                 min_confidence=ROUTE_MIN_CONFIDENCE, min_chars_per_kpx=ROUTE_MIN_CHARS_PER_KPX,
+                 smoothing=ROUTE_LATENCY_SMOOTHING):
+        self.mode = mode
+        self.picture_colours = picture_colours
+        self.sparse_ink = sparse_ink
+        self.dense_ink = dense_ink
+        self.min_confidence = min_confidence
+        self.min_chars_per_kpx = min_chars_per_kpx
+        self.smoothing = smoothing
+        self.latency = {}  # "ocr" (seconds per megapixel), "encode", "text_api", "image_api" -> seconds
+        self.routes = Counter()  # (route, reason) -> captures
+        self.lock = threading.Lock()
+
+    def observe(self, name, seconds):
+        """Fold a measured duration into the running average for name"""
+        with self.lock:
+            previous = self.latency.get(name)
+            self.latency[name] = seconds if previous is None else previous + self.smoothing * (seconds - previous)
+
+    def observe_ocr(self, seconds, image):
+        self.observe("ocr", seconds / max(1e-6, image.width * image.height / 1e6))
+
+    def predicted_latency(self, route, image):
+        """Expected seconds to an answer down route, or None until both of its parts have been seen"""
+        with self.lock:
+            if route == "text":
+                parts = (self.latency.get("ocr"), self.latency.get("text_api"))
+                if None in parts:
+                    return None
+                return parts[0] * image.width * image.height / 1e6 + parts[1]
+            parts = (self.latency.get("encode"), self.latency.get("image_api"))
+            return None if None in parts else sum(parts)
+
+    def _decide(self, route, reason):
+        with self.lock:
+            self.routes[(route, reason)] += 1
+        return route, reason
+
+    def before_ocr(self, image):
+        """("text" or "image", reason) for a selection that has not been OCRed yet"""
+        if self.mode == "image":
+            return self._decide("image", "forced")
+        if self.mode == "ocr":
+            return "text", "forced"
+        if np is None:
+            return "text", "no estimate"
+        if colour_count(image) > self.picture_colours:
+            return self._decide("image", "picture")
+        density = ink_edge_density(image)
+        if density < self.sparse_ink:
+            return self._decide("image", "little text")
+        if density < self.dense_ink:
+            text_latency = self.predicted_latency("text", image)
+            image_latency = self.predicted_latency("image", image)
+            if text_latency is not None and image_latency is not None and image_latency < text_latency:
+                return self._decide("image", "faster")
+        return "text", "text"
+
+    def after_ocr(self, text, confidence, image):
+        """Final ("text" or "image", reason) once OCR has produced text and a confidence"""
+        if self.mode != "auto":
+            return self._decide("text" if self.mode == "ocr" else "image", "forced")
+        characters = len("".join((text or "").split()))
+        if not characters:
+            return self._decide("image", "no text found")
+        if confidence is not None and confidence < self.min_confidence:
+            return self._decide("image", "low OCR confidence")
+        if characters / max(1.0, image.width * image.height / 1000) < self.min_chars_per_kpx:
+            return self._decide("image", "sparse text")
+        return self._decide("text", "text")
+
+    def snapshot(self):
+        """Captures routed each way, by reason, and the latency averages"""
+        with self.lock:
+            return {"routes": {f"{route}/{reason}": count for (route, reason), count in self.routes.items()},
+                    "latency_ms": {name: round(seconds * 1000, 1) for name, seconds in self.latency.items()}}
+
+# --- Cancellation ---
+class CancelToken:
+    """Thread-safe cancellation flag that can also abort blocking I/O via callbacks"""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = []
+
+    def is_cancelled(self):
+        return self._event.is_set()
+
+    def cancel(self):
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"Cancel callback failed: {e}")
+
+    def on_cancel(self, callback):
+        """Run callback when cancelled (immediately if already cancelled)"""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def remove_callback(self, callback):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def wait(self, timeout):
+        """Sleep for up to timeout seconds; returns True if cancelled meanwhile"""
+        return self._event.wait(timeout)
+
+def sleep_unless_cancelled(seconds, cancel_token=None):
+    """Sleep, waking early on cancellation; returns False if cancelled"""
+    if cancel_token is None:
+        time.sleep(seconds)
+        return True
+    return not cancel_token.wait(seconds)
+
+# --- Rate Limiting, Retries and Circuit Breaker ---
+class GeminiUnavailableError(Exception):
+    """Raised instead of calling the API while the circuit breaker is open or the call was cancelled"""
+
+class TokenBucket:
+    """Thread-safe token bucket: rate requests per second, with up to capacity banked for bursts"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def pause(self, seconds):
+        """Hold every caller for seconds, e.g. when the server sends Retry-After"""
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.tokens = 0.0
+            self.updated = self.paused_until
+
+    def acquire(self, cancel_token=None):
+        """Block until a request may be sent; returns the seconds waited, or None if cancelled"""
+        started = time.monotonic()
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if now >= self.paused_until:
+                    if self.rate <= 0:
+                        return now - started
+                    self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return now - started
+                    delay = (1 - self.tokens) / self.rate
+                else:
+                    delay = self.paused_until - now
+            if not sleep_unless_cancelled(delay, cancel_token):
+                return None
+
+class CircuitBreaker:
+    """Fails fast after repeated server failures.
+
+    Closed: requests flow. Open: requests are rejected without touching the
+    network until reset_seconds pass. Half-open: one trial request decides
+    whether to close again or stay open for another period.
+    """
+
+    def __init__(self, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_seconds=BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+        self.opened_count = 0
+        self.lock = threading.Lock()
+
+    def before_request(self):
+        """Raise GeminiUnavailableError if the request should not be sent.
+
+        Returns True when the request is the half-open trial; the caller must
+        then end it with record_success, record_failure or record_neutral.
+        """
+        with self.lock:
+            if self.state == "open":
+                remaining = self.opened_at + self.reset_seconds - time.monotonic()
+                if remaining > 0:
+                    raise GeminiUnavailableError(f"Gemini API unavailable, retrying in {remaining:.0f}s")
+                self.state = "half-open"
+            if self.state == "half-open":
+                if self.trial_in_flight:
+                    raise GeminiUnavailableError("Gemini API unavailable, trial request in progress")
+                self.trial_in_flight = True
+                return True
+            return False
+
+    def record_neutral(self):
+        """End a trial that says nothing about the server (429, cancel, local error)"""
+        with self.lock:
+            self.trial_in_flight = False
+
+    def record_success(self):
+        with self.lock:
+            self.state = "closed"
+            self.failures = 0
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.trial_in_flight = False
+            if self.state == "half-open" or (self.state == "closed" and self.failures >= self.failure_threshold):
+                if self.state != "open":
+                    print(f"Circuit breaker open after {self.failures} failures")
+                    self.opened_count += 1
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+class ClientMetrics:
+    """Counters and recent queue waits for the Gemini client"""
+
+    def __init__(self, window=1000):
+        self.counters = dict.fromkeys(
+            ("requests", "attempts", "retries", "rate_limited", "server_errors", "transport_errors", "rejected",
+             "stale_connections"), 0)
+        self.queue_waits = deque(maxlen=window)  # Seconds spent waiting for a slot and a rate-limit token
+        self.lock = threading.Lock()
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.counters[name] += amount
+
+    def observe_wait(self, seconds):
+        with self.lock:
+            self.queue_waits.append(seconds)
+
+    def snapshot(self):
+        with self.lock:
+            waits = sorted(self.queue_waits)
+            result = dict(self.counters)
+        for pct in (50, 95, 99):
+            result[f"queue_wait_p{pct}_ms"] = waits[min(len(waits) - 1, int(len(waits) * pct / 100))] * 1000 if waits else 0.0
+        return result
+
+def is_stale_connection(error):
+    """True if error came from a pooled connection left unusable, not from the server"""
+    while isinstance(error, BaseException):
+        if isinstance(error, http.client.ImproperConnectionState):
+            return True
+        error = next((arg for arg in reversed(error.args) if isinstance(arg, BaseException)), None)
+    return False
+
+def retry_after_seconds(response):
+    """Delay requested by the server, from Retry-After or a Gemini RetryInfo error detail"""
+    header = response.headers.get("Retry-After")
+    if header:
+        try:
+            return max(0.0, float(header))
+        except ValueError:
+            try:
+                retry_at = email.utils.parsedate_to_datetime(header)
+                return max(0.0, retry_at.timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+    try:
+        for detail in response.json().get("error", {}).get("details", []):
+            delay = detail.get("retryDelay")
+            if delay and delay.endswith("s"):
+                return max(0.0, float(delay[:-1]))
+    except Exception:
+        pass
+    return None
+
+# --- Model Backends ---
+class ModelBackend:
+    """A model that answers generateContent payloads.
+
+    generate() returns the decoded JSON response and stream() yields the
+    streamed response events. Both raise one of request_errors when the
+    model can't be reached, and give up once cancel_token is cancelled.
+    """
+    name = "model"  # Also part of response cache keys, so answers from different models never mix
+    needs_api_key = False
+    cacheable = True  # Whether its answers may be stored in the response cache
+    request_errors = (GeminiUnavailableError,)
+
+    def generate(self, payload, cancel_token=None):
+        raise NotImplementedError
+
+    def stream(self, payload, cancel_token=None):
+        raise NotImplementedError
+
+    def fan_out(self, requested):
+        """How many of requested concurrent requests it can actually send at once"""
+        return max(1, requested)
+
+    def snapshot(self):
+        return {}
+
+    def close(self):
+        pass
+
+class StubBackend(ModelBackend):
+    """In-process model for tests and benchmarks: answers after a simulated latency, without a network.
+
+    latency is seconds, or a function returning the seconds for each request
+    so tests can draw from skewed distributions. A stream delivers the answer
+    in chunk_count pieces, the first one after the latency.
+    """
+    cacheable = False
+
+    def __init__(self, name="stub", latency=0.05, answer=None, chunk_count=3, chunk_delay=0.01):
+        self.name = name
+        self.latency = latency
+        self.answer = answer
+        self.chunk_count = max(1, chunk_count)
+        self.chunk_delay = chunk_delay
+        self.lock = threading.Lock()
+        self.counters = dict.fromkeys(("requests", "cancelled"), 0)
+
+    def _answer(self, payload, cancel_token):
+        with self.lock:
+            self.counters["requests"] += 1
+        delay = self.latency() if callable(self.latency) else self.latency
+        if not sleep_unless_cancelled(delay, cancel_token):
+            with self.lock:
+                self.counters["cancelled"] += 1
+            raise GeminiUnavailableError(f"{self.name}: request cancelled")
+        prompt = payload["contents"][-1]["parts"][-1].get("text", "")
+        return self.answer or f"Stub answer from {self.name} to: {prompt[:80]}"
+
+    def generate(self, payload, cancel_token=None):
+        return {"candidates": [{"content": {"parts": [{"text": self._answer(payload, cancel_token)}]}}]}
+
+    def stream(self, payload, cancel_token=None):
+        answer = self._answer(payload, cancel_token)
+        size = -(-len(answer) // self.chunk_count)
+        for start in range(0, len(answer), size):
+            if start and not sleep_unless_cancelled(self.chunk_delay, cancel_token):
+                return
+            yield {"candidates": [{"content": {"parts": [{"text": answer[start:start + size]}]}}]}
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.counters)
+
+class HedgedBackend(ModelBackend):
+    """Sends a request again when it is slower than usual, and keeps whichever answer arrives first.
+
+    The delay is the percentile-th percentile of the primary's recent latencies, censored when the hedge wins.
+    """
+
+    def __init__(self, primary, secondary=None, percentile=HEDGE_PERCENTILE,
+                 min_samples=HEDGE_MIN_SAMPLES, window=HEDGE_WINDOW):
+        self.primary = primary
+        self.secondary = secondary or primary
+        self.name = f"{primary.name}, hedged on {self.secondary.name}"
+        self.needs_api_key = primary.needs_api_key or self.secondary.needs_api_key
+        self.cacheable = primary.cacheable and self.secondary.cacheable
+        self.request_errors = tuple(dict.fromkeys(primary.request_errors + self.secondary.request_errors))
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.latencies = {"generate": deque(maxlen=window), "stream": deque(maxlen=window)}
+        self.lock = threading.Lock()
+        self.counters = dict.fromkeys(("requests", "hedged", "hedge_wins", "censored"), 0)
+
+    def _count(self, name):
+        with self.lock:
+            self.counters[name] += 1
+
+    def hedge_delay(self, kind):
+        """Seconds after which a request of kind ("generate" or "stream") is hedged, or None while warming up"""
+        with self.lock:
+            samples = sorted(self.latencies[kind])
+        if not samples or len(samples) < self.min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * self.percentile / 100))]
+
+    def _attempt(self, backend, kind, payload, token, index, results):
+        try:
+            if kind == "generate":
+                results.put((index, "done", backend.generate(payload, cancel_token=token)))
+            else:
+                for event in backend.stream(payload, cancel_token=token):
+                    results.put((index, "event", event))
+                results.put((index, "done", None))
+        except Exception as e:
+            results.put((index, "error", e))
+
+    def _race(self, kind, payload, cancel_token):
+        """Run the request, hedged if it is slow; yields ("event" | "done", value) from the winner only"""
+        results = queue.Queue()
+        tokens = []
+
+        def cancel_all():
+            for token in list(tokens):
+                token.cancel()
+
+        def launch(backend):
+            token = CancelToken()
+            tokens.append(token)
+            threading.Thread(target=self._attempt, args=(backend, kind, payload, token, len(tokens) - 1, results),
+                             name=f"hedge-{kind}", daemon=True).start()
+
+        self._count("requests")
+        delay = self.hedge_delay(kind)
+        if cancel_token:
+            cancel_token.on_cancel(cancel_all)
+        started = time.monotonic()
+        launch(self.primary)
+        try:
+            failures = {}
+            while True:
+                timeout = None
+                if delay is not None and len(tokens) == 1:
+                    timeout = max(0.0, started + delay - time.monotonic())
+                try:
+                    index, what, value = results.get(timeout=timeout)
+                except queue.Empty:
+                    if cancel_token and cancel_token.is_cancelled():
+                        delay = None
+                    else:
+                        self._count("hedged")
+                        launch(self.secondary)
+                    continue
+                if what == "error":
+                    failures[index] = value
+                    if len(failures) == len(tokens):
+                        raise failures[0] if 0 in failures else value
+                    continue
+                break
+
+            winner = index
+            for other, token in enumerate(tokens):
+                if other != winner:
+                    token.cancel()
+            # For a losing primary this is a lower bound on its latency, taken once it is cancelled
+            primary_latency = time.monotonic() - started
+            with self.lock:
+                if 0 not in failures:
+                    self.latencies[kind].append(primary_latency)
+                if winner:
+                    self.counters["hedge_wins"] += 1
+                    self.counters["censored"] += 0 not in failures
+            yield what, value
+            while what == "event":
+                index, what, value = results.get()
+                if index != winner:
+                    continue
+                if what == "error":
+                    raise value
+                yield what, value
+        finally:
+            if cancel_token:
+                cancel_token.remove_callback(cancel_all)
+            cancel_all()  # Abandoned part-way, e.g. by a consumer that stopped reading the stream
+
+    def generate(self, payload, cancel_token=None):
+        for _, value in self._race("generate", payload, cancel_token):
+            return value
+
+    def stream(self, payload, cancel_token=None):
+        for what, value in self._race("stream", payload, cancel_token):
+            if what == "event":
+                yield value
+
+    def fan_out(self, requested):
+        return min(self.primary.fan_out(requested), self.secondary.fan_out(requested))
+
+    def snapshot(self):
+        with self.lock:
+            result = dict(self.counters)
+        for kind in self.latencies:
+            delay = self.hedge_delay(kind)
+            result[f"{kind}_hedge_after_ms"] = round(delay * 1000, 1) if delay is not None else None
+        return result
+
+    def close(self):
+        self.primary.close()
+        if self.secondary is not self.primary:
+            self.secondary.close()
+
+# --- Gemini HTTP Client ---
+class GeminiClient(ModelBackend):
+    """Long-lived HTTP client for the Gemini API.
+
+    Keeps a pool of keep-alive connections so captures after the first one
+    skip DNS, TCP and TLS setup. Uses HTTP/2 through httpx when enabled and
+    available, otherwise a pooled requests.Session.
+
+    Every request passes a concurrency cap, a token-bucket rate limiter and a
+    circuit breaker, and 429/5xx responses or dropped connections are retried
+    with jittered exponential backoff (never sooner than Retry-After).
+    It is the ModelBackend for one model's generateContent endpoint.
+    """
+    needs_api_key = True
+
+    def __init__(self, api_key=API_KEY, base_url=GEMINI_API_BASE_URL,
+                 pool_size=HTTP_POOL_SIZE, timeout=HTTP_TIMEOUT, http2=USE_HTTP2, verify=True,
+                 rate_per_minute=RATE_LIMIT_PER_MINUTE, burst=RATE_LIMIT_BURST,
+                 max_concurrent=MAX_CONCURRENT_REQUESTS, max_attempts=RETRY_MAX_ATTEMPTS,
+                 breaker=None):
+        self.limiter = TokenBucket(rate_per_minute / 60.0, burst)
+        self.slots = threading.BoundedSemaphore(max_concurrent)
+        self.max_concurrent = max_concurrent
+        self.max_attempts = max(1, max_attempts)
+        self.breaker = breaker or CircuitBreaker()
+        self.metrics = ClientMetrics()
+        self.base_url = base_url
+        self.name = base_url.rsplit("/", 1)[-1].split(":", 1)[0]
+        self.stream_url = base_url.replace(":generateContent", ":streamGenerateContent")
+        self.timeout = timeout
+        self.headers = {"Content-Type": "application/json"}
+        self.params = {"key": api_key} if api_key else {}
+        self.http2 = bool(http2 and httpx is not None)
+
+        if self.http2:
+            try:
+                self.session = httpx.Client(
+                    http2=True,
+                    headers=self.headers,
+                    params=self.params,
+                    timeout=timeout,
+                    verify=verify,
+                    limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+                )
+                self.request_errors = (requests.exceptions.RequestException, httpx.HTTPError, GeminiUnavailableError)
+                self.transport_errors = (httpx.TransportError,)
+                return
+            except ImportError as e:
+                # httpx installed without the h2 package
+                print(f"HTTP/2 unavailable, falling back to HTTP/1.1: {e}")
+                self.http2 = False
+
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        self.session.params.update(self.params)
+        self.verify = verify  # Passed per request so REQUESTS_CA_BUNDLE can't override it
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.request_errors = (requests.exceptions.RequestException, GeminiUnavailableError)
+        self.transport_errors = (requests.exceptions.ConnectionError, requests.exceptions.Timeout)
+
+    def _send(self, url, payload, params=None, stream=False):
+        """Issue one POST and return the response without checking its status"""
+        if self.http2:
+            request = self.session.build_request("POST", url, json=payload, params=params)
+            return self.session.send(request, stream=stream)
+        return self.session.post(url, json=payload, params=params, stream=stream,
+                                 timeout=self.timeout, verify=self.verify)
+
+    def _send_fresh(self, url, payload, params=None, stream=False):
+        """_send, tried once more on a new connection if the pooled one was unusable"""
+        try:
+            return self._send(url, payload, params, stream)
+        except self.transport_errors as e:
+            if not is_stale_connection(e):
+                raise
+            # Says nothing about the server, so neither the breaker nor the retry budget is charged
+            self.metrics.count("stale_connections")
+            print(f"Pooled connection was unusable ({e}), retrying on a new one")
+            return self._send(url, payload, params, stream)
+
+    def _acquire_slot(self, cancel_token):
+        """Wait for a concurrency slot and a rate-limit token; returns False if cancelled"""
+        started = time.monotonic()
+        while not self.slots.acquire(timeout=0.1):
+            if cancel_token and cancel_token.is_cancelled():
+                return False
+        if self.limiter.acquire(cancel_token) is None:
+            self.slots.release()
+            return False
+        self.metrics.observe_wait(time.monotonic() - started)
+        return True
+
+    def _post(self, url, payload, params=None, stream=False, cancel_token=None):
+        """POST with rate limiting, retries and the circuit breaker.
+
+        Returns the final response while still holding its concurrency slot;
+        the caller must pass it to _release() once the body has been read.
+        """
+        self.metrics.count("requests")
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                trial = self.breaker.before_request()
+            except GeminiUnavailableError:
+                self.metrics.count("rejected")
+                raise
+            settled = False  # Whether the breaker has been told how this attempt went
+            try:
+                if not self._acquire_slot(cancel_token):
+                    raise GeminiUnavailableError("Cancelled while waiting to send the request")
+                self.metrics.count("attempts")
+                retry_after = None
+                try:
+                    response = self._send_fresh(url, payload, params, stream)
+                except self.transport_errors as e:
+                    self.slots.release()
+                    self.breaker.record_failure()
+                    settled = True
+                    self.metrics.count("transport_errors")
+                    if attempt == self.max_attempts or (cancel_token and cancel_token.is_cancelled()):
+                        raise
+                    print(f"API request failed ({e}), retrying")
+                except BaseException:
+                    self.slots.release()
+                    raise
+                else:
+                    status = response.status_code
+                    if status not in RETRY_STATUSES:
+                        self.breaker.record_success()
+                        settled = True
+                        return response
+                    if status == 429:
+                        # Quota exhausted: not a sign of an unhealthy backend, but everyone has to wait
+                        self.metrics.count("rate_limited")
+                        retry_after = retry_after_seconds(response)
+                        if retry_after:
+                            self.limiter.pause(retry_after)
+                    else:
+                        self.metrics.count("server_errors")
+                        self.breaker.record_failure()
+                        settled = True
+                        retry_after = retry_after_seconds(response)
+                    if attempt == self.max_attempts:
+                        return response
+                    self._release(response)
+                    print(f"API returned {status}, retrying (attempt {attempt + 1}/{self.max_attempts})")
+            finally:
+                if trial and not settled:
+                    # Otherwise the breaker would stay half-open with a trial that never ends
+                    self.breaker.record_neutral()
+
+            self.metrics.count("retries")
+            backoff = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** (attempt - 1)))
+            if not sleep_unless_cancelled(max(backoff, retry_after or 0.0), cancel_token):
+                raise GeminiUnavailableError("Cancelled while waiting to retry")
+
+    def _release(self, response):
+        response.close()
+        self.slots.release()
+
+    def _abort(self, response, guard):
+        """Unblock a body read in another thread, e.g. on cancel, by shutting its socket down.
+
+        The read then fails in the reading thread, which discards the
+        connection as it releases the response; only that thread hands it
+        back to the pool. It releases under guard, so an abort never reaches a
+        connection that is already serving another request.
+        """
+        with guard:
+            if self.http2:
+                response.close()  # httpx: closing the response ends its stream
+                return
+            try:
+                response.raw.shutdown()
+            except (ValueError, RuntimeError, OSError):
+                pass  # Already read to the end and released, or no socket to shut down
+
+    def post_json(self, payload, url=None, cancel_token=None):
+        """POST a JSON payload and return the decoded JSON response.
+
+        Cancelling the token aborts a body that is still being read, and its
+        connection is dropped rather than pooled.
+        """
+        response = self._post(url or self.base_url, payload, stream=cancel_token is not None,
+                              cancel_token=cancel_token)
+        guard = threading.Lock()
+        abort = lambda: self._abort(response, guard)
+        if cancel_token:
+            cancel_token.on_cancel(abort)
+        try:
+            response.raise_for_status()
+            if self.http2 and cancel_token is not None:
+                response.read()  # httpx needs a streamed body read before json()
+            return response.json()
+        finally:
+            if cancel_token:
+                cancel_token.remove_callback(abort)
+            with guard:
+                self._release(response)
+
+    def stream_events(self, payload, url=None, cancel_token=None):
+        """POST a payload to a streaming endpoint and yield each server-sent event as JSON.
+
+        Cancelling the token aborts the response, which also unblocks a read
+        that is waiting for the next chunk. Retries only happen before the
+        first event arrives.
+        """
+        response = self._post(url or self.stream_url, payload, params={"alt": "sse"}, stream=True,
+                              cancel_token=cancel_token)
+        guard = threading.Lock()
+        abort = lambda: self._abort(response, guard)
+        if cancel_token:
+            cancel_token.on_cancel(abort)
+        try:
+            response.raise_for_status()
+            if self.http2:
+                lines = response.iter_lines()
+            else:
+                lines = response.iter_lines(decode_unicode=True)
+            yield from self._iter_sse(lines, cancel_token)
+        finally:
+            if cancel_token:
+                cancel_token.remove_callback(abort)
+            with guard:
+                self._release(response)
+
+    def generate(self, payload, cancel_token=None):
+        return self.post_json(payload, cancel_token=cancel_token)
+
+    def stream(self, payload, cancel_token=None):
+        return self.stream_events(payload, cancel_token=cancel_token)
+
+    def metrics_snapshot(self):
+        """Request, retry and queue-wait metrics plus the circuit breaker state"""
+        snapshot = self.metrics.snapshot()
+        snapshot["breaker_state"] = self.breaker.state
+        snapshot["breaker_opened"] = self.breaker.opened_count
+        return snapshot
+
+    def _iter_sse(self, lines, cancel_token):
+        data_lines = []
+        try:
+            for line in lines:
+                if cancel_token and cancel_token.is_cancelled():
+                    return
+                if line:
+                    if line.startswith("data:"):
+                        data_lines.append(line[5:].strip())
+                    continue
+                # A blank line terminates one event
+                if data_lines:
+                    yield json.loads("\n".join(data_lines))
+                    data_lines = []
+            if data_lines:
+                yield json.loads("\n".join(data_lines))
+        except Exception:
+            # Reads fail once the response is aborted underneath us
+            if cancel_token and cancel_token.is_cancelled():
+                return
+            raise
+
+    def warm_up(self):
+        """Open a pooled connection to the API host so the first capture skips the handshake"""
+        started = time.perf_counter()
+        try:
+            if self.http2:
+                self.session.head(self.base_url)
+            else:
+                self.session.head(self.base_url, timeout=self.timeout, verify=self.verify)
+            print(f"API connection warmed up in {(time.perf_counter() - started) * 1000:.0f} ms")
+            return True
+        except Exception as e:
+            # Any HTTP status is fine here - only the connection matters
+            print(f"API warm-up failed: {e}")
+            return False
+
+    def fan_out(self, requested):
+        """Requests beyond the concurrency cap or the rate limiter's burst would only queue behind it"""
+        cap = min(requested, self.max_concurrent)
+        if self.limiter.rate > 0:
+            cap = min(cap, int(self.limiter.capacity))
+        return max(1, cap)
+
+    def close(self):
+        self.session.close()
+
+_gemini_client = None
+_gemini_client_lock = threading.Lock()
+
+def get_gemini_client():
+    """Return the shared GeminiClient, creating it on first use"""
+    global _gemini_client
+    with _gemini_client_lock:
+        if _gemini_client is None:
+            _gemini_client = GeminiClient()
+        return _gemini_client
+
+def make_backend(spec):
+    """Backend for one GEMINI_BACKENDS entry: "stub", a generateContent URL or a model name"""
+    if spec == "stub":
+        return StubBackend()
+    url = spec if spec.startswith(("http://", "https://")) else GEMINI_MODEL_URL.format(model=spec)
+    # The default endpoint is the shared client, so warm-up and status metrics cover it
+    return get_gemini_client() if url == GEMINI_API_BASE_URL else GeminiClient(base_url=url)
+
+def configure_backends(specs, hedging=HEDGING_ENABLED):
+    """The backend for specs: the first one, hedged on the second (or itself) when hedging is on"""
+    backends = [make_backend(spec) for spec in specs[:2]]
+    if hedging:
+        return HedgedBackend(backends[0], backends[1] if len(backends) > 1 else None)
+    return backends[0]
+
+_backend = None  # Set when GEMINI_BACKENDS or hedging replace the plain shared client
+_backend_lock = threading.Lock()
+
+def get_backend():
+    """Return the backend API calls go to, configuring it on first use"""
+    global _backend
+    with _backend_lock:
+        if _backend is None and (HEDGING_ENABLED or GEMINI_BACKENDS != [GEMINI_API_BASE_URL]):
+            _backend = configure_backends(GEMINI_BACKENDS)
+        backend = _backend
+    return backend or get_gemini_client()
+
+def build_payload(prompt, image=None, session=None):
+    """generateContent request body for prompt, with an EncodedImage sent inline before it.
+
+    With a ConversationSession, its earlier turns come first and its summary
+    is sent as the system instruction.
+    """
+    parts = [image.inline_part()] if image is not None else []
+    parts.append({"text": prompt})
+    payload = {"contents": [{"parts": parts}], "generationConfig": GENERATION_CONFIG}
+    if session is not None:
+        history, summary = session.history()
+        payload["contents"] = history + [{"role": "user", "parts": parts}]
+        if summary:
+            payload["systemInstruction"] = {"parts": [{"text": SESSION_SYSTEM_PROMPT.format(summary=summary)}]}
+    return payload
+
+def call_generative_ai_api(prompt, cancel_token=None, image=None, session=None):
+    """Calls the Generative AI API with the given prompt (and optional EncodedImage).
+
+    With a session the prompt continues its conversation, and the answered
+    turn is added to it.
+    """
+    backend = get_backend()
+    if backend.needs_api_key and not API_KEY:
+        return "Error: API Key not configured for Generative AI."
+
+    payload = build_payload(prompt, image, session)
+
+    print(f"\nCalling Generative AI with prompt: '{prompt}'")
+    try:
+        json_response = backend.generate(payload, cancel_token=cancel_token)
+        if cancel_token and cancel_token.is_cancelled():
+            return "[Cancelled]"
+
+        if json_response and json_response.get('candidates'):
+            first_candidate = json_response['candidates'][0]
+            if first_candidate.get('content') and first_candidate['content'].get('parts'):
+                first_part = first_candidate['content']['parts'][0]
+                if first_part.get('text'):
+                    ai_response = first_part['text']
+                    print(f"AI Response: {ai_response.strip()}")
+                    if session is not None:
+                        session.record(prompt, ai_response.strip(), image, json_response.get('usageMetadata'))
+                    return ai_response.strip()
+        
+        print("AI response structure unexpected:", json_response)
+        return "Error: Could not parse AI response."
+
+    except Exception as e:
+        if cancel_token and cancel_token.is_cancelled():
+            # Closing the response underneath a read surfaces as an error
+            return "[Cancelled]"
+        if isinstance(e, backend.request_errors):
+            print(f"API call failed: {e}")
+            return f"Error connecting to AI: {e}"
+        print(f"An unexpected error occurred during API call: {e}")
+        return f"Unexpected error: {e}"
+
+def extract_candidate_text(json_response):
+    """Concatenate the text parts of the first candidate in a Gemini response"""
+    candidates = (json_response or {}).get('candidates') or []
+    if not candidates:
+        return ""
+    parts = (candidates[0].get('content') or {}).get('parts') or []
+    return "".join(part.get('text', "") for part in parts)
+
+def stream_generative_ai_api(prompt, on_chunk, cancel_token=None, image=None, session=None):
+    """Streams a Generative AI answer, calling on_chunk(text) as each piece arrives.
+
+    Returns the full answer text (or an error message) once the stream ends.
+    With a session the prompt continues its conversation, and the answered
+    turn is added to it.
+    """
+    backend = get_backend()
+    if backend.needs_api_key and not API_KEY:
+        return "Error: API Key not configured for Generative AI."
+
+    payload = build_payload(prompt, image, session)
+
+    print(f"\nStreaming Generative AI with prompt: '{prompt}'")
+    chunks = []
+    usage = None
+    try:
+        for event in backend.stream(payload, cancel_token=cancel_token):
+            usage = event.get('usageMetadata') or usage  # Reported with the last event
+            text = extract_candidate_text(event)
+            if text:
+                chunks.append(text)
+                on_chunk(text)
+    except backend.request_errors as e:
+        if not (cancel_token and cancel_token.is_cancelled()):
+            print(f"API stream failed: {e}")
+            return "".join(chunks) + f"\nError connecting to AI: {e}"
+    except Exception as e:
+        print(f"An unexpected error occurred during API stream: {e}")
+        return "".join(chunks) + f"\nUnexpected error: {e}"
+
+    ai_response = "".join(chunks)
+    if cancel_token and cancel_token.is_cancelled():
+        return ai_response + "\n[Cancelled]"
+    if not ai_response:
+        return "Error: Could not parse AI response."
+    print(f"AI Response: {ai_response.strip()}")
+    if session is not None:
+        session.record(prompt, ai_response, image, usage)
+    return ai_response
+
+def is_error_response(answer):
+    """True for the error/cancel messages the API helpers return instead of an answer"""
+    if not answer or answer.startswith(("Error:", "Error connecting to AI:", "Unexpected error:")):
+        return True
+    return answer.endswith("[Cancelled]") or "\nError connecting to AI:" in answer or "\nUnexpected error:" in answer
+
+# --- Long Text ---
+def estimate_tokens(text):
+    """Rough token count: about CHARS_PER_TOKEN characters, but at least one per word"""
+    return max(len(text) // CHARS_PER_TOKEN, len(text.split()))
+
+def _split_oversized(text, max_tokens):
+    """Split one paragraph that is too long by lines, then by words"""
+    pieces, current = [], []
+    for line in text.splitlines():
+        words = line.split(" ")
+        if estimate_tokens(line) > max_tokens:
+            # A single enormous line: fall back to runs of words
+            step = max(1, max_tokens * CHARS_PER_TOKEN // 8)
+            units = [" ".join(words[i:i + step]) for i in range(0, len(words), step)]
+        else:
+            units = [line]
+        for unit in units:
+            if current and estimate_tokens("\n".join(current + [unit])) > max_tokens:
+                pieces.append("\n".join(current))
+                current = []
+            current.append(unit)
+    if current:
+        pieces.append("\n".join(current))
+    return pieces
+
+def split_into_chunks(text, max_tokens=CHUNK_TOKENS):
+    """Pack whole paragraphs into chunks of at most max_tokens; only oversized paragraphs are cut"""
+    paragraphs = [paragraph.strip() for paragraph in re.split(r"\n\s*\n", text) if paragraph.strip()]
+    chunks, current = [], []
+    for paragraph in paragraphs:
+        parts = [paragraph] if estimate_tokens(paragraph) <= max_tokens else _split_oversized(paragraph, max_tokens)
+        for part in parts:
+            if current and estimate_tokens("\n\n".join(current + [part])) > max_tokens:
+                chunks.append("\n\n".join(current))
+                current = []
+            current.append(part)
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+_chunk_pool = None
+_chunk_pool_lock = threading.Lock()
+
+def get_chunk_pool():
+    """Return the shared thread pool chunk requests run on, creating it on first use"""
+    global _chunk_pool
+    with _chunk_pool_lock:
+        if _chunk_pool is None:
+            _chunk_pool = ThreadPoolExecutor(max_workers=CHUNK_CONCURRENCY * PIPELINE_API_WORKERS,
+                                             thread_name_prefix="gemini-chunk")
+        return _chunk_pool
+
+def answer_long_text(text, on_progress=None, on_chunk=None, cancel_token=None,
+                     max_prompt_tokens=MAX_PROMPT_TOKENS, chunk_tokens=CHUNK_TOKENS, concurrency=CHUNK_CONCURRENCY):
+    """Answer text too long for one prompt: answer its chunks concurrently, then merge the answers.
+
+    At most concurrency chunks are asked at once, fewer when the backend
+    can't send that many together. With the default rate limit that is the
+    limiter's burst (3); the remaining chunks go out one per 60 /
+    GEMINI_RPM seconds, so the limit, not concurrency, caps the speed-up.
+    on_progress(message) reports each step; on_chunk(text) streams the
+    merged answer when given. Returns the answer or an error message, like
+    call_generative_ai_api.
+    """
+    # Leave room for the instructions wrapped around each chunk
+    chunk_tokens = max(1, min(chunk_tokens, max_prompt_tokens - estimate_tokens(CHUNK_PROMPT)))
+    chunks = split_into_chunks(text, chunk_tokens)
+    if estimate_tokens(text) <= max_prompt_tokens or len(chunks) <= 1:
+        if on_chunk:
+            return stream_generative_ai_api(text, on_chunk, cancel_token)
+        return call_generative_ai_api(text, cancel_token)
+
+    report = on_progress or (lambda message: None)
+    concurrency = get_backend().fan_out(concurrency)
+    print(f"Long text (~{estimate_tokens(text)} tokens) split into {len(chunks)} chunks, {concurrency} at a time")
+    report(f"Long text: asking about {len(chunks)} parts...")
+    answers = [None] * len(chunks)
+    slots = threading.BoundedSemaphore(concurrency)
+
+    def ask(index):
+        with slots:
+            if cancel_token and cancel_token.is_cancelled():
+                return index, "[Cancelled]"
+            prompt = CHUNK_PROMPT.format(index=index + 1, count=len(chunks), text=chunks[index])
+            return index, call_generative_ai_api(prompt, cancel_token)
+
+    futures = [get_chunk_pool().submit(ask, index) for index in range(len(chunks))]
+    done = 0
+    for future in as_completed(futures):
+        index, answer = future.result()
+        answers[index] = answer
+        done += 1
+        report(f"Long text: answered {done}/{len(chunks)} parts...")
+
+    if cancel_token and cancel_token.is_cancelled():
+        return "[Cancelled]"
+    failed = [index + 1 for index, answer in enumerate(answers) if is_error_response(answer)]
+    if len(failed) == len(chunks):
+        return answers[0]
+    partial = [f"Part {index + 1}: {answer}" for index, answer in enumerate(answers) if not is_error_response(answer)]
+    note = f"\n\n(Parts {', '.join(map(str, failed))} of {len(chunks)} could not be answered.)" if failed else ""
+
+    report(f"Merging {len(partial)} partial answers...")
+    merged_answer = merge_answers(partial, len(chunks), on_chunk, cancel_token, max_prompt_tokens)
+    if is_error_response(merged_answer):
+        # The per-part answers are still worth showing
+        return "\n\n".join(partial) + note + f"\n\n(Merging the parts failed: {merged_answer.strip()})"
+    return merged_answer + note
+
+def merge_answers(partial, count, on_chunk=None, cancel_token=None, max_prompt_tokens=MAX_PROMPT_TOKENS):
+    """Merge partial answers with REDUCE_PROMPT, in rounds when they are too long for one prompt"""
+    while len(partial) > 1:
+        prompt = REDUCE_PROMPT.format(count=count, answers="\n\n".join(partial))
+        if estimate_tokens(prompt) <= max_prompt_tokens:
+            break
+        groups = split_into_chunks("\n\n".join(partial), max(1, max_prompt_tokens - estimate_tokens(REDUCE_PROMPT)))
+        if len(groups) >= len(partial):
+            break  # Each answer alone is too long; grouping would not shrink anything
+        prompts = [REDUCE_PROMPT.format(count=count, answers=group) for group in groups]
+        partial = list(get_chunk_pool().map(lambda prompt: call_generative_ai_api(prompt, cancel_token), prompts))
+        failed = [answer for answer in partial if is_error_response(answer)]
+        if failed:
+            return failed[0]
+
+    prompt = REDUCE_PROMPT.format(count=count, answers="\n\n".join(partial))
+    if on_chunk:
+        return stream_generative_ai_api(prompt, on_chunk, cancel_token)
+    return call_generative_ai_api(prompt, cancel_token)
+
+# --- Conversation Sessions ---
+class FollowUpQuestion:
+    """Typed question that continues the current conversation instead of starting a new one"""
+    __slots__ = ("text",)
+
+    def __init__(self, text):
+        self.text = text
+
+def summarize_turns(summary, transcript):
+    """Fold a transcript into a conversation summary with one stateless request; None if it failed"""
+    prompt = SUMMARY_PROMPT.format(words=SESSION_SUMMARY_WORDS, summary=summary or "(none yet)", turns=transcript)
+    answer = call_generative_ai_api(prompt)
+    return None if is_error_response(answer) else answer
+
+class ConversationSession:
+    """Context for follow-up questions, kept within token_budget by summarizing the oldest turns in the background"""
+
+    def __init__(self, token_budget=SESSION_TOKEN_BUDGET, turn_tokens=SESSION_TURN_TOKENS, summarize=summarize_turns):
+        self.token_budget = token_budget
+        self.turn_tokens = turn_tokens
+        self.summarize = summarize
+        self.lock = threading.Lock()
+        self.turns = []  # (user parts, answer, estimated tokens), oldest first
+        self.summary = ""
+        self.generation = 0  # Bumped by restart() and clear(), so a summary of a discarded conversation is ignored
+        self.summarizing = False
+        self.stats = Counter()
+
+    def _turn(self, question, answer, image=None):
+        limit = self.turn_tokens * CHARS_PER_TOKEN
+        if len(question) > limit:
+            question = question[:limit] + " [...]"
+        parts = [image.inline_part()] if image is not None else []
+        parts.append({"text": question})
+        tokens = estimate_tokens(question) + estimate_tokens(answer) + (image.token_count() if image is not None else 0)
+        return parts, answer, tokens
+
+    def restart(self, question, answer, image=None):
+        """Start a new conversation whose first turn is question (a capture, say) and its answer"""
+        with self.lock:
+            self.generation += 1
+            self.turns = [self._turn(question, answer, image)]
+            self.summary = ""
+            self.stats["conversations"] += 1
+
+    def clear(self):
+        with self.lock:
+            self.generation += 1
+            self.turns = []
+            self.summary = ""
+
+    def record(self, question, answer, image=None, usage=None):
+        """Add an answered follow-up; usage is the response's usageMetadata, if any"""
+        with self.lock:
+            self.turns.append(self._turn(question, answer, image))
+            self.stats["turns"] += 1
+            if usage:
+                self.stats["prompt_tokens"] += usage.get("promptTokenCount", 0)
+                self.stats["cached_tokens"] += usage.get("cachedContentTokenCount", 0)
+            self._compact_locked()
+
+    def _compact_locked(self):
+        if self.summarizing or sum(tokens for _, _, tokens in self.turns) <= self.token_budget:
+            return
+        # The newest turn always stays verbatim; older ones too while they fit in half the budget
+        split = len(self.turns) - 1
+        kept = self.turns[split][2]
+        while split > 0 and kept + self.turns[split - 1][2] <= self.token_budget // 2:
+            split -= 1
+            kept += self.turns[split][2]
+        if split == 0:
+            return
+        self.summarizing = True
+        threading.Thread(target=self._summarize, args=(self.generation, self.summary, self.turns[:split]),
+                         name="session-summary", daemon=True).start()
+
+    def _summarize(self, generation, summary, turns):
+        transcript = "\n\n".join(
+            "User: " + " ".join(part.get("text", "[image]") for part in parts) + f"\nAssistant: {answer}"
+            for parts, answer, _ in turns)
+        try:
+            new_summary = self.summarize(summary, transcript)
+        except Exception as e:
+            print(f"Conversation summary failed: {e}")
+            new_summary = None
+        with self.lock:
+            self.summarizing = False
+            if generation != self.generation:
+                return
+            if new_summary is None:
+                self.stats["summary_failures"] += 1
+                return
+            # Turns are only ever appended meanwhile, so the summarized ones are still the oldest
+            del self.turns[:len(turns)]
+            self.summary = new_summary.strip()
+            self.stats["summaries"] += 1
+            self.stats["summarized_turns"] += len(turns)
+            self._compact_locked()
+
+    def history(self):
+        """(contents of the earlier turns, summary text) to send before the next question"""
+        with self.lock:
+            turns, summary = list(self.turns), self.summary
+            total = sum(tokens for _, _, tokens in turns)
+            # Only while a summary is still being written can the turns run this far over budget
+            while turns and total > self.token_budget * 2:
+                total -= turns.pop(0)[2]
+                self.stats["turns_left_out"] += 1
+        contents = []
+        for parts, answer, _ in turns:
+            contents.append({"role": "user", "parts": parts})
+            contents.append({"role": "model", "parts": [{"text": answer}]})
+        return contents, summary
+
+    def snapshot(self):
+        """Turn count, context size and summary counters for status replies"""
+        with self.lock:
+            result = dict(self.stats)
+            result["turns_in_context"] = len(self.turns)
+            result["context_tokens"] = sum(tokens for _, _, tokens in self.turns) + estimate_tokens(self.summary)
+            result["summarizing"] = self.summarizing
+        return result
+
+# --- Response Cache ---
+class ResponseCache:
+    """Two-tier cache of Gemini answers: an in-memory LRU in front of an SQLite file.
+
+    Keys are derived from whitespace- and case-normalized prompt text plus the
+    model and generation config, so recapturing the same text is a hit.
+    """
+
+    def __init__(self, db_path=CACHE_DB_PATH, memory_entries=CACHE_MEMORY_ENTRIES,
+                 disk_entries=CACHE_DISK_ENTRIES, ttl=CACHE_TTL_SECONDS):
+        self.memory_entries = memory_entries
+        self.disk_entries = disk_entries
+        self.ttl = ttl
+        self.memory = OrderedDict()  # key -> (answer, created_at)
+        self.lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self.db = sqlite3.connect(db_path, check_same_thread=False)
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS response_cache (
+                key TEXT PRIMARY KEY,
+                answer TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """)
+        self.db.execute("CREATE INDEX IF NOT EXISTS response_cache_last_used ON response_cache (last_used)")
+        self.db.commit()
+
+    @staticmethod
+    def make_key(text, model=GEMINI_MODEL, generation_config=GENERATION_CONFIG):
+        normalized = " ".join(text.split()).casefold()
+        material = json.dumps([model, generation_config, normalized], sort_keys=True)
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """Return the cached answer for key, or None"""
+        now = time.time()
+        with self.lock:
+            entry = self.memory.get(key)
+            if entry is not None:
+                if now - entry[1] <= self.ttl:
+                    self.memory.move_to_end(key)
+                    self.memory_hits += 1
+                    return entry[0]
+                del self.memory[key]
+
+            row = self.db.execute(
+                "SELECT answer, created_at FROM response_cache WHERE key = ? AND created_at >= ?",
+                (key, now - self.ttl),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.db.execute("UPDATE response_cache SET last_used = ? WHERE key = ?", (now, key))
+            self.db.commit()
+            self._remember(key, row[0], row[1])
+            self.disk_hits += 1
+            return row[0]
+
+    def put(self, key, answer):
+        now = time.time()
+        with self.lock:
+            self._remember(key, answer, now)
+            self.db.execute(
+                "INSERT OR REPLACE INTO response_cache (key, answer, created_at, last_used) VALUES (?, ?, ?, ?)",
+                (key, answer, now, now),
+            )
+            self.db.execute("DELETE FROM response_cache WHERE created_at < ?", (now - self.ttl,))
+            self.db.execute(
+                "DELETE FROM response_cache WHERE key IN "
+                "(SELECT key FROM response_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.disk_entries,),
+            )
+            self.db.commit()
+
+    def _remember(self, key, answer, created_at):
+        self.memory[key] = (answer, created_at)
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_entries:
+            self.memory.popitem(last=False)
+
+    def stats(self):
+        """Hit/miss counters for display and diagnostics"""
+        with self.lock:
+            hits = self.memory_hits + self.disk_hits
+            total = hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": hits / total if total else 0.0,
+                "memory_entries": len(self.memory),
+            }
+
+    def clear(self):
+        with self.lock:
+            self.memory.clear()
+            self.db.execute("DELETE FROM response_cache")
+            self.db.commit()
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+# --- Latency Tracing ---
+class _NoSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+class _Span:
+    __slots__ = ("tracer", "capture_id", "stage", "started")
+
+    def __init__(self, tracer, capture_id, stage):
+        self.tracer = tracer
+        self.capture_id = capture_id
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer.record(self.capture_id, self.stage, time.perf_counter() - self.started)
+        return False
+
+def result_outcome(answer, cached=False):
+    """Outcome label of a finished capture for the trace"""
+    if answer is None:
+        return "dropped"
+    if answer.endswith("[Cancelled]") or answer.startswith("Cancelled"):
+        return "cancelled"
+    if is_error_response(answer):
+        return "error"
+    return "cached" if cached else "answered"
+
+class Tracer:
+    """Per-capture stage timings with rolling percentiles.
+
+    Each capture is a trace: spans add time to named stages (convert, ocr,
+    api, render...), marks note milestones such as the first streamed
+    chunk, and finish() closes it. Time not covered by any span is counted
+    as "queue". Finished traces feed fixed-size windows per stage for
+    p50/p95/p99 and are optionally appended to a JSONL file and summarised
+    in a Prometheus textfile. A span costs two clock reads and a dict update.
+    """
+
+    def __init__(self, enabled=TRACE_ENABLED, window=TRACE_WINDOW, jsonl_path=TRACE_JSONL_PATH,
+                 prometheus_path=TRACE_PROMETHEUS_PATH, export_interval=TRACE_EXPORT_INTERVAL):
+        self.enabled = enabled
+        self.window = window
+        self.jsonl_path = jsonl_path
+        self.prometheus_path = prometheus_path
+        self.export_interval = export_interval
+        self.lock = threading.Lock()
+        self.traces = {}  # capture id -> {"started", "stages", "marks"}
+        self.samples = {}  # stage -> deque of recent seconds
+        self.totals = {}  # stage -> [count, sum of seconds] since start, for Prometheus
+        self.outcomes = Counter()
+        self.last_export = time.monotonic()
+        self.jsonl_file = None
+
+    def begin(self, capture_id):
+        if self.enabled:
+            with self.lock:
+                self.traces[capture_id] = {"started": time.perf_counter(), "stages": {}, "marks": {}}
+
+    def span(self, capture_id, stage):
+        """Context manager that adds its running time to stage of the capture's trace"""
+        return _Span(self, capture_id, stage) if self.enabled else _NoSpan()
+
+    def record(self, capture_id, stage, seconds):
+        """Add seconds to a stage of an open trace"""
+        if not self.enabled:
+            return
+        with self.lock:
+            trace = self.traces.get(capture_id)
+            if trace is not None:
+                trace["stages"][stage] = trace["stages"].get(stage, 0.0) + seconds
+
+    def mark(self, capture_id, name):
+        """Note the first time name happened, relative to the start of the trace"""
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        with self.lock:
+            trace = self.traces.get(capture_id)
+            if trace is not None and name not in trace["marks"]:
+                trace["marks"][name] = now - trace["started"]
+
+    def _observe_locked(self, name, seconds):
+        samples = self.samples.get(name)
+        if samples is None:
+            samples = self.samples[name] = deque(maxlen=self.window)
+            self.totals[name] = [0, 0.0]
+        samples.append(seconds)
+        self.totals[name][0] += 1
+        self.totals[name][1] += seconds
+
+    def finish(self, capture_id, outcome):
+        """Close a trace; returns its record (times in ms), or None if it was not open"""
+        if not self.enabled:
+            return None
+        now = time.perf_counter()
+        with self.lock:
+            trace = self.traces.pop(capture_id, None)
+            if trace is None:
+                return None
+            total = now - trace["started"]
+            stages = dict(trace["stages"])
+            stages["queue"] = max(0.0, total - sum(stages.values()))
+            for stage, seconds in stages.items():
+                self._observe_locked(stage, seconds)
+            for name, seconds in trace["marks"].items():
+                self._observe_locked(name, seconds)
+            self._observe_locked("total", total)
+            self.outcomes[outcome] += 1
+            export = self.prometheus_path and now - self.last_export >= self.export_interval
+            if export:
+                self.last_export = now
+
+        record = {
+            "capture_id": capture_id,
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "outcome": outcome,
+            "total_ms": round(total * 1000, 2),
+            "stages_ms": {stage: round(seconds * 1000, 2) for stage, seconds in stages.items()},
+            "marks_ms": {name: round(seconds * 1000, 2) for name, seconds in trace["marks"].items()},
+        }
+        if self.jsonl_path:
+            self._write_jsonl(record)
+        if export:
+            self.export_prometheus()
+        return record
+
+    def _write_jsonl(self, record):
+        try:
+            with self.lock:
+                if self.jsonl_file is None:
+                    self.jsonl_file = open(self.jsonl_path, "a", encoding="utf-8")
+                self.jsonl_file.write(json.dumps(record) + "\n")
+                self.jsonl_file.flush()
+        except OSError as e:
+            print(f"Trace log write failed, disabling it: {e}")
+            self.jsonl_path = ""
+
+    def snapshot(self):
+        """{stage: {count, p50_ms, p95_ms, p99_ms}} over the rolling window"""
+        with self.lock:
+            windows = {stage: sorted(samples) for stage, samples in self.samples.items()}
+        result = {}
+        for stage, ordered in windows.items():
+            pick = lambda pct: ordered[min(len(ordered) - 1, int(pct / 100.0 * len(ordered)))] * 1000
+            result[stage] = {"count": len(ordered), "p50_ms": round(pick(50), 2),
+                             "p95_ms": round(pick(95), 2), "p99_ms": round(pick(99), 2)}
+        return result
+
+    def prometheus_text(self):
+        """The current metrics in the Prometheus text exposition format"""
+        snapshot = self.snapshot()
+        with self.lock:
+            totals = {stage: tuple(values) for stage, values in self.totals.items()}
+            outcomes = dict(self.outcomes)
+        lines = ["# HELP gemini_assistant_stage_seconds Time per capture spent in each stage (rolling window quantiles)",
+                 "# TYPE gemini_assistant_stage_seconds summary"]
+        for stage in sorted(snapshot):
+            for quantile, key in (("0.5", "p50_ms"), ("0.95", "p95_ms"), ("0.99", "p99_ms")):
+                lines.append(f'gemini_assistant_stage_seconds{{stage="{stage}",quantile="{quantile}"}} '
+                             f"{snapshot[stage][key] / 1000:.6f}")
+            count, total = totals[stage]
+            lines.append(f'gemini_assistant_stage_seconds_sum{{stage="{stage}"}} {total:.6f}')
+            lines.append(f'gemini_assistant_stage_seconds_count{{stage="{stage}"}} {count}')
+        lines += ["# HELP gemini_assistant_captures_total Finished captures by outcome",
+                  "# TYPE gemini_assistant_captures_total counter"]
+        lines += [f'gemini_assistant_captures_total{{outcome="{outcome}"}} {count}'
+                  for outcome, count in sorted(outcomes.items())]
+        return "\n".join(lines) + "\n"
+
+    def export_prometheus(self):
+        """Atomically rewrite the Prometheus textfile"""
+        if not self.prometheus_path:
+            return
+        temp_path = f"{self.prometheus_path}.{os.getpid()}.tmp"
+        try:
+            with open(temp_path, "w", encoding="utf-8") as f:
+                f.write(self.prometheus_text())
+            os.replace(temp_path, self.prometheus_path)
+        except OSError as e:
+            print(f"Prometheus export failed: {e}")
+
+    @staticmethod
+    def breakdown(record):
+        """Compact one-line summary of a finished trace for the status bar"""
+        stages = sorted(((ms, stage) for stage, ms in record["stages_ms"].items() if ms >= 1), reverse=True)
+        parts = " | ".join(f"{stage} {ms:.0f}" for ms, stage in stages[:4])
+        return f"Done in {record['total_ms'] / 1000:.2f}s - {parts} ms"
+
+    def close(self):
+        self.export_prometheus()
+        with self.lock:
+            if self.jsonl_file is not None:
+                self.jsonl_file.close()
+                self.jsonl_file = None
+
+_tracer = None
+_tracer_lock = threading.Lock()
+
+def get_tracer():
+    """Return the shared Tracer, creating it on first use"""
+    global _tracer
+    with _tracer_lock:
+        if _tracer is None:
+            _tracer = Tracer()
+        return _tracer
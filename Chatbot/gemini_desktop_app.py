@@ -3,139 +3,802 @@
 import sys
 import os
 import time
-import socket
 import threading
-from PyQt6.QtCore import Qt, QPoint, QRect, QThread, pyqtSignal, QTimer
-from PyQt6.QtWidgets import QApplication, QWidget, QLabel, QVBoxLayout, QPushButton, QMessageBox, QScrollArea, QTextEdit
-from PyQt6.QtGui import QPixmap, QScreen, QPainter, QColor, QFont
-from pynput import keyboard
-from PIL import ImageGrab
-import requests
-from dotenv import load_dotenv
-import pytesseract
-
-# Load environment variables
-load_dotenv()
+import queue
+import itertools
+import json
+import sqlite3
+import hashlib
+from collections import OrderedDict, Counter, deque
+import gemini_core  # Before PyQt6, so the startup report's clock covers importing it
+from gemini_core import (
+    CACHE_ENABLED, CancelToken, CaptureRouter, ConversationSession, EncodedImage, FollowUpQuestion,
+    IMAGE_PROMPT, Image, MAX_PROMPT_TOKENS, OCR_PREPROCESS, OCR_TILED, PIPELINE_API_WORKERS, ResponseCache,
+    STARTUP_REPORT, TRACE_STATUS_BREAKDOWN, Tracer, USE_STREAMING, answer_long_text, call_generative_ai_api,
+    encode_image_for_api, estimate_tokens, get_backend, get_gemini_client, get_ocr_engine, get_ocr_pool,
+    get_tracer, is_error_response, lazy_import, mark_startup, np, perform_ocr, preprocess_image, result_outcome,
+    shutdown_ocr_pool, startup_report, stream_generative_ai_api)
+from PyQt6.QtCore import Qt, QPoint, QRect, QThread, QObject, pyqtSignal, QTimer, QAbstractListModel, QModelIndex, QLockFile
+from PyQt6.QtWidgets import QApplication, QWidget, QLabel, QVBoxLayout, QPushButton, QMessageBox, QListView, QTextEdit, QSplitter, QLineEdit
+from PyQt6.QtGui import QPixmap, QImage, QScreen, QPainter, QColor, QFont, QRegion, QTextCursor
+from PyQt6.QtNetwork import QLocalServer
+import instance_control
+
+keyboard = lazy_import("pynput.keyboard")
 
 # --- Configuration ---
-SINGLE_INSTANCE_PORT = 12345  # Port for single instance check
-CAPTURE_HOTKEY = {keyboard.Key.f12}  # F12 for screen capture
-TOGGLE_UI_HOTKEY = {keyboard.Key.f11}  # F11 to show/hide UI
+CAPTURE_HOTKEY = "f12"  # pynput keyboard.Key name for screen capture
+TOGGLE_UI_HOTKEY = "f11"  # pynput keyboard.Key name to show/hide UI
+WATCH_HOTKEY = "f10"  # pynput keyboard.Key name to start/stop watching a screen region
+WARM_UP = os.getenv("GEMINI_WARMUP", "1") == "1"  # Pre-load OCR and open the API connection once the UI is up
+
+# History view configuration
+HISTORY_MAX_ENTRIES = 500  # Oldest entries are dropped from the view beyond this
+HISTORY_PREVIEW_CHARS = 200  # Answer text shown in a list row; the full answer renders on selection
 
-# API Configuration
-GEMINI_API_BASE_URL = "https://generativelanguage.googleapis.com/v1beta/models/gemini-1.5-flash:generateContent"
-API_KEY = os.getenv("GEMINI_API_KEY")
+# Persistent history configuration
+HISTORY_PERSIST = os.getenv("GEMINI_HISTORY", "1") == "1"
+HISTORY_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "history.db")
+HISTORY_WRITE_BATCH = 256  # Max rows committed per transaction by the writer thread
+HISTORY_SEARCH_PAGE_SIZE = 50  # Search results are loaded one page at a time as the list scrolls
 
-if not API_KEY:
-    print("Warning: GEMINI_API_KEY not found in environment variables or .env file.")
+# Watch mode configuration: a pinned region is re-read on a timer, asking Gemini only when its text changes
+WATCH_INTERVAL_MS = int(os.getenv("GEMINI_WATCH_INTERVAL_MS", "1000"))
+WATCH_BLOCK_SIZE = 16  # Frames are compared in blocks of this many pixels square
+WATCH_PIXEL_THRESHOLD = 24  # Grey-level difference below which a pixel counts as unchanged (cursor fades, dithering)
+WATCH_BAND_HEIGHT = 160  # Changed areas are re-read in line-aligned bands of about this many pixels
+WATCH_BAND_CACHE = 512  # Band texts remembered by pixel content, so scrolled-back lines are not read again
+WATCH_MIN_QUERY_SECONDS = 5.0  # At most one question per this many seconds; the newest text is sent when it elapses
+WATCH_PROMPT = ("The text in a screen region I am watching has changed. New or changed lines:\n{changes}\n\n"
+                "Current text of the region:\n{text}\n\nExplain what changed and answer any question it raises.")
+
+# Capture pipeline configuration
+PIPELINE_QUEUE_SIZE = 4  # Max captures waiting in front of each stage
+CAPTURE_POLICY = os.getenv("GEMINI_CAPTURE_POLICY", "latest")  # "latest": a new capture supersedes older ones; "fifo": answer every capture
+CAPTURE_DEBOUNCE_SECONDS = 0.3  # Capture triggers closer together than this (key auto-repeat) count once
+CAPTURE_QUIET_SECONDS = 0.6  # With "latest", captures in a burst wait until none has arrived for this long
 
 # --- Single Instance Management ---
-class SingleInstanceChecker:
-    def __init__(self, port=SINGLE_INSTANCE_PORT):
-        self.port = port
-        self.socket = None
-    
-    def is_another_instance_running(self):
-        """Check if another instance is already running"""
-        try:
-            test_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            test_socket.settimeout(1)
-            result = test_socket.connect_ex(('localhost', self.port))
-            test_socket.close()
-            return result == 0  # 0 means connection successful = another instance running
-        except:
-            return False
-    
-    def start_server(self):
-        """Start the single instance server"""
-        try:
-            self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            self.socket.bind(('localhost', self.port))
-            self.socket.listen(1)
-            print(f"Single instance server started on port {self.port}")
-            
-            # Start server in background thread
-            def server_thread():
-                while True:
-                    try:
-                        conn, addr = self.socket.accept()
-                        print(f"Connection from existing instance: {addr}")
-                        conn.close()
-                    except:
-                        break
-            
-            threading.Thread(target=server_thread, daemon=True).start()
-            return True
-        except Exception as e:
-            print(f"Failed to start single instance server: {e}")
+class InstanceServer(QObject):
+    """Owns the single-instance lock and serves the local control channel.
+
+    The first instance takes a lock file and listens on a local socket (a
+    named pipe on Windows). Later invocations fail to take the lock and
+    forward their command over the socket instead of starting a second app.
+    See instance_control.py for the frame format.
+    """
+
+    def __init__(self, address=None, lock_file=None):
+        super().__init__()
+        self.address = address or instance_control.server_address()
+        self.lock = QLockFile(lock_file or instance_control.lock_path())
+        self.lock.setStaleLockTime(0)  # Only a dead owner process makes the lock stale
+        self.server = None
+        self.handler = None
+        self.buffers = {}
+
+    def acquire(self):
+        """Take the instance lock; returns False if another instance holds it"""
+        return self.lock.tryLock(0)
+
+    def start(self, handler):
+        """Listen for commands; handler(command) returns a JSON-serializable reply"""
+        self.handler = handler
+        # We own the lock, so any socket left behind belongs to a crashed instance
+        QLocalServer.removeServer(self.address)
+        self.server = QLocalServer(self)
+        self.server.setSocketOptions(QLocalServer.SocketOption.UserAccessOption)
+        if not self.server.listen(self.address):
+            print(f"Failed to start instance server: {self.server.errorString()}")
             return False
-    
-    def stop_server(self):
-        """Stop the single instance server"""
-        if self.socket:
-            self.socket.close()
+        self.server.newConnection.connect(self._accept)
+        print(f"Instance control server listening on {self.address}")
+        return True
+
+    def _accept(self):
+        while self.server.hasPendingConnections():
+            connection = self.server.nextPendingConnection()
+            self.buffers[connection] = b""
+            connection.readyRead.connect(lambda c=connection: self._read(c))
+            connection.disconnected.connect(lambda c=connection: self._drop(c))
+
+    def _drop(self, connection):
+        self.buffers.pop(connection, None)
+        connection.deleteLater()
+
+    def _read(self, connection):
+        commands, self.buffers[connection] = instance_control.decode_frames(
+            self.buffers.get(connection, b"") + bytes(connection.readAll()))
+        for command in commands:
+            try:
+                reply = self.handler(command)
+            except Exception as e:
+                reply = {"ok": False, "error": str(e)}
+            connection.write(instance_control.encode_frame(json.dumps(reply)))
+            connection.flush()
+
+    def stop(self):
+        """Stop listening and release the instance lock"""
+        if self.server:
+            self.server.close()
+            self.server = None
+        self.lock.unlock()
 
 # --- Helper Functions ---
-def perform_ocr(image_path):
-    """Uses pytesseract to extract text from an image."""
-    try:
-        pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
-        text = pytesseract.image_to_string(image_path)
-        print(f"OCR extracted text: '{text.strip()}'")
-        return text
-    except Exception as e:
-        print(f"Error during OCR: {e}")
+def qimage_to_pil(image):
+    """Convert a QImage to a PIL image in memory, without encoding to disk"""
+    image = image.convertToFormat(QImage.Format.Format_RGBA8888)
+    width, height = image.width(), image.height()
+    bytes_per_line = image.bytesPerLine()
+    data = image.constBits().asstring(bytes_per_line * height)
+    # Rows may be padded, so pass the stride; convert() copies out of the Qt buffer
+    return Image.frombuffer("RGBA", (width, height), data, "raw", "RGBA", bytes_per_line, 1).convert("RGB")
+
+# --- Background Capture Pipeline ---
+class CapturePipeline(QObject):
+    """Runs the capture -> OCR -> Gemini stages on worker threads and reports back through Qt signals.
+
+    Identical prompts share one API call; under "latest", newer work supersedes older along LANE_SUPERSEDES.
+    """
+    # Lane of a new submission -> lanes of older work it supersedes under "latest"
+    LANE_SUPERSEDES = {"capture": ("capture", "follow-up"), "follow-up": (), "watch": ("watch",)}
+    CONVERSATION_LANES = ("capture", "follow-up")
+    statusChanged = pyqtSignal(int, str)
+    chunkReady = pyqtSignal(int, str, str)  # capture id, question, streamed answer text
+    resultReady = pyqtSignal(int, str, str, bool)  # capture id, question, answer, served from cache
+    captureDropped = pyqtSignal(int)  # capture id superseded before it reached the API
+
+    def __init__(self, queue_size=PIPELINE_QUEUE_SIZE, api_workers=PIPELINE_API_WORKERS,
+                 streaming=USE_STREAMING, cache=None, policy=CAPTURE_POLICY, router=None,
+                 tracer=None, finish_traces=True, session=None, quiet_seconds=CAPTURE_QUIET_SECONDS):
+        super().__init__()
+        self.tracer = tracer or get_tracer()
+        self.session = session
+        self.finish_traces = finish_traces
+        self.streaming = streaming
+        self.cache = cache
+        self.policy = policy
+        self.quiet_seconds = quiet_seconds
+        self.quiet = quiet_seconds  # Current wait, doubled by every call a burst wastes
+        self.last_capture = self.previous_capture = 0.0  # When the two newest captures were submitted
+        self.newest_capture = 0
+        self.router = router or CaptureRouter()
+        self.cancel_tokens = {}
+        self.cancel_lock = threading.Lock()  # Also guards the scheduling state below
+        self.stages = {}  # capture id -> stage it is waiting for or running in
+        self.lanes = {}  # capture id -> lane it was submitted in
+        self.held_follow_ups = []  # (capture id, FollowUpQuestion) waiting for earlier turns
+        self.superseded = set()
+        self.inflight = {}  # prompt key -> capture id whose API call answers it
+        self.followers = {}  # leading capture id -> capture ids sharing its answer
+        self.stats = dict.fromkeys(("submitted", "superseded", "coalesced", "api_calls", "wasted_api_calls"), 0)
+        self.capture_queue = queue.Queue(maxsize=queue_size)
+        self.ocr_queue = queue.Queue(maxsize=queue_size)
+        self.api_queue = queue.Queue(maxsize=queue_size)
+        self.capture_ids = itertools.count(1)
+        self.is_running = True
+        self.workers = []
+
+        self._start_stage("capture", self._capture_stage, self.capture_queue, self.ocr_queue, 1)
+        self._start_stage("ocr", self._ocr_stage, self.ocr_queue, self.api_queue, 1)
+        self._start_stage("api", self._api_stage, self.api_queue, None, api_workers)
+
+    def _start_stage(self, name, handler, in_queue, out_queue, count):
+        for index in range(count):
+            worker = threading.Thread(
+                target=self._stage_loop,
+                args=(handler, in_queue, out_queue),
+                name=f"pipeline-{name}-{index}",
+                daemon=True,
+            )
+            worker.start()
+            self.workers.append((worker, in_queue))
+
+    def _stage_loop(self, handler, in_queue, out_queue):
+        while True:
+            job = in_queue.get()
+            if job is None:
+                break
+            capture_id = job[0]
+            try:
+                result = handler(*job)
+            except Exception as e:
+                print(f"Pipeline error for capture #{capture_id}: {e}")
+                self._finish(capture_id, "Processing failed", f"Unexpected error: {e}")
+                continue
+            if result is None or out_queue is None:
+                continue
+            # Blocking put is the backpressure: a full queue stalls this stage
+            while self.is_running:
+                try:
+                    out_queue.put(result, timeout=0.5)
+                    break
+                except queue.Full:
+                    continue
+
+    def _finish(self, capture_id, question, answer, cached=False):
+        """Deliver the final result for a capture and forget its cancel token"""
+        with self.cancel_lock:
+            self.cancel_tokens.pop(capture_id, None)
+            self.stages.pop(capture_id, None)
+            self.lanes.pop(capture_id, None)
+            superseded = capture_id in self.superseded
+            self.superseded.discard(capture_id)
+            released = self._release_follow_ups_locked()
+        if released:
+            threading.Thread(target=self._requeue, args=(released,), name="pipeline-follow-ups", daemon=True).start()
+        if superseded and answer in ("Cancelled before an answer was requested.", "[Cancelled]", "\n[Cancelled]"):
+            # Nothing was shown for it yet, so it can disappear quietly
+            if self.finish_traces:
+                self.tracer.finish(capture_id, "dropped")
+            self.captureDropped.emit(capture_id)
+            return
+        if self.finish_traces:
+            self.tracer.finish(capture_id, result_outcome(answer, cached))
+        self.resultReady.emit(capture_id, question, answer, cached)
+
+    def _enter_stage(self, capture_id, stage):
+        with self.cancel_lock:
+            if capture_id in self.stages:
+                self.stages[capture_id] = stage
+
+    def _earlier_turns_locked(self, capture_id):
+        return any(other < capture_id and self.lanes.get(other) in self.CONVERSATION_LANES for other in self.stages)
+
+    def _release_follow_ups_locked(self):
+        """Take the held follow-ups whose earlier turns are all answered (or that were cancelled)"""
+        released, held = [], []
+        for job in self.held_follow_ups:
+            capture_id = job[0]
+            if self._token_locked(capture_id).is_cancelled() or not self._earlier_turns_locked(capture_id):
+                released.append(job)
+                self.stages[capture_id] = "api"
+            else:
+                held.append(job)
+        self.held_follow_ups = held
+        return released
+
+    def _requeue(self, jobs):
+        for job in jobs:
+            while self.is_running:
+                try:
+                    self.api_queue.put(job, timeout=0.5)
+                    break
+                except queue.Full:
+                    continue
+
+    def _supersede(self, newer_id, stages, keep=None):
+        """Cancel captures older than newer_id that are in one of the given stages and in a lane it supersedes"""
+        with self.cancel_lock:
+            lanes = self.LANE_SUPERSEDES[self.lanes.get(newer_id, "capture")]
+            older = [capture_id for capture_id, stage in self.stages.items()
+                     if capture_id < newer_id and stage in stages and self.lanes.get(capture_id) in lanes
+                     and capture_id != keep and capture_id not in self.superseded
+                     # A call that also answers work from another lane has to finish
+                     and all(self.lanes.get(follower) in lanes for follower in self.followers.get(capture_id, ()))]
+            self.superseded.update(older)
+            self.stats["superseded"] += len(older)
+            tokens = [self.cancel_tokens[capture_id] for capture_id in older if capture_id in self.cancel_tokens]
+        for token in tokens:
+            token.cancel()
+
+    def _schedule_api_call(self, capture_id, key):
+        """Claim the API call for key; returns False if an in-flight call will answer this capture"""
+        with self.cancel_lock:
+            leader = self.inflight.get(key)
+            if leader is not None and leader in self.cancel_tokens and not self.cancel_tokens[leader].is_cancelled():
+                self.followers[leader].append(capture_id)
+                self.stages[capture_id] = "coalesced"
+                self.stats["coalesced"] += 1
+            else:
+                leader = None
+                self.inflight[key] = capture_id
+                self.followers[capture_id] = []
+                self.stats["api_calls"] += 1
+        if self.policy == "latest":
+            # Calls for any other prompt are answering a question nobody is waiting for
+            self._supersede(capture_id, ("capture", "ocr", "held", "quiet", "api"), keep=leader)
+        return leader is None
+
+    def _wait_for_quiet(self, capture_id):
+        """Hold a capture back while captures keep coming in a burst or an older one's call is in flight.
+
+        Returns False if a newer capture superseded it meanwhile.
+        """
+        token = self._token(capture_id)
+        while True:
+            with self.cancel_lock:
+                burst = self.last_capture - self.previous_capture < self.quiet or any(
+                    leader < capture_id and self.lanes.get(leader) == "capture" for leader in self.followers)
+                remaining = self.last_capture + self.quiet - time.monotonic()
+                if not burst or remaining <= 0:
+                    if capture_id in self.stages:
+                        self.stages[capture_id] = "api"
+                    return True
+                self.stages[capture_id] = "quiet"
+            if token.wait(remaining):
+                return False
+
+    def _release_api_call(self, capture_id, key):
+        """Forget the in-flight call for key; returns the captures waiting on its answer"""
+        with self.cancel_lock:
+            if self.inflight.get(key) == capture_id:
+                del self.inflight[key]
+            if self._token_locked(capture_id).is_cancelled():
+                self.stats["wasted_api_calls"] += 1
+                if self.lanes.get(capture_id) == "capture":
+                    self.quiet = min(self.quiet * 2, self.quiet_seconds * 16)
+            elif capture_id == self.newest_capture:
+                self.quiet = self.quiet_seconds
+            return self.followers.pop(capture_id, [])
+
+    def _token_locked(self, capture_id):
+        return self.cancel_tokens.get(capture_id) or CancelToken()
+
+    def _token(self, capture_id):
+        with self.cancel_lock:
+            return self._token_locked(capture_id)
+
+    def _check_cancelled(self, capture_id):
+        """Finish a cancelled capture early; returns True if it was cancelled"""
+        if self._token(capture_id).is_cancelled():
+            self._finish(capture_id, "Capture cancelled", "Cancelled before an answer was requested.")
+            return True
+        return False
+
+    def _capture_stage(self, capture_id, image):
+        if self._check_cancelled(capture_id):
+            return None
+        self._enter_stage(capture_id, "capture")
+        if image.isNull():
+            self._finish(capture_id, "Screen capture failed", "Could not read the captured image.")
+            return None
+        with self.tracer.span(capture_id, "convert"):
+            original = qimage_to_pil(image)
+        with self.tracer.span(capture_id, "preprocess"):
+            processed = preprocess_image(original)
+        return (capture_id, (original, processed))
+
+    def _ocr_stage(self, capture_id, images):
+        if self._check_cancelled(capture_id):
+            return None
+        self._enter_stage(capture_id, "ocr")
+        original, processed = images
+        with self.tracer.span(capture_id, "route"):
+            route, reason = self.router.before_ocr(original)
+        if route == "text":
+            self.statusChanged.emit(capture_id, "Extracting text from image...")
+            started = time.perf_counter()
+            extracted_text, confidence = perform_ocr(processed, with_confidence=True)
+            elapsed = time.perf_counter() - started
+            self.tracer.record(capture_id, "ocr", elapsed)
+            self.router.observe_ocr(elapsed, original)
+            if self._check_cancelled(capture_id):
+                return None
+            route, reason = self.router.after_ocr(extracted_text, confidence, original)
+            if route == "text":
+                if not extracted_text or not extracted_text.strip():
+                    self._finish(capture_id, "No text detected", "Could not extract text from the selected area.")
+                    return None
+                return (capture_id, extracted_text)
+
+        self.statusChanged.emit(capture_id, f"Sending the image itself ({reason})...")
+        started = time.perf_counter()
+        encoded = encode_image_for_api(original)
+        elapsed = time.perf_counter() - started
+        self.tracer.record(capture_id, "encode", elapsed)
+        self.router.observe("encode", elapsed)
+        return (capture_id, encoded)
+
+    def _api_stage(self, capture_id, query):
+        """query is the OCR (or typed) text, an EncodedImage of the selection, or a FollowUpQuestion"""
+        if self._check_cancelled(capture_id):
+            return None
+        self._enter_stage(capture_id, "api")
+        session = None
+        with self.cancel_lock:
+            lane = self.lanes.get(capture_id)
+            if isinstance(query, FollowUpQuestion) and self._earlier_turns_locked(capture_id):
+                # Its context is not complete until those are answered; _finish sends it on
+                self.held_follow_ups.append((capture_id, query))
+                self.stages[capture_id] = "held"
+                return None
+        backend = get_backend()
+        if isinstance(query, EncodedImage):
+            extracted_text, image, path = IMAGE_PROMPT, query, "image_api"
+            question = query.describe()
+            key = ResponseCache.make_key(f"{IMAGE_PROMPT} {query.digest}", model=backend.name)
+        elif isinstance(query, FollowUpQuestion):
+            extracted_text, image, path = query.text, None, "text_api"
+            question = query.text.strip()
+            key = f"follow-up {capture_id}"  # Never shared with another capture
+            session = self.session
+        else:
+            extracted_text, image, path = query, None, "text_api"
+            question = query.strip()
+            key = ResponseCache.make_key(query, model=backend.name)
+        use_cache = self.cache is not None and session is None and backend.cacheable
+        if use_cache:
+            cached_answer = self.cache.get(key)
+            if cached_answer is not None:
+                if self.session is not None and lane == "capture":
+                    self.session.restart(extracted_text, cached_answer, image)
+                self._finish(capture_id, question, cached_answer, cached=True)
+                return None
+        if self.policy == "latest" and lane == "capture" and not self._wait_for_quiet(capture_id):
+            self._check_cancelled(capture_id)
+            return None
+        if not self._schedule_api_call(capture_id, key):
+            self.statusChanged.emit(capture_id, "Same text as a request in progress - waiting for its answer...")
+            return None
+
+        token = self._token(capture_id)
+        try:
+            self.statusChanged.emit(capture_id, "Image ready. Calling AI..." if image else "Text extracted. Calling AI...")
+            started = time.perf_counter()
+
+            def on_chunk(text):
+                self.tracer.mark(capture_id, "first_chunk")
+                self.chunkReady.emit(capture_id, question, text)
+
+            if image is None and estimate_tokens(extracted_text) > MAX_PROMPT_TOKENS:
+                on_progress = lambda message: self.statusChanged.emit(capture_id, message)
+                ai_response = answer_long_text(extracted_text, on_progress, on_chunk if self.streaming else None, token)
+            elif self.streaming:
+                ai_response = stream_generative_ai_api(extracted_text, on_chunk, token, image=image, session=session)
+            else:
+                ai_response = call_generative_ai_api(extracted_text, token, image=image, session=session)
+        finally:
+            followers = self._release_api_call(capture_id, key)
+        elapsed = time.perf_counter() - started
+        self.tracer.record(capture_id, "api", elapsed)
+        if not is_error_response(ai_response):
+            self.router.observe(path, elapsed)
+            if self.session is not None and lane == "capture":
+                self.session.restart(extracted_text, ai_response, image)
+        if use_cache and not is_error_response(ai_response):
+            self.cache.put(key, ai_response)
+        self._finish(capture_id, question, ai_response)
+        for follower in followers:
+            self._finish(follower, question, ai_response, cached=True)
         return None
 
-def call_generative_ai_api(prompt):
-    """Calls the Generative AI API with the given prompt."""
-    if not API_KEY:
-        return "Error: API Key not configured for Generative AI."
+    def _enqueue(self, in_queue, payload, stage, lane="capture"):
+        capture_id = next(self.capture_ids)
+        with self.cancel_lock:
+            self.cancel_tokens[capture_id] = CancelToken()
+            self.stages[capture_id] = stage
+            self.lanes[capture_id] = lane
+            if lane == "capture":
+                self.previous_capture, self.last_capture = self.last_capture, time.monotonic()
+                self.newest_capture = capture_id
+            self.stats["submitted"] += 1
+        self.tracer.begin(capture_id)
+        try:
+            in_queue.put_nowait((capture_id, payload))
+        except queue.Full:
+            with self.cancel_lock:
+                self.cancel_tokens.pop(capture_id, None)
+                self.stages.pop(capture_id, None)
+                self.lanes.pop(capture_id, None)
+            self.tracer.finish(capture_id, "rejected")
+            return None
+        if self.policy == "latest":
+            # Older captures that have not reached the API yet are wasted work now
+            self._supersede(capture_id, ("capture", "ocr", "held", "quiet"))
+        return capture_id
 
-    headers = {"Content-Type": "application/json"}
-    params = {"key": API_KEY}
-    payload = {
-        "contents": [{"parts": [{"text": prompt}]}],
-        "generationConfig": {"responseMimeType": "text/plain"}
-    }
+    def submit(self, image):
+        """Queue a captured QImage; returns its capture id, or None if the pipeline is full."""
+        return self._enqueue(self.capture_queue, image, "capture")
 
-    print(f"\nCalling Generative AI with prompt: '{prompt}'")
-    try:
-        response = requests.post(GEMINI_API_BASE_URL, headers=headers, params=params, json=payload, timeout=30)
-        response.raise_for_status()
-        json_response = response.json()
-
-        if json_response and json_response.get('candidates'):
-            first_candidate = json_response['candidates'][0]
-            if first_candidate.get('content') and first_candidate['content'].get('parts'):
-                first_part = first_candidate['content']['parts'][0]
-                if first_part.get('text'):
-                    ai_response = first_part['text']
-                    print(f"AI Response: {ai_response.strip()}")
-                    return ai_response.strip()
-        
-        print("AI response structure unexpected:", json_response)
-        return "Error: Could not parse AI response."
+    def submit_text(self, text):
+        """Queue a question that needs no OCR, straight into the API stage"""
+        return self._enqueue(self.api_queue, text, "api")
+
+    def submit_follow_up(self, text):
+        """Queue a question that continues the conversation about the previous answers"""
+        return self._enqueue(self.api_queue, FollowUpQuestion(text), "api", lane="follow-up")
 
-    except requests.exceptions.RequestException as e:
-        print(f"API call failed: {e}")
-        return f"Error connecting to AI: {e}"
-    except Exception as e:
-        print(f"An unexpected error occurred during API call: {e}")
-        return f"Unexpected error: {e}"
+    def submit_watch(self, text):
+        """Queue a question about the watched region; it only ever supersedes older watch questions"""
+        return self._enqueue(self.api_queue, text, "api", lane="watch")
+
+    def cancel(self, capture_id=None):
+        """Cancel one capture, or every capture in flight when no id is given"""
+        with self.cancel_lock:
+            if capture_id is None:
+                tokens = list(self.cancel_tokens.values())
+            else:
+                tokens = [self.cancel_tokens[capture_id]] if capture_id in self.cancel_tokens else []
+        for token in tokens:
+            token.cancel()
+
+    def scheduler_stats(self):
+        """Counts of submitted, superseded and coalesced captures and of API calls made and wasted"""
+        with self.cancel_lock:
+            return dict(self.stats)
+
+    def stop(self):
+        """Signal every worker to exit once its current job is done"""
+        self.is_running = False
+        for _, in_queue in self.workers:
+            try:
+                in_queue.put_nowait(None)
+            except queue.Full:
+                pass
+
+# --- Watch Region ---
+def _read_band(image):
+    if OCR_PREPROCESS and gemini_core._preprocessor is not None:
+        image = gemini_core._preprocessor.process(image)[0]
+    return get_ocr_engine().image_to_string(image)
+
+def ocr_bands(images):
+    """OCR a list of band crops, spread over the OCR process pool when there are several"""
+    if OCR_TILED and len(images) > 1:
+        return list(get_ocr_pool().map(_read_band, images))
+    return [_read_band(image) for image in images]
+
+class IncrementalOcr:
+    """OCR of successive frames of one screen region that only reads what changed.
+
+    Each frame is compared with the previous one in blocks; an unchanged
+    frame costs one array comparison. Otherwise the frame is cut into
+    line-aligned bands and only bands overlapping a changed block are read
+    again, unless a band with identical pixels was read before (scrolling
+    brings old lines back at new positions). update() returns the region's
+    text, or None when the frame did not change.
+    """
+
+    def __init__(self, ocr=ocr_bands, block_size=WATCH_BLOCK_SIZE, threshold=WATCH_PIXEL_THRESHOLD,
+                 band_height=WATCH_BAND_HEIGHT, cache_entries=WATCH_BAND_CACHE):
+        self.ocr = ocr
+        self.block_size = block_size
+        self.threshold = threshold
+        self.band_height = band_height
+        self.cache_entries = cache_entries
+        self.previous = None  # Grayscale pixels of the last frame
+        self.bands = {}  # (top, bottom) -> text of the last frame's bands
+        self.cache = OrderedDict()  # Band pixel digest -> text, least recently used first
+        self.stats = Counter()
+
+    def changed_rows(self, gray):
+        """Mask of the rows covered by changed blocks, or None if nothing changed"""
+        height, width = gray.shape
+        if self.previous is None or self.previous.shape != gray.shape:
+            return np.ones(height, dtype=bool)
+        if np.array_equal(gray, self.previous):
+            return None
+        size = self.block_size
+        changed = np.abs(gray.astype(np.int16) - self.previous) > self.threshold
+        changed = np.pad(changed, ((0, -height % size), (0, -width % size)))
+        blocks = changed.reshape(changed.shape[0] // size, size, changed.shape[1] // size, size).any(axis=(1, 3))
+        block_rows = blocks.any(axis=1)
+        if not block_rows.any():
+            return None
+        self.stats["changed_blocks"] += int(blocks.sum())
+        return np.repeat(block_rows, size)[:height]
+
+    def find_bands(self, gray):
+        """(top, bottom) bands of whole text lines, cut midway between lines.
+
+        Where to cut is decided by the content of the line above the gap, not
+        by its position, so after a scroll the same lines fall into the same
+        bands again and are found in the cache. Bands are half to twice
+        band_height tall.
+        """
+        background = int(np.median(gray[::4, ::4]))
+        ink = np.abs(gray.astype(np.int16) - background) > self.threshold
+        # Borders and scrollbars run through every row; they must not join all lines into one
+        ink = ink[:, ink.mean(axis=0) < 0.5]
+        edges = np.diff(np.concatenate(([0], ink.any(axis=1).astype(np.int8), [0])))
+        starts, ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+        if len(starts) == 0:
+            return []
+        bands = []
+        top = 0
+        for index in range(1, len(starts)):
+            cut = int(ends[index - 1] + starts[index]) // 2
+            height = cut - top
+            if height < self.band_height // 2:
+                continue
+            line = gray[starts[index - 1]:ends[index - 1]].tobytes()
+            if height >= self.band_height * 2 or hashlib.blake2b(line, digest_size=1).digest()[0] % 4 == 0:
+                bands.append((top, cut))
+                top = cut
+        bands.append((top, gray.shape[0]))
+        return bands
+
+    def update(self, image):
+        """Read a new frame of the region (a PIL image); returns its text, or None if it is unchanged"""
+        gray = np.asarray(image.convert("L"))
+        self.stats["frames"] += 1
+        rows = self.changed_rows(gray)
+        if rows is None:
+            self.stats["idle_frames"] += 1
+            return None
+
+        bands, unread = {}, {}
+        for band in self.find_bands(gray):
+            top, bottom = band
+            if band in self.bands and not rows[top:bottom].any():
+                bands[band] = self.bands[band]
+                self.stats["bands_kept"] += 1
+                continue
+            key = hashlib.blake2b(gray[top:bottom].tobytes(), digest_size=16).digest()
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                bands[band] = self.cache[key]
+                self.stats["bands_cached"] += 1
+            else:
+                unread[band] = key
+        if unread:
+            texts = self.ocr([image.crop((0, top, image.width, bottom)) for top, bottom in unread])
+            for (band, key), text in zip(unread.items(), texts):
+                bands[band] = self.cache[key] = (text or "").strip()
+            while len(self.cache) > self.cache_entries:
+                self.cache.popitem(last=False)
+            self.stats["bands_read"] += len(unread)
+
+        # Only now, so a frame whose OCR failed is compared against again on the next tick
+        self.previous, self.bands = gray, bands
+        return "\n".join(text for _, text in sorted(bands.items()) if text)
+
+def grab_region(rect):
+    """Grab a rect of the primary screen, in logical coordinates, as a QImage"""
+    return QApplication.primaryScreen().grabWindow(0, rect.x(), rect.y(), rect.width(), rect.height()).toImage()
+
+def watch_prompt(text, changes):
+    """Question for a watched region's text; the first reading is asked about like a capture"""
+    return WATCH_PROMPT.format(changes=changes, text=text) if changes else text
+
+class RegionWatcher(QObject):
+    """Re-reads a pinned screen region on a timer and reports when its text changes.
+
+    Frames are grabbed on the GUI thread, which owns the screen, and read by
+    IncrementalOcr on a worker thread. At most one frame waits for the
+    worker; ticks that find it still waiting are skipped. Text changes are
+    reported at most once per min_query_seconds, always with the newest text.
+    """
+    textChanged = pyqtSignal(str, str)  # current text, new or changed lines ("" for the first reading)
+
+    def __init__(self, rect, interval_ms=WATCH_INTERVAL_MS, reader=None, grab=grab_region,
+                 min_query_seconds=WATCH_MIN_QUERY_SECONDS):
+        super().__init__()
+        self.rect = QRect(rect)
+        self.reader = reader or IncrementalOcr()
+        self.grab = grab
+        self.min_query_seconds = min_query_seconds
+        self.frames = queue.Queue(maxsize=1)
+        self.latest = None  # Newest text read from the region
+        self.sent_key = None  # Whitespace-normalized text last reported
+        self.sent_lines = None
+        self.last_query = None
+        self.stats = Counter()
+        self.worker = None
+        self.timer = QTimer(self)
+        self.timer.setInterval(interval_ms)
+        self.timer.timeout.connect(self.tick)
+
+    def start(self):
+        self.worker = threading.Thread(target=self._run, name="region-watcher", daemon=True)
+        self.worker.start()
+        self.timer.start()
+        self.tick()
+
+    def tick(self):
+        if self.frames.full():
+            self.stats["skipped_ticks"] += 1
+            return
+        try:
+            image = self.grab(self.rect)
+        except Exception as e:
+            print(f"Watch: could not grab the region: {e}")
+            return
+        self.frames.put_nowait(image)
+
+    def _run(self):
+        while True:
+            image = self.frames.get()
+            if image is None:
+                break
+            try:
+                text = self.reader.update(qimage_to_pil(image))
+            except Exception as e:
+                print(f"Watch: reading the region failed: {e}")
+                continue
+            self._report(text)
+
+    def _report(self, text):
+        if text is not None:
+            self.latest = text
+        if self.latest is None:
+            return
+        key = " ".join(self.latest.split())
+        if not key or key == self.sent_key:
+            return
+        now = time.monotonic()
+        if self.last_query is not None and now - self.last_query < self.min_query_seconds:
+            return  # Sent from a later tick, idle or not, once the interval has passed
+        lines = [line for line in self.latest.splitlines() if line.strip()]
+        changes = ""
+        if self.sent_lines is not None:
+            seen = set(self.sent_lines)
+            changes = "\n".join(line for line in lines if line not in seen)
+        self.sent_key, self.sent_lines, self.last_query = key, lines, now
+        self.stats["text_changes"] += 1
+        print(f"Watch: region text changed ({len(lines)} lines)")
+        self.textChanged.emit(self.latest, changes)
+
+    def snapshot(self):
+        """Region, frame and band counters for status replies"""
+        stats = dict(self.reader.stats)
+        stats.update(self.stats)
+        stats["rect"] = [self.rect.x(), self.rect.y(), self.rect.width(), self.rect.height()]
+        return stats
+
+    def stop(self):
+        self.timer.stop()
+        try:
+            self.frames.get_nowait()  # A frame nobody will read; make room for the stop marker
+        except queue.Empty:
+            pass
+        self.frames.put(None)
+        if self.worker is not None:
+            self.worker.join(2.0)
+
+# --- Background Warm-up ---
+def warm_up():
+    """Pay import, engine start-up and TLS costs before the first capture needs them"""
+    steps = (
+        ("OCR engine", lambda: get_ocr_engine().warm_up()),
+        ("image preprocessing", lambda: preprocess_image(Image.new("RGB", (64, 32), "white"))),
+        ("API connection", lambda: get_gemini_client().warm_up()),
+    )
+    for label, step in steps:
+        started = time.perf_counter()
+        try:
+            step()
+        except Exception as e:
+            print(f"Warm-up of {label} failed: {e}")
+        mark_startup(f"{label} warm", time.perf_counter() - started)
+    if STARTUP_REPORT:
+        print(startup_report())
 
 # --- Hotkey Listener Thread ---
+class TriggerDebouncer:
+    """Collapses a burst of triggers into one: a trigger within interval of the previous one is ignored"""
+
+    def __init__(self, interval=CAPTURE_DEBOUNCE_SECONDS):
+        self.interval = interval
+        self.last_trigger = None
+
+    def accept(self):
+        now = time.monotonic()
+        repeated = self.last_trigger is not None and now - self.last_trigger < self.interval
+        # Every trigger restarts the quiet period, so held-down auto-repeat never gets through
+        self.last_trigger = now
+        return not repeated
+
+
 class HotkeyListener(QThread):
     capturePressed = pyqtSignal()
     toggleUIPressed = pyqtSignal()
+    watchPressed = pyqtSignal()
     
     def __init__(self):
         super().__init__()
         self.current_keys = set()
         self.is_running = True
+        self.listener = None
 
     def run(self):
+        # pynput is imported here, on the listener thread, rather than at start-up
+        capture_key = getattr(keyboard.Key, CAPTURE_HOTKEY)
+        toggle_key = getattr(keyboard.Key, TOGGLE_UI_HOTKEY)
+        watch_key = getattr(keyboard.Key, WATCH_HOTKEY)
+
         def on_press(key):
             if not self.is_running:
                 return
@@ -143,13 +806,17 @@ class HotkeyListener(QThread):
             try:
                 self.current_keys.add(key)
                 
-                if key == keyboard.Key.f12:
-                    print("F12 (Capture) detected!")
+                if key == capture_key:
+                    print(f"{CAPTURE_HOTKEY.upper()} (Capture) detected!")
                     self.capturePressed.emit()
                 
-                elif key == keyboard.Key.f11:
-                    print("F11 (Toggle UI) detected!")
+                elif key == toggle_key:
+                    print(f"{TOGGLE_UI_HOTKEY.upper()} (Toggle UI) detected!")
                     self.toggleUIPressed.emit()
+
+                elif key == watch_key:
+                    print(f"{WATCH_HOTKEY.upper()} (Watch region) detected!")
+                    self.watchPressed.emit()
                     
             except Exception as e:
                 print(f"Error in on_press: {e}")
@@ -165,20 +832,26 @@ class HotkeyListener(QThread):
                 print(f"Error in on_release: {e}")
 
         try:
-            print("Starting keyboard listener... F12=Capture, F11=Toggle UI")
+            print("Starting keyboard listener... F12=Capture, F11=Toggle UI, F10=Watch region")
             with keyboard.Listener(on_press=on_press, on_release=on_release) as listener:
+                self.listener = listener
+                listener.wait()
+                mark_startup("hotkeys ready")
                 listener.join()
         except Exception as e:
             print(f"Keyboard listener error: {e}")
 
     def stop(self):
         self.is_running = False
+        # run() is blocked in listener.join(), so the pynput listener has to be stopped first
+        if self.listener is not None:
+            self.listener.stop()
         self.quit()
-        self.wait()
+        self.wait(2000)
 
 # --- Screen Capture Widget ---
 class SelectionWindow(QWidget):
-    selectionFinished = pyqtSignal(QRect)
+    selectionFinished = pyqtSignal(QRect, QImage)  # Selected rect and its pixels from the frozen frame
 
     def __init__(self, parent=None):
         super().__init__(parent)
@@ -187,43 +860,66 @@ class SelectionWindow(QWidget):
             Qt.WindowType.WindowStaysOnTopHint
         )
         self.setAttribute(Qt.WidgetAttribute.WA_TranslucentBackground)
+        # Every paint covers its dirty area with the screenshot, so skip clearing it first
+        self.setAttribute(Qt.WidgetAttribute.WA_OpaquePaintEvent)
         self.setCursor(Qt.CursorShape.CrossCursor)
-        self.showFullScreen()
 
+        # Freeze the screen before our own window appears on it
         self.screen = QApplication.primaryScreen()
         self.screenshot = self.screen.grabWindow(0)
+        self.pixel_ratio = self.screenshot.devicePixelRatio()
         self.begin = QPoint()
         self.end = QPoint()
         self.selecting = False
 
+        self.showFullScreen()
+
+    def selection_rect(self):
+        return QRect(self.begin, self.end).normalized()
+
+    def _band_area(self, rect):
+        """Widget area touched by the rubber band drawn for rect, pen included"""
+        return rect.adjusted(-2, -2, 2, 2)
+
+    def _to_pixels(self, rect):
+        """Map a logical widget rect to screenshot pixels on high-DPI screens"""
+        ratio = self.pixel_ratio
+        return QRect(int(rect.x() * ratio), int(rect.y() * ratio),
+                     int(rect.width() * ratio), int(rect.height() * ratio))
+
     def paintEvent(self, event):
         painter = QPainter(self)
-        painter.drawPixmap(0, 0, self.screenshot)
+        # Only redraw the damaged part of the frozen frame; the painter is clipped to the region
+        dirty = event.rect()
+        painter.drawPixmap(dirty, self.screenshot, self._to_pixels(dirty))
 
         if self.selecting:
             painter.setPen(QColor(255, 0, 0, 200))
             painter.setBrush(QColor(0, 0, 255, 50))
-            rect = QRect(self.begin, self.end).normalized()
-            painter.drawRect(rect)
+            painter.drawRect(self.selection_rect())
 
     def mousePressEvent(self, event):
         if event.button() == Qt.MouseButton.LeftButton:
             self.begin = event.pos()
             self.end = event.pos()
             self.selecting = True
-            self.update()
+            self.update(self._band_area(self.selection_rect()))
 
     def mouseMoveEvent(self, event):
         if self.selecting:
+            old_area = self._band_area(self.selection_rect())
             self.end = event.pos()
-            self.update()
+            new_area = self._band_area(self.selection_rect())
+            self.update(QRegion(old_area).united(QRegion(new_area)))
 
     def mouseReleaseEvent(self, event):
         if event.button() == Qt.MouseButton.LeftButton and self.selecting:
             self.selecting = False
             rect = QRect(self.begin, self.end).normalized()
             if not rect.isEmpty() and rect.width() > 0 and rect.height() > 0:
-                self.selectionFinished.emit(rect)
+                # Crop from the frozen frame: no second grab, and our own windows are never in it
+                cropped = self.screenshot.copy(self._to_pixels(rect)).toImage()
+                self.selectionFinished.emit(rect, cropped)
             self.close()
 
     def keyPressEvent(self, event):
@@ -231,6 +927,257 @@ class SelectionWindow(QWidget):
             self.close()
         super().keyPressEvent(event)
 
+# --- Response History Model ---
+class HistoryEntry:
+    __slots__ = ("sequence", "number", "timestamp", "question", "answer", "cached")
+
+    def __init__(self, sequence, number, question, answer="", cached=False, timestamp=None):
+        self.sequence = sequence
+        self.number = number
+        self.timestamp = timestamp or time.strftime("%H:%M:%S")
+        self.question = question
+        self.answer = answer
+        self.cached = cached
+
+    def header(self):
+        question = self.question[:100] + ('...' if len(self.question) > 100 else '')
+        return f"Request #{self.number} - {self.timestamp}\nQuestion: {question}"
+
+    def label(self):
+        return 'Answer (cached)' if self.cached else 'Answer'
+
+    def preview(self):
+        """Fixed three-line summary for the list; only the head of the answer is touched"""
+        question = " ".join(self.question[:100].split())
+        answer = " ".join(self.answer[:HISTORY_PREVIEW_CHARS].split())
+        return f"Request #{self.number} - {self.timestamp}\nQuestion: {question}\n{self.label()}: {answer}"
+
+    def render(self):
+        """Full text of the entry"""
+        return f"{self.header()}\n{self.label()}: {self.answer}"
+
+class HistoryModel(QAbstractListModel):
+    """Ring buffer of Q&A entries for a QListView.
+
+    Appending is O(1) regardless of history length: once the cap is reached
+    the oldest entry is dropped. Rows are fixed-height previews, so the view
+    can use uniform item sizes and only renders the rows it shows.
+    """
+
+    def __init__(self, capacity=HISTORY_MAX_ENTRIES, parent=None):
+        super().__init__(parent)
+        self.capacity = capacity
+        self.entries = deque()
+        self.next_sequence = 0
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.entries)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid() or index.row() >= len(self.entries):
+            return None
+        if role == Qt.ItemDataRole.DisplayRole:
+            return self.entries[index.row()].preview()
+        return None
+
+    def append(self, number, question, answer="", cached=False):
+        """Add an entry at the bottom, evicting the oldest one if full; returns the entry"""
+        if len(self.entries) >= self.capacity:
+            self.beginRemoveRows(QModelIndex(), 0, 0)
+            self.entries.popleft()
+            self.endRemoveRows()
+        entry = HistoryEntry(self.next_sequence, number, question, answer, cached)
+        self.next_sequence += 1
+        row = len(self.entries)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self.entries.append(entry)
+        self.endInsertRows()
+        return entry
+
+    def row_of(self, entry):
+        """Row of an entry, or -1 if it has been evicted"""
+        if not self.entries:
+            return -1
+        row = entry.sequence - self.entries[0].sequence
+        return row if 0 <= row < len(self.entries) and self.entries[row] is entry else -1
+
+    def update_entry(self, entry, answer=None, append=None):
+        if answer is not None:
+            entry.answer = answer
+        if append:
+            entry.answer += append
+        row = self.row_of(entry)
+        if row >= 0:
+            index = self.index(row)
+            self.dataChanged.emit(index, index, [Qt.ItemDataRole.DisplayRole])
+
+    def clear(self):
+        self.beginResetModel()
+        self.entries.clear()
+        self.endResetModel()
+
+# --- Persistent History Store ---
+def to_fts_query(text):
+    """Turn free text into a safe FTS5 query: every word must match, the last one as a prefix"""
+    words = [word.replace('"', '""') for word in text.split()]
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words[:-1]] + [f'"{words[-1]}"*']
+    return " ".join(terms)
+
+class HistoryStore:
+    """SQLite-backed Q&A history with an FTS5 index over questions and answers.
+
+    add() only enqueues; a writer thread commits rows in batches so the GUI
+    never waits on disk. Reads use their own connection (WAL mode), so
+    searches are not blocked by writes.
+    """
+
+    def __init__(self, db_path=HISTORY_DB_PATH, batch_size=HISTORY_WRITE_BATCH):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.pending = queue.Queue()
+
+        writer = sqlite3.connect(db_path, check_same_thread=False)
+        writer.execute("PRAGMA journal_mode=WAL")
+        writer.execute("PRAGMA synchronous=NORMAL")
+        writer.executescript("""
+            CREATE TABLE IF NOT EXISTS qa_history (
+                id INTEGER PRIMARY KEY,
+                created_at REAL NOT NULL,
+                question TEXT NOT NULL,
+                answer TEXT NOT NULL,
+                cached INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE VIRTUAL TABLE IF NOT EXISTS qa_history_fts USING fts5(
+                question, answer, content='qa_history', content_rowid='id'
+            );
+            CREATE TRIGGER IF NOT EXISTS qa_history_insert AFTER INSERT ON qa_history BEGIN
+                INSERT INTO qa_history_fts (rowid, question, answer) VALUES (new.id, new.question, new.answer);
+            END;
+            CREATE TRIGGER IF NOT EXISTS qa_history_delete AFTER DELETE ON qa_history BEGIN
+                INSERT INTO qa_history_fts (qa_history_fts, rowid, question, answer)
+                VALUES ('delete', old.id, old.question, old.answer);
+            END;
+        """)
+        writer.commit()
+        self.writer_db = writer
+        self.reader_db = sqlite3.connect(db_path, check_same_thread=False)
+        self.reader_lock = threading.Lock()
+
+        self.writer_thread = threading.Thread(target=self._write_loop, name="history-writer", daemon=True)
+        self.writer_thread.start()
+
+    def add(self, question, answer, cached=False):
+        """Queue a Q&A pair for writing; never blocks"""
+        self.pending.put((time.time(), question, answer, int(cached)))
+
+    def _write_loop(self):
+        while True:
+            item = self.pending.get()
+            batch = []
+            stop = item is None
+            if not stop:
+                batch.append(item)
+            # Drain whatever else is waiting into the same transaction
+            while not stop and len(batch) < self.batch_size:
+                try:
+                    item = self.pending.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                else:
+                    batch.append(item)
+            if batch:
+                try:
+                    with self.writer_db:
+                        self.writer_db.executemany(
+                            "INSERT INTO qa_history (created_at, question, answer, cached) VALUES (?, ?, ?, ?)",
+                            batch,
+                        )
+                except sqlite3.Error as e:
+                    print(f"History write failed: {e}")
+            for _ in range(len(batch) + (1 if stop else 0)):
+                self.pending.task_done()
+            if stop:
+                break
+
+    def flush(self):
+        """Block until every queued entry has been committed"""
+        self.pending.join()
+
+    def _read(self, sql, params=()):
+        with self.reader_lock:
+            return self.reader_db.execute(sql, params).fetchall()
+
+    def search(self, text, limit=HISTORY_SEARCH_PAGE_SIZE, offset=0):
+        """Matching entries, newest first, as (id, created_at, question, answer, cached) rows"""
+        fts_query = to_fts_query(text)
+        if fts_query is None:
+            return []
+        # Walking the index in rowid order stops after one page; ORDER BY rank would score every match
+        return self._read(
+            "SELECT h.id, h.created_at, h.question, h.answer, h.cached FROM qa_history h "
+            "WHERE h.id IN (SELECT rowid FROM qa_history_fts WHERE qa_history_fts MATCH ? "
+            "ORDER BY rowid DESC LIMIT ? OFFSET ?) ORDER BY h.id DESC",
+            (fts_query, limit, offset),
+        )
+
+    def recent(self, limit=HISTORY_SEARCH_PAGE_SIZE, offset=0):
+        """Newest entries first"""
+        return self._read(
+            "SELECT id, created_at, question, answer, cached FROM qa_history ORDER BY id DESC LIMIT ? OFFSET ?",
+            (limit, offset),
+        )
+
+    def count(self):
+        return self._read("SELECT COUNT(*) FROM qa_history")[0][0]
+
+    def close(self):
+        self.pending.put(None)
+        self.writer_thread.join(timeout=5)
+        self.writer_db.close()
+        with self.reader_lock:
+            self.reader_db.close()
+
+class SearchResultsModel(QAbstractListModel):
+    """History search results, fetched from the store a page at a time as the view scrolls"""
+
+    def __init__(self, store, text, page_size=HISTORY_SEARCH_PAGE_SIZE, parent=None):
+        super().__init__(parent)
+        self.store = store
+        self.text = text
+        self.page_size = page_size
+        self.entries = []
+        self.exhausted = False
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.entries)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole and index.isValid() and index.row() < len(self.entries):
+            return self.entries[index.row()].preview()
+        return None
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and not self.exhausted
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid() or self.exhausted:
+            return
+        rows = self.store.search(self.text, self.page_size, len(self.entries))
+        if len(rows) < self.page_size:
+            self.exhausted = True
+        if not rows:
+            return
+        start = len(self.entries)
+        self.beginInsertRows(QModelIndex(), start, start + len(rows) - 1)
+        for row_id, created_at, question, answer, cached in rows:
+            timestamp = time.strftime("%Y-%m-%d %H:%M", time.localtime(created_at))
+            self.entries.append(HistoryEntry(row_id, row_id, question, answer, bool(cached), timestamp))
+        self.endInsertRows()
+
 # --- Main Assistant Application ---
 class MyAssistant(QWidget):
     def __init__(self):
@@ -239,6 +1186,27 @@ class MyAssistant(QWidget):
         self.setup_hotkey_listener()
         self.selection_window = None
         self.request_count = 0
+        self.pending_captures = set()
+        self.live_entries = {}  # capture id -> history entry receiving streamed text
+        self.answered = False  # First answer is a startup milestone
+        self.capture_debouncer = TriggerDebouncer()
+        self.watcher = None  # RegionWatcher while a region is pinned
+
+        # Capture -> OCR -> Gemini runs off the GUI thread
+        self.response_cache = None
+        if CACHE_ENABLED:
+            try:
+                self.response_cache = ResponseCache()
+            except sqlite3.Error as e:
+                print(f"Response cache unavailable: {e}")
+        # Traces stay open until the answer is rendered, so they include the render time
+        self.session = ConversationSession()
+        self.pipeline = CapturePipeline(cache=self.response_cache, finish_traces=False, session=self.session)
+        self.tracer = self.pipeline.tracer
+        self.pipeline.statusChanged.connect(self.on_pipeline_status)
+        self.pipeline.chunkReady.connect(self.on_pipeline_chunk)
+        self.pipeline.resultReady.connect(self.on_pipeline_result)
+        self.pipeline.captureDropped.connect(self.on_capture_dropped)
         
         # Auto-hide timer
         self.auto_hide_timer = QTimer()
@@ -272,14 +1240,73 @@ class MyAssistant(QWidget):
         """)
         self.layout.addWidget(self.status_label)
 
-        # Create scrollable text area for responses
-        self.scroll_area = QScrollArea()
-        self.scroll_area.setWidgetResizable(True)
-        self.scroll_area.setStyleSheet("""
-            QScrollArea {
+        # Placeholder shown until the first response arrives
+        self.placeholder_label = QLabel("AI responses will appear here...\n\nPress F12 to capture screen area\nPress F11 to show/hide this window\n\nSingle instance mode: Extension won't create duplicates")
+        self.placeholder_label.setWordWrap(True)
+        self.placeholder_label.setStyleSheet("""
+            color: #E0E0E0; 
+            font-size: 11px; 
+            font-family: 'Segoe UI', Arial, sans-serif;
+            background-color: rgba(50, 50, 50, 200);
+            border: 2px solid rgba(100, 100, 100, 150);
+            border-radius: 8px;
+            padding: 10px;
+        """)
+        self.layout.addWidget(self.placeholder_label)
+
+        # Full-text search over every saved answer; results load lazily while scrolling
+        self.history_store = None
+        if HISTORY_PERSIST:
+            try:
+                self.history_store = HistoryStore()
+            except sqlite3.Error as e:
+                print(f"History store unavailable: {e}")
+        self.search_box = QLineEdit()
+        self.search_box.setPlaceholderText("Search history...")
+        self.search_box.setClearButtonEnabled(True)
+        self.search_box.setStyleSheet("""
+            QLineEdit {
+                color: #E0E0E0; 
+                font-size: 11px; 
+                background-color: rgba(50, 50, 50, 200);
+                border: 1px solid rgba(100, 100, 100, 150);
+                border-radius: 4px;
+                padding: 4px;
+            }
+        """)
+        self.search_timer = QTimer()
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(250)  # Debounce keystrokes
+        self.search_timer.timeout.connect(self.run_history_search)
+        self.search_box.textChanged.connect(lambda _: self.search_timer.start())
+        self.search_box.setVisible(self.history_store is not None)
+        self.layout.addWidget(self.search_box)
+
+        # Bounded model/view history; only visible rows are laid out and rendered
+        self.history_model = HistoryModel()
+        self.history_view = QListView()
+        self.history_view.setModel(self.history_model)
+        self.history_view.setUniformItemSizes(True)  # Constant-time layout per append
+        self.history_view.setWordWrap(False)
+        self.history_view.setTextElideMode(Qt.TextElideMode.ElideRight)
+        self.history_view.setSelectionMode(QListView.SelectionMode.SingleSelection)
+        self.history_view.clicked.connect(self.show_entry_details)
+        self.history_view.setStyleSheet("""
+            QListView {
+                color: #E0E0E0; 
+                font-size: 11px; 
+                font-family: 'Segoe UI', Arial, sans-serif;
                 background-color: rgba(50, 50, 50, 200);
                 border: 2px solid rgba(100, 100, 100, 150);
                 border-radius: 8px;
+                padding: 6px;
+            }
+            QListView::item {
+                border-bottom: 1px solid rgba(150, 150, 150, 120);
+                padding: 4px;
+            }
+            QListView::item:selected {
+                background-color: rgba(0, 100, 200, 120);
             }
             QScrollBar:vertical {
                 background-color: rgba(100, 100, 100, 100);
@@ -291,25 +1318,38 @@ class MyAssistant(QWidget):
                 border-radius: 6px;
             }
         """)
-        
-        # Text display widget
-        self.result_display = QTextEdit()
-        self.result_display.setReadOnly(True)
-        self.result_display.setStyleSheet("""
+
+        # Full text of one entry at a time, so long answers are only laid out on demand
+        self.detail_display = QTextEdit()
+        self.detail_display.setReadOnly(True)
+        self.detail_display.setStyleSheet("""
             QTextEdit {
                 color: #E0E0E0; 
                 font-size: 11px; 
                 font-family: 'Segoe UI', Arial, sans-serif;
-                background-color: transparent;
-                border: none;
+                background-color: rgba(50, 50, 50, 200);
+                border: 2px solid rgba(100, 100, 100, 150);
+                border-radius: 8px;
                 padding: 10px;
-                line-height: 1.4;
             }
         """)
-        self.result_display.setText("AI responses will appear here...\n\nPress F12 to capture screen area\nPress F11 to show/hide this window\n\nSingle instance mode: Extension won't create duplicates")
-        
-        self.scroll_area.setWidget(self.result_display)
-        self.layout.addWidget(self.scroll_area)
+        self.detail_entry = None
+        self.follow_latest = True  # Detail pane tracks the newest entry until another is picked
+
+        self.history_splitter = QSplitter(Qt.Orientation.Vertical)
+        self.history_splitter.addWidget(self.history_view)
+        self.history_splitter.addWidget(self.detail_display)
+        self.history_splitter.setSizes([100, 160])
+        self.history_splitter.hide()
+        self.layout.addWidget(self.history_splitter)
+
+        # Follow-up questions continue the conversation about the answers above
+        self.follow_up_box = QLineEdit()
+        self.follow_up_box.setPlaceholderText("Ask a follow-up question...")
+        self.follow_up_box.setStyleSheet(self.search_box.styleSheet())
+        self.follow_up_box.returnPressed.connect(self.ask_follow_up)
+        self.follow_up_box.hide()
+        self.layout.addWidget(self.follow_up_box)
 
         # Control buttons
         button_layout = QVBoxLayout()
@@ -347,6 +1387,23 @@ class MyAssistant(QWidget):
             }
         """)
         button_layout.addWidget(self.test_button)
+
+        self.cancel_button = QPushButton("Cancel")
+        self.cancel_button.clicked.connect(self.cancel_captures)
+        self.cancel_button.setStyleSheet("""
+            QPushButton {
+                background-color: rgba(150, 150, 150, 150); 
+                color: white; 
+                padding: 6px; 
+                border-radius: 4px;
+                font-weight: bold;
+                font-size: 10px;
+            }
+            QPushButton:hover {
+                background-color: rgba(170, 170, 170, 180);
+            }
+        """)
+        button_layout.addWidget(self.cancel_button)
         
         self.layout.addLayout(button_layout)
 
@@ -354,8 +1411,9 @@ class MyAssistant(QWidget):
         try:
             print("Setting up hotkey listener...")
             self.hotkey_thread = HotkeyListener()
-            self.hotkey_thread.capturePressed.connect(self.start_screen_capture)
+            self.hotkey_thread.capturePressed.connect(self.request_capture)
             self.hotkey_thread.toggleUIPressed.connect(self.toggle_visibility)
+            self.hotkey_thread.watchPressed.connect(self.toggle_watch)
             self.hotkey_thread.start()
             print("Hotkey listener setup complete")
         except Exception as e:
@@ -372,10 +1430,30 @@ class MyAssistant(QWidget):
             self.raise_()
             self.activateWindow()
 
+    def cancel_captures(self):
+        """Cancel every capture that is still being processed"""
+        if not self.pending_captures:
+            self.update_status("Nothing to cancel")
+            return
+        self.pipeline.cancel()
+        self.update_status(f"Cancelling {len(self.pending_captures)} capture(s)...", 0)
+
     def clear_history(self):
-        """Clear the response history"""
-        self.result_display.clear()
-        self.result_display.setText("History cleared. Ready for new captures!\n\nPress F12 to capture screen area")
+        """Clear the session history view; saved answers stay searchable"""
+        self.search_box.blockSignals(True)
+        self.search_box.clear()
+        self.search_box.blockSignals(False)
+        self.history_view.setModel(self.history_model)
+        self.history_model.clear()
+        self.live_entries.clear()
+        self.detail_entry = None
+        self.follow_latest = True
+        self.detail_display.clear()
+        self.history_splitter.hide()
+        self.follow_up_box.hide()
+        self.session.clear()
+        self.placeholder_label.setText("History cleared. Ready for new captures!\n\nPress F12 to capture screen area")
+        self.placeholder_label.show()
         self.request_count = 0
         self.update_status("History cleared - Ready for capture")
 
@@ -385,30 +1463,77 @@ class MyAssistant(QWidget):
         if timeout > 0:
             QTimer.singleShot(timeout, lambda: self.status_label.setText("Ready - F12: Capture | F11: Toggle UI | Instance: Single"))
 
-    def add_response(self, question, answer):
+    def add_response(self, question, answer, cached=False):
         """Add a new Q&A pair to the display"""
+        return self.begin_response(question, cached, answer)
+
+    def begin_response(self, question, cached=False, answer=""):
+        """Start a new Q&A entry; streamed text is added with append_response_text"""
         self.request_count += 1
-        timestamp = time.strftime("%H:%M:%S")
-        
-        # Format the new response
-        separator = "\n" + "="*50 + "\n"
-        new_content = f"""
-Request #{self.request_count} - {timestamp}
-Question: {question[:100]}{'...' if len(question) > 100 else ''}
-Answer: {answer}
-"""
-        
-        # Add to existing content
-        current_content = self.result_display.toPlainText()
-        if "AI responses will appear here..." in current_content:
-            self.result_display.clear()
-            new_content = new_content.strip()
-        
-        self.result_display.append(separator + new_content)
-        
-        # Auto-scroll to bottom
-        scrollbar = self.scroll_area.verticalScrollBar()
-        scrollbar.setValue(scrollbar.maximum())
+        if not self.history_splitter.isVisible():
+            self.placeholder_label.hide()
+            self.history_splitter.show()
+            self.follow_up_box.show()
+        entry = self.history_model.append(self.request_count, question, answer, cached)
+        if self.follow_latest and self.history_view.model() is self.history_model:
+            self.set_detail_entry(entry)
+            self.history_view.scrollToBottom()
+        return entry
+
+    def append_response_text(self, entry, text):
+        """Append answer text to an existing entry"""
+        self.history_model.update_entry(entry, append=text)
+        if entry is self.detail_entry:
+            cursor = self.detail_display.textCursor()
+            cursor.movePosition(QTextCursor.MoveOperation.End)
+            cursor.insertText(text)
+
+    def set_answer_text(self, entry, answer):
+        """Replace an entry's answer, e.g. with the final text after streaming"""
+        self.history_model.update_entry(entry, answer=answer)
+        if entry is self.detail_entry:
+            self.detail_display.setPlainText(entry.render())
+
+    def set_detail_entry(self, entry):
+        self.detail_entry = entry
+        self.detail_display.setPlainText(entry.render())
+        if self.history_view.model() is self.history_model:
+            row = self.history_model.row_of(entry)
+            if row >= 0:
+                self.history_view.setCurrentIndex(self.history_model.index(row))
+
+    def show_entry_details(self, index):
+        """Render the full text of the clicked entry"""
+        model = self.history_view.model()
+        entries = model.entries
+        if 0 <= index.row() < len(entries):
+            self.follow_latest = model is self.history_model and index.row() == len(entries) - 1
+            self.set_detail_entry(entries[index.row()])
+
+    def run_history_search(self):
+        """Show saved entries matching the search box, or the current session when it is empty"""
+        text = self.search_box.text().strip()
+        if not text:
+            self.history_view.setModel(self.history_model)
+            self.follow_latest = True
+            if self.history_model.entries:
+                self.set_detail_entry(self.history_model.entries[-1])
+                self.history_view.scrollToBottom()
+            return
+        if self.history_store is None:
+            return
+        results = SearchResultsModel(self.history_store, text, parent=self)
+        results.fetchMore()
+        self.history_view.setModel(results)
+        self.follow_latest = False
+        self.placeholder_label.hide()
+        self.history_splitter.show()
+        if results.entries:
+            self.set_detail_entry(results.entries[0])
+        else:
+            self.detail_entry = None
+            self.detail_display.setPlainText(f"No saved answers match '{text}'.")
+        self.update_status(f"Search: {len(results.entries)}{'+' if results.canFetchMore() else ''} match(es)")
 
     def mousePressEvent(self, event):
         if event.button() == Qt.MouseButton.LeftButton:
@@ -421,52 +1546,204 @@ Answer: {answer}
     def mouseReleaseEvent(self, event):
         self.offset = QPoint()
 
-    def start_screen_capture(self):
+    def request_capture(self):
+        """Open the selection window for a hotkey press, ignoring auto-repeat and double presses"""
+        if not self.capture_debouncer.accept():
+            return False
+        if self.selection_window is not None and self.selection_window.isVisible():
+            return False
+        self.start_screen_capture()
+        return True
+
+    def start_screen_capture(self, on_selected=None):
         print("Starting screen capture...")
         self.update_status("Select an area on your screen...", 0)
         self.hide()
 
+        if self.selection_window is not None and self.selection_window.isVisible():
+            self.selection_window.close()
         self.selection_window = SelectionWindow()
-        self.selection_window.selectionFinished.connect(self.process_selection)
+        self.selection_window.selectionFinished.connect(on_selected or self.process_selection)
         self.selection_window.show()
 
-    def process_selection(self, rect: QRect):
+    def toggle_watch(self):
+        """Stop watching the pinned region, or select a region to start watching"""
+        if self.watcher is not None:
+            self.stop_watch()
+            self.update_status("Stopped watching the region")
+        else:
+            self.start_screen_capture(self.start_watch)
+
+    def start_watch(self, rect, image=None):
+        """Pin rect and ask Gemini about its text whenever that text changes"""
+        self.stop_watch()
         self.show()
-        self.update_status("Processing selected area...", 0)
-        QApplication.processEvents()
+        # Keep our own window out of the region, or every answer would change what we watch
+        if self.frameGeometry().intersects(rect):
+            screen = QApplication.primaryScreen().availableGeometry()
+            x = rect.right() + 10
+            if x + self.width() > screen.right():
+                x = max(screen.left(), rect.left() - self.width() - 10)
+            self.move(x, self.y())
+        self.watcher = RegionWatcher(rect)
+        self.watcher.textChanged.connect(self.on_watch_text)
+        self.watcher.start()
+        print(f"Watching region {rect.x()},{rect.y()} {rect.width()}x{rect.height()}")
+        self.update_status(f"Watching {rect.width()}x{rect.height()} region - {WATCH_HOTKEY.upper()} to stop")
+
+    def stop_watch(self):
+        if self.watcher is not None:
+            self.watcher.stop()
+            self.watcher = None
 
-        # Capture the selected region
-        screen = QApplication.primaryScreen()
-        screenshot_pixmap = screen.grabWindow(0, rect.x(), rect.y(), rect.width(), rect.height())
+    def on_watch_text(self, text, changes):
+        """The watched region's text changed; ask about it without disturbing the user's own questions"""
+        self.ask_question(watch_prompt(text, changes), watch=True)
 
-        if screenshot_pixmap.isNull():
+    def ask_question(self, text, follow_up=False, watch=False):
+        """Send typed or forwarded text to Gemini without a screen capture"""
+        if follow_up:
+            capture_id = self.pipeline.submit_follow_up(text)
+        elif watch:
+            capture_id = self.pipeline.submit_watch(text)
+        else:
+            capture_id = self.pipeline.submit_text(text)
+        if capture_id is None:
+            self.update_status("Busy - too many captures in progress, try again shortly", 5000)
+            return None
+        self.pending_captures.add(capture_id)
+        self.update_status(f"Processing {len(self.pending_captures)} capture(s)...", 0)
+        return capture_id
+
+    def ask_follow_up(self):
+        """Send the follow-up box's question along with the conversation so far"""
+        text = self.follow_up_box.text().strip()
+        if text and self.ask_question(text, follow_up=True) is not None:
+            self.follow_up_box.clear()
+
+    def handle_remote_command(self, command):
+        """Run a command forwarded by another invocation; returns the reply sent back to it"""
+        name, _, argument = command.strip().partition(" ")
+        print(f"Instance command: {name}")
+        if name == "capture":
+            self.start_screen_capture()
+        elif name == "toggle":
+            self.toggle_visibility()
+        elif name == "show":
+            if not self.isVisible():
+                self.toggle_visibility()
+        elif name in ("ask", "followup"):
+            if not argument.strip():
+                return {"ok": False, "error": f"{name} needs some text"}
+            self.show()
+            capture_id = self.ask_question(argument.strip(), follow_up=name == "followup")
+            if capture_id is None:
+                return {"ok": False, "error": "pipeline is full"}
+            return {"ok": True, "capture_id": capture_id}
+        elif name == "watch":
+            self.toggle_watch()
+        elif name == "status":
+            pass
+        elif name == "quit":
+            QTimer.singleShot(0, self.quit_application)
+        else:
+            return {"ok": False, "error": f"unknown command '{name}'",
+                    "commands": list(instance_control.COMMANDS)}
+        selection = self.selection_window
+        reply = {
+            "ok": True,
+            "pid": os.getpid(),
+            "visible": self.isVisible(),
+            "selecting": selection is not None and selection.isVisible(),
+            "pending": len(self.pending_captures),
+            "watching": self.watcher is not None,
+        }
+        if name == "status":
+            reply["routing"] = self.pipeline.router.snapshot()
+            reply["latency"] = self.tracer.snapshot()
+            reply["session"] = self.session.snapshot()
+            if self.watcher is not None:
+                reply["watch"] = self.watcher.snapshot()
+            if gemini_core._gemini_client is not None:
+                reply["api"] = gemini_core._gemini_client.metrics_snapshot()
+            if gemini_core._backend is not None:
+                reply["backend"] = {"name": gemini_core._backend.name, **gemini_core._backend.snapshot()}
+        return reply
+
+    def process_selection(self, rect: QRect, image: QImage):
+        self.show()
+        self.update_status("Processing selected area...", 0)
+
+        if image.isNull():
             self.update_status("Error: Could not capture screen.", 5000)
             self.add_response("Screen capture failed", "Screenshot failed. Check your system permissions.")
             return
 
-        # Save to a temporary file for OCR
-        temp_image_path = "temp_screenshot.png"
-        screenshot_pixmap.save(temp_image_path)
+        # The selection window already cropped the region from its frozen screenshot
+        capture_id = self.pipeline.submit(image)
+        if capture_id is None:
+            self.update_status("Busy - too many captures in progress, try again shortly", 5000)
+            return
+
+        self.pending_captures.add(capture_id)
+        self.update_status(f"Processing {len(self.pending_captures)} capture(s)...", 0)
 
-        # Perform OCR
-        self.update_status("Extracting text from image...", 0)
-        extracted_text = perform_ocr(temp_image_path)
-        
-        # Clean up temp file
-        try:
-            os.remove(temp_image_path)
-        except:
-            pass
+    def on_pipeline_status(self, capture_id, message):
+        """Show progress for the most recent capture still in flight"""
+        if self.pending_captures and capture_id == max(self.pending_captures):
+            self.update_status(message, 0)
 
-        if extracted_text and extracted_text.strip():
-            self.update_status("Text extracted. Calling AI...", 0)
-            ai_response = call_generative_ai_api(extracted_text)
-            self.add_response(extracted_text.strip(), ai_response)
+    def on_pipeline_chunk(self, capture_id, question, text):
+        """Render streamed answer text into the capture's own history entry"""
+        with self.tracer.span(capture_id, "render"):
+            entry = self.live_entries.get(capture_id)
+            if entry is None:
+                entry = self.live_entries[capture_id] = self.begin_response(question)
+            self.append_response_text(entry, text)
+
+    def on_capture_dropped(self, capture_id):
+        """A newer capture superseded this one before anything was shown for it"""
+        self.pending_captures.discard(capture_id)
+        self.live_entries.pop(capture_id, None)
+        self.tracer.finish(capture_id, "dropped")
+        if self.pending_captures:
+            self.update_status(f"Processing {len(self.pending_captures)} capture(s)...", 0)
+
+    def on_pipeline_result(self, capture_id, question, answer, cached):
+        """Receive a finished capture from the pipeline on the GUI thread"""
+        if not self.answered:
+            self.answered = True
+            mark_startup("first answer")
+            if STARTUP_REPORT:
+                print(startup_report())
+        self.pending_captures.discard(capture_id)
+        with self.tracer.span(capture_id, "render"):
+            entry = self.live_entries.pop(capture_id, None)
+            if entry is not None:
+                # Already on screen from streaming; the final text may add an error or cancel note
+                if answer != entry.answer:
+                    self.set_answer_text(entry, answer)
+            else:
+                self.add_response(question, answer, cached)
+        if self.history_store and not cached and not is_error_response(answer):
+            self.history_store.add(question, answer)
+        trace = self.tracer.finish(capture_id, result_outcome(answer, cached))
+        if self.pending_captures:
+            self.update_status(f"Processing {len(self.pending_captures)} capture(s)...", 0)
+        elif cached and self.response_cache:
+            stats = self.response_cache.stats()
+            hits = stats['memory_hits'] + stats['disk_hits']
+            print(f"Cache hit - memory: {stats['memory_hits']}, disk: {stats['disk_hits']}, misses: {stats['misses']}")
+            self.update_status(f"Answer from cache - hits: {hits} | misses: {stats['misses']}")
+        elif TRACE_STATUS_BREAKDOWN and trace:
+            self.update_status(Tracer.breakdown(trace), 8000)
         else:
-            self.update_status("No text found in selection.", 5000)
-            self.add_response("No text detected", "Could not extract text from the selected area.")
+            self.update_status("Ready - F12: Capture | F11: Toggle UI | Instance: Single")
 
-        self.update_status("Ready - F12: Capture | F11: Toggle UI | Instance: Single")
+    def quit_application(self):
+        """Close the window (running its cleanup) and leave the event loop"""
+        self.close()
+        QApplication.instance().quit()
 
     def auto_hide(self):
         """Auto-hide the window after inactivity"""
@@ -478,19 +1755,41 @@ Answer: {answer}
         """Clean up when closing"""
         if hasattr(self, 'hotkey_thread'):
             self.hotkey_thread.stop()
+        if getattr(self, 'watcher', None):
+            self.stop_watch()
+        if hasattr(self, 'pipeline'):
+            self.pipeline.stop()
+            self.tracer.close()
+        if gemini_core._backend is not None:
+            gemini_core._backend.close()
+        if gemini_core._gemini_client is not None:
+            gemini_core._gemini_client.close()
+        if getattr(self, 'response_cache', None):
+            self.response_cache.close()
+        if getattr(self, 'history_store', None):
+            self.history_store.close()
+        if gemini_core._ocr_engine is not None:
+            gemini_core._ocr_engine.close()
+        shutdown_ocr_pool()
         if hasattr(self, 'auto_hide_timer'):
             self.auto_hide_timer.stop()
         event.accept()
 
 # --- Main Application Entry Point ---
 if __name__ == "__main__":
-    # Single instance check
-    instance_checker = SingleInstanceChecker()
-    
-    if instance_checker.is_another_instance_running():
-        print("Another instance is already running. Exiting...")
-        sys.exit(1)
-    
+    # Usage: gemini_desktop_app.py [capture | toggle | show | watch | status | quit | ask <text> | followup <text>]
+    command = " ".join(sys.argv[1:]).strip()
+    instance_server = InstanceServer()
+
+    if not instance_server.acquire():
+        # Hand the command to the warm instance instead of starting a second one
+        reply = instance_control.send_command(command or "show")
+        if reply is None:
+            print("Another instance holds the lock but is not responding. Exiting...")
+            sys.exit(1)
+        print(f"Forwarded '{command or 'show'}' to the running instance: {json.dumps(reply)}")
+        sys.exit(0 if reply.get("ok") else 1)
+
     # Create .env file if it doesn't exist
     if not os.path.exists(".env"):
         with open(".env", "w") as f:
@@ -498,13 +1797,23 @@ if __name__ == "__main__":
         print("\n*** IMPORTANT: A '.env' file has been created. ***")
         print("Please add your Gemini API Key to the .env file.")
 
+    mark_startup("modules imported")
     app = QApplication(sys.argv)
     app.setQuitOnLastWindowClosed(False)
-    
-    # Start single instance server
-    instance_checker.start_server()
-    
+
     assistant = MyAssistant()
+    mark_startup("window created")
+
+    # Start accepting commands from later invocations
+    if instance_server.start(assistant.handle_remote_command):
+        mark_startup("instance server listening")
+    if command:
+        QTimer.singleShot(0, lambda: assistant.handle_remote_command(command))
+    QTimer.singleShot(0, lambda: mark_startup("event loop running"))
+
+    # Load OCR and open the API connection in the background so the first capture is warm
+    if WARM_UP:
+        QTimer.singleShot(0, lambda: threading.Thread(target=warm_up, name="warm-up", daemon=True).start())
     
     print("\n" + "="*50)
     print("Gemini Desktop Assistant Started (Single Instance)")
@@ -518,4 +1827,4 @@ if __name__ == "__main__":
     try:
         sys.exit(app.exec())
     finally:
-        instance_checker.stop_server()
\ No newline at end of file
+        instance_server.stop()
@@ -0,0 +1,146 @@
+# instance_control.py - Control channel to the running Gemini Desktop Assistant
+#
+# The running app listens on a local socket (a Unix domain socket, or a named
+# pipe on Windows) and accepts small framed text commands:
+#
+#   capture      open the screen selection window
+#   toggle       show/hide the assistant window
+#   show         show the assistant window
+#   ask <text>   send <text> straight to Gemini
+#   followup <text>  ask <text> as a follow-up to the previous answers
+#   watch        start (by selecting a region) or stop watching a screen region
+#   status       report whether the app is busy
+#   quit         exit the app
+#
+# Every frame is a 4-byte little-endian length followed by that many bytes of
+# UTF-8. Requests are command lines, replies are JSON objects. This module only
+# uses the standard library so the native messaging host can import it cheaply.
+
+import os
+import sys
+import json
+import time
+import socket
+import struct
+import getpass
+import tempfile
+
+INSTANCE_NAME = os.getenv("GEMINI_INSTANCE_NAME", "gemini-desktop-assistant")
+COMMANDS = ("capture", "toggle", "show", "ask", "followup", "watch", "status", "quit")
+
+
+def _user_suffix():
+    try:
+        return getpass.getuser()
+    except Exception:
+        return "user"
+
+
+def server_address():
+    """Socket path (or pipe name on Windows) the running instance listens on"""
+    if sys.platform == "win32":
+        return rf"\\.\pipe\{INSTANCE_NAME}-{_user_suffix()}"
+    return os.path.join(tempfile.gettempdir(), f"{INSTANCE_NAME}-{_user_suffix()}.sock")
+
+
+def lock_path():
+    """Lock file held by the running instance for its whole lifetime"""
+    return os.path.join(tempfile.gettempdir(), f"{INSTANCE_NAME}-{_user_suffix()}.lock")
+
+
+def encode_frame(text):
+    data = text.encode("utf-8")
+    return struct.pack("<I", len(data)) + data
+
+
+def decode_frames(buffer):
+    """Split complete frames off the front of buffer; returns (texts, remaining bytes)"""
+    texts = []
+    while len(buffer) >= 4:
+        length = struct.unpack("<I", buffer[:4])[0]
+        if len(buffer) < 4 + length:
+            break
+        texts.append(buffer[4:4 + length].decode("utf-8"))
+        buffer = buffer[4 + length:]
+    return texts, buffer
+
+
+class InstanceConnection:
+    """Client connection to the running instance; can carry many commands"""
+
+    def __init__(self, timeout=2.0):
+        self.timeout = timeout
+        self.pipe = None
+        self.sock = None
+        address = server_address()
+        if sys.platform == "win32":
+            deadline = time.monotonic() + timeout
+            while True:
+                try:
+                    self.pipe = open(address, "r+b", buffering=0)
+                    break
+                except FileNotFoundError:
+                    raise ConnectionRefusedError(f"No instance listening on {address}")
+                except OSError:
+                    # Pipe busy with another client; retry until the deadline
+                    if time.monotonic() > deadline:
+                        raise
+                    time.sleep(0.01)
+        else:
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.settimeout(timeout)
+            try:
+                self.sock.connect(address)
+            except OSError:
+                self.sock.close()
+                raise
+
+    def _write(self, data):
+        if self.pipe:
+            self.pipe.write(data)
+        else:
+            self.sock.sendall(data)
+
+    def _read_exact(self, size):
+        chunks = []
+        while size:
+            chunk = self.pipe.read(size) if self.pipe else self.sock.recv(size)
+            if not chunk:
+                raise ConnectionError("Instance closed the connection")
+            chunks.append(chunk)
+            size -= len(chunk)
+        return b"".join(chunks)
+
+    def request(self, command):
+        """Send one command line and return the decoded JSON reply"""
+        self._write(encode_frame(command))
+        length = struct.unpack("<I", self._read_exact(4))[0]
+        return json.loads(self._read_exact(length).decode("utf-8"))
+
+    def close(self):
+        if self.pipe:
+            self.pipe.close()
+        if self.sock:
+            self.sock.close()
+
+
+def send_command(command, timeout=2.0):
+    """Send a single command to the running instance; returns its reply, or None if none is running"""
+    try:
+        connection = InstanceConnection(timeout)
+    except OSError:
+        return None
+    try:
+        return connection.request(command)
+    except (OSError, ValueError) as e:
+        # stderr: the native messaging host imports this module, and its stdout carries Chrome's protocol
+        print(f"Instance command '{command}' failed: {e}", file=sys.stderr)
+        return None
+    finally:
+        connection.close()
+
+
+if __name__ == "__main__":
+    reply = send_command(" ".join(sys.argv[1:]) or "status")
+    print(json.dumps(reply) if reply is not None else "No running instance")
+    sys.exit(0 if reply is not None else 1)
@@ -3,76 +3,133 @@ import json
 import struct
 import subprocess
 import os
-import psutil
 import time
 
-def is_app_running():
-    """Check if gemini_desktop_app.py is already running"""
-    try:
-        for proc in psutil.process_iter(['pid', 'name', 'cmdline']):
+# instance_control.py lives next to the desktop app, one directory up
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+import instance_control
+
+APP_PATH = os.getenv("GEMINI_APP_PATH", os.path.join(APP_DIR, "gemini_desktop_app.py"))
+APP_START_TIMEOUT = 30  # Seconds to wait for a freshly launched app to accept commands
+
+# Extension actions -> app commands
+ACTIONS = {
+    "trigger_assistant": "capture",
+    "toggle_ui": "toggle",
+    "show": "show",
+    "status": "status",
+}
+
+def log(message):
+    """Log to stderr; stdout carries the native messaging protocol"""
+    print(message, file=sys.stderr, flush=True)
+
+def read_message():
+    """Read one length-prefixed JSON message from Chrome; None once stdin closes"""
+    raw_length = sys.stdin.buffer.read(4)
+    if len(raw_length) < 4:
+        return None
+    message_length = struct.unpack('@I', raw_length)[0]
+    message = sys.stdin.buffer.read(message_length).decode('utf-8')
+    return json.loads(message)
+
+def send_message(response):
+    response_json = json.dumps(response).encode('utf-8')
+    sys.stdout.buffer.write(struct.pack('@I', len(response_json)))
+    sys.stdout.buffer.write(response_json)
+    sys.stdout.buffer.flush()
+
+class AppLink:
+    """Connection to the desktop app, launching it only when none is running"""
+
+    def __init__(self, app_path=APP_PATH):
+        self.app_path = app_path
+        self.process = None  # App we launched ourselves, tracked by handle
+        self.connection = None
+
+    def _connect(self):
+        if self.connection is None:
+            self.connection = instance_control.InstanceConnection()
+        return self.connection
+
+    def _disconnect(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def launching(self):
+        """True while an app we started is alive but not yet listening"""
+        return self.process is not None and self.process.poll() is None
+
+    def launch(self, command):
+        """Start the app; it runs command itself once its window is up"""
+        # The app must not inherit our stdout: that pipe carries the protocol to Chrome
+        self.process = subprocess.Popen([sys.executable, self.app_path] + command.split(" ", 1),
+                                        stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                                        creationflags=getattr(subprocess, "CREATE_NO_WINDOW", 0))
+        log(f"Launched {self.app_path} (PID {self.process.pid})")
+
+    def send(self, command):
+        """Forward command to the running app; returns (reply, launched)"""
+        for _ in range(2):
             try:
-                if proc.info['cmdline'] and any('gemini_desktop_app.py' in arg for arg in proc.info['cmdline']):
-                    print(f"Found existing process: PID {proc.info['pid']}")
-                    return True
-            except (psutil.NoSuchProcess, psutil.AccessDenied):
-                continue
-    except Exception as e:
-        print(f"Error checking processes: {e}")
-    return False
+                return self._connect().request(command), False
+            except OSError:
+                # App exited or restarted since the last message; reconnect once
+                self._disconnect()
 
-def kill_existing_app():
-    """Kill existing instances of the app"""
-    killed_count = 0
-    try:
-        for proc in psutil.process_iter(['pid', 'name', 'cmdline']):
+        if not self.launching():
+            self.launch(command)
+            return {"ok": True, "launched": True, "pid": self.process.pid}, True
+
+        # A previous message already launched the app; wait for it to listen
+        deadline = time.monotonic() + APP_START_TIMEOUT
+        while time.monotonic() < deadline and self.launching():
             try:
-                if proc.info['cmdline'] and any('gemini_desktop_app.py' in arg for arg in proc.info['cmdline']):
-                    print(f"Killing existing process: PID {proc.info['pid']}")
-                    proc.terminate()
-                    killed_count += 1
-            except (psutil.NoSuchProcess, psutil.AccessDenied):
-                continue
-    except Exception as e:
-        print(f"Error killing processes: {e}")
-    
-    if killed_count > 0:
-        time.sleep(1)  # Wait for processes to terminate
-    return killed_count
-
-# Read the message from Chrome
-raw_length = sys.stdin.buffer.read(4)
-if not raw_length:
-    sys.exit(0)
-
-message_length = struct.unpack('@I', raw_length)[0]
-message = sys.stdin.buffer.read(message_length).decode('utf-8')
-data = json.loads(message)
-
-if data.get("action") == "trigger_assistant":
-    app_path = r'C:\Users\R0ahu\OneDrive\Documents\Programming\Python\Chatbot\gemini_desktop_app.py'
-    
-    # Check if app is already running
-    if is_app_running():
-        print("App is already running. Killing existing instances...")
-        killed = kill_existing_app()
-        response_message = f"Restarted assistant (killed {killed} existing instances)"
+                return self._connect().request(command), False
+            except OSError:
+                self._disconnect()
+                time.sleep(0.05)
+        raise RuntimeError("Assistant did not start in time")
+
+    def close(self):
+        self._disconnect()
+
+def handle_message(link, data):
+    action = data.get("action")
+    if action == "ask":
+        command = f"ask {data.get('text', '')}"
+    elif action in ACTIONS:
+        command = ACTIONS[action]
     else:
-        response_message = "Assistant launched"
-    
-    # Launch the Python application
+        return {"status": "error", "message": f"Unknown action: {action}"}
+
     try:
-        subprocess.Popen([sys.executable, app_path], 
-                        creationflags=subprocess.CREATE_NO_WINDOW)
-        print(f"Launched: {app_path}")
-        
-        # Send response back to Chrome
-        response = {"status": "success", "message": response_message}
+        reply, launched = link.send(command)
     except Exception as e:
-        print(f"Error launching app: {e}")
-        response = {"status": "error", "message": f"Failed to launch: {e}"}
-    
-    response_json = json.dumps(response)
-    response_length = struct.pack('@I', len(response_json))
-    sys.stdout.buffer.write(response_length)
-    sys.stdout.buffer.write(response_json.encode('utf-8'))
-    sys.stdout.buffer.flush()
\ No newline at end of file
+        log(f"Error forwarding '{action}': {e}")
+        return {"status": "error", "message": f"Failed to reach assistant: {e}"}
+
+    if not reply.get("ok", False):
+        return {"status": "error", "message": reply.get("error", "Command failed"), "app": reply}
+    message = "Assistant launched" if launched else f"Forwarded '{command.split(' ', 1)[0]}' to assistant"
+    return {"status": "success", "message": message, "app": reply}
+
+def main():
+    link = AppLink()
+    try:
+        # Chrome keeps the host alive for as long as the extension holds its port open
+        while True:
+            data = read_message()
+            if data is None:
+                break
+            response = handle_message(link, data)
+            if "id" in data:
+                response["id"] = data["id"]
+            send_message(response)
+    finally:
+        link.close()
+
+if __name__ == "__main__":
+    main()